@@ -0,0 +1,396 @@
+"""
+Help developers pick attributes of tables, like distribution and sort keys, based on how tables are used,
+and pick compression encodings of columns, based on the data in the tables.
+
+The advice for distribution and sort keys is based on the query plans of the transformations:
+* Tables that are joined with a redistribution step (like DS_BCAST_INNER or DS_DIST_BOTH) should be
+  distributed on the column that they are joined on (or, if they are small, distributed to all nodes).
+* Columns that are used in filters of scans (or in joins) make good candidates for the sort key.
+
+The advice for compression encodings comes from running ANALYZE COMPRESSION on the loaded tables.
+Once all columns of a table have an encoding, loading the table no longer needs COMPUPDATE ON.
+
+The suggestions can be written into the table design files, from where they'll be picked up
+when the tables are created.
+
+See http://docs.aws.amazon.com/redshift/latest/dg/c_best-practices-best-dist-key.html
+and http://docs.aws.amazon.com/redshift/latest/dg/c_best-practices-sort-key.html
+and http://docs.aws.amazon.com/redshift/latest/dg/r_ANALYZE_COMPRESSION.html
+"""
+
+import logging
+import re
+from collections import Counter, OrderedDict
+from contextlib import closing
+from typing import Any, Dict, List, Optional, Tuple
+
+import simplejson as json
+import yaml
+
+import etl.db
+import etl.design.load
+import etl.explain
+from etl.design.bootstrap import make_item_sorter
+from etl.explain import PlanNode
+from etl.relation import RelationDescription
+from etl.text import format_lines
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# Tables with up to this many rows are distributed to all nodes when they are joined with redistribution.
+SMALL_TABLE_ROWS = 1000000
+
+_join_cond_re = re.compile(r'"(outer|inner)"\.(\w+)\s*=\s*"(outer|inner)"\.(\w+)')
+_filter_column_re = re.compile(r'\(?"?(\w+)"?\s*(?:=|<>|<=|>=|<|>|~~|\bIN\b)')
+
+
+class JoinUsage:
+    """
+    One use of a table's column in a join, with the estimated number of rows on that side of the join
+    and the distribution strategy of the join.
+    """
+
+    def __init__(self, transform: str, column: str, distribution: Optional[str], rows: int) -> None:
+        self.transform = transform
+        self.column = column
+        self.distribution = distribution
+        self.rows = rows
+
+    @property
+    def is_redistributed(self) -> bool:
+        return self.distribution in etl.explain.bad_distribution_styles
+
+
+def parse_join_columns(details: List[str]) -> List[Tuple[str, str]]:
+    """
+    Return pairs of columns (from the outer and from the inner side) that are joined on in the join condition.
+
+    >>> parse_join_columns(['Hash Cond: (("outer".user_id = "inner".id) AND ("inner".day = "outer".day))'])
+    [('user_id', 'id'), ('day', 'day')]
+    """
+    pairs = []
+    for line in details:
+        if "Cond:" not in line:
+            continue
+        for left_side, left_column, right_side, right_column in _join_cond_re.findall(line):
+            if left_side == "outer" and right_side == "inner":
+                pairs.append((left_column, right_column))
+            elif left_side == "inner" and right_side == "outer":
+                pairs.append((right_column, left_column))
+    return pairs
+
+
+def parse_filter_columns(details: List[str]) -> List[str]:
+    """
+    Return names of columns that are compared in filters.
+
+    >>> parse_filter_columns(["Filter: ((created_at >= '2017-01-01'::date) AND (status = 'open'::text))"])
+    ['created_at', 'status']
+    """
+    columns = []  # type: List[str]
+    for line in details:
+        if line.startswith("Filter:"):
+            columns.extend(column for column in _filter_column_re.findall(line[len("Filter:"):])
+                           if not column.isdigit())
+    return columns
+
+
+def find_scanned_tables(node: PlanNode) -> List[str]:
+    """
+    Return names of tables scanned in the subtree of the plan (skipping temporary tables).
+    """
+    return [descendant.relation_name for descendant in node.walk()
+            if "Scan" in descendant.operation and descendant.relation_name and
+            not descendant.relation_name.startswith("volt_tt_")]
+
+
+def fetch_table_info(conn, relations: List[RelationDescription]) -> Dict[str, Dict[str, Any]]:
+    """
+    Look up number of rows, size (in MB) and current distribution style of the tables in the data warehouse.
+    """
+    identifiers = frozenset(relation.identifier for relation in relations)
+    rows = etl.db.query(conn, """
+        SELECT "schema" || '.' || "table" AS identifier
+             , tbl_rows
+             , size
+             , diststyle
+             , sortkey1
+          FROM svv_table_info""")
+    table_info = {row["identifier"]: dict(row) for row in rows if row["identifier"] in identifiers}
+    logger.info("Found size information for %d table(s) in svv_table_info", len(table_info))
+    return table_info
+
+
+class KeyAdvisor:
+    """
+    Collect how tables are used in the query plans of transformations and suggest table attributes.
+    """
+
+    def __init__(self, relations: List[RelationDescription]) -> None:
+        self.relations = relations
+        self._lookup = {relation.identifier: relation for relation in relations}
+        self.joins = {}  # type: Dict[str, List[JoinUsage]]
+        self.filters = {}  # type: Dict[str, Counter]
+        self.table_info = {}  # type: Dict[str, Dict[str, Any]]
+
+    def _resolve_table(self, transform: RelationDescription, table_name: str,
+                       column: Optional[str]=None) -> Optional[RelationDescription]:
+        """
+        Find the relation that the transformation depends on with the given table name (and column if provided).
+        Query plans only show table names, not schemas, which we take from the dependencies of the transformation.
+        """
+        candidates = [self._lookup[dependency.identifier] for dependency in transform.dependencies
+                      if dependency.table == table_name and dependency.identifier in self._lookup]
+        if column is not None:
+            candidates = [candidate for candidate in candidates if column in candidate.unquoted_columns]
+        return candidates[0] if len(candidates) == 1 else None
+
+    def _resolve_column(self, transform: RelationDescription, node: PlanNode,
+                        column: str) -> Optional[RelationDescription]:
+        """
+        Find the table (scanned in the subtree of the node) that provides the column.
+        """
+        matches = []
+        for table_name in set(find_scanned_tables(node)):
+            relation = self._resolve_table(transform, table_name, column)
+            if relation is not None:
+                matches.append(relation)
+        return matches[0] if len(matches) == 1 else None
+
+    def add_plan(self, transform: RelationDescription, roots: List[PlanNode]) -> None:
+        """
+        Record joins and filters of tables from the query plan of a transformation.
+        """
+        for root in roots:
+            for node in root.walk():
+                if node.is_join and len(node.children) == 2:
+                    outer, inner = node.children
+                    for outer_column, inner_column in parse_join_columns(node.details):
+                        for side, column in ((outer, outer_column), (inner, inner_column)):
+                            relation = self._resolve_column(transform, side, column)
+                            if relation is not None:
+                                usage = JoinUsage(transform.identifier, column, node.distribution, side.rows)
+                                self.joins.setdefault(relation.identifier, []).append(usage)
+                elif "Scan" in node.operation and node.relation_name:
+                    relation = self._resolve_table(transform, node.relation_name)
+                    if relation is not None:
+                        columns = [column for column in parse_filter_columns(node.details)
+                                   if column in relation.unquoted_columns]
+                        self.filters.setdefault(relation.identifier, Counter()).update(columns)
+
+    def suggest(self, relation: RelationDescription) -> Optional[Dict[str, Any]]:
+        """
+        Return suggested attributes for the relation along with an estimate of the rows that are no longer
+        redistributed (only counting this relation's side of the joins), or None if there's nothing to suggest.
+        """
+        joins = self.joins.get(relation.identifier, [])
+        filters = self.filters.get(relation.identifier, Counter())
+        if not joins and not filters:
+            return None
+
+        # Weigh columns by how many rows are moved around when joining on them.
+        redistributed = Counter()  # type: Counter
+        for usage in joins:
+            if usage.is_redistributed:
+                redistributed[usage.column] += max(usage.rows, 1)
+        join_columns = Counter(usage.column for usage in joins)
+
+        attributes = OrderedDict()  # type: Dict[str, Any]
+        info = self.table_info.get(relation.identifier, {})
+        saved_rows = 0
+        if redistributed:
+            if info.get("tbl_rows") is not None and info["tbl_rows"] <= SMALL_TABLE_ROWS:
+                attributes["distribution"] = "all"
+                saved_rows = sum(redistributed.values())
+            else:
+                dist_column, saved_rows = redistributed.most_common(1)[0]
+                attributes["distribution"] = [dist_column]
+
+        # Filter columns (most commonly range restrictions) go first, then the column most often joined on.
+        sort_columns = [column for column, _ in filters.most_common(1)]
+        for column, _ in join_columns.most_common(1):
+            if column not in sort_columns:
+                sort_columns.append(column)
+        if sort_columns:
+            attributes["compound_sort"] = sort_columns
+
+        current = relation.table_design.get("attributes", {})
+        if all(current.get(key) == value for key, value in attributes.items()):
+            return None
+        return {
+            "attributes": attributes,
+            "joins": len(joins),
+            "redistributed_joins": sum(1 for usage in joins if usage.is_redistributed),
+            "saved_rows": saved_rows,
+            "total_redistributed_rows": sum(redistributed.values())
+        }
+
+
+def advise_keys(dsn: dict, relations: List[RelationDescription], selected: List[RelationDescription],
+                update_designs=False, dry_run=False) -> None:
+    """
+    Suggest distribution and sort keys for the selected tables based on the query plans of all transformations
+    that use them, and optionally write the suggestions into the (local) table design files.
+    """
+    tables = [relation for relation in selected if not (relation.is_view_relation or relation.is_external_relation)]
+    if not tables:
+        logger.info("No tables were selected")
+        return
+    transforms = [relation for relation in relations if relation.is_transformation]
+    if not transforms:
+        logger.info("No transformations found to collect query plans from")
+        return
+
+    advisor = KeyAdvisor(relations)
+    plans = etl.explain.fetch_plans(dsn, transforms)
+    for transform in transforms:
+        advisor.add_plan(transform, etl.explain.parse_plan(plans[transform.identifier]))
+    with closing(etl.db.connection(dsn, readonly=True)) as conn:
+        advisor.table_info = fetch_table_info(conn, relations)
+
+    rows = []
+    suggestions = OrderedDict()  # type: Dict[str, Dict[str, Any]]
+    for relation in tables:
+        suggestion = advisor.suggest(relation)
+        if suggestion is None:
+            continue
+        suggestions[relation.identifier] = suggestion
+        current = relation.table_design.get("attributes", {})
+        suggested = suggestion["attributes"]
+        rows.append([relation.identifier,
+                     json.dumps(current.get("distribution")), json.dumps(suggested.get("distribution")),
+                     json.dumps(current.get("compound_sort")), json.dumps(suggested.get("compound_sort")),
+                     "{redistributed_joins}/{joins}".format(**suggestion),
+                     "{saved_rows}/{total_redistributed_rows}".format(**suggestion)])
+    print(format_lines(rows, header_row=["relation", "distribution", "suggested", "compound sort", "suggested",
+                                         "redistributed joins", "rows no longer redistributed"]))
+
+    if update_designs:
+        for relation in tables:
+            if relation.identifier in suggestions:
+                update_table_design_attributes(relation, suggestions[relation.identifier]["attributes"],
+                                               dry_run=dry_run)
+
+
+def update_table_design_attributes(relation: RelationDescription, attributes: Dict[str, Any], dry_run=False) -> None:
+    """
+    Write the attributes into the (local) table design file of the relation.
+    """
+    filename = relation.design_file_name
+    with open(filename) as f:
+        table_design = yaml.safe_load(f)
+    new_attributes = dict(table_design.get("attributes", {}))
+    new_attributes.update(attributes)
+    if "compound_sort" in attributes:
+        new_attributes.pop("interleaved_sort", None)
+    table_design["attributes"] = new_attributes
+    # Validate before writing to make sure the table design is still usable.
+    etl.design.load.validate_table_design(table_design, relation.target_table_name)
+    if dry_run:
+        logger.info("Dry-run: Skipping update of attributes in '%s'", filename)
+        return
+    logger.info("Updating attributes of '%s' in '%s'", relation.identifier, filename)
+    with open(filename, 'w') as o:
+        json.dump(table_design, o, indent="    ", item_sort_key=make_item_sorter())
+        o.write('\n')
+
+
+def analyze_compression(conn, relation: RelationDescription) -> Dict[str, Tuple[str, float]]:
+    """
+    Return the suggested encoding and estimated reduction in size (in percent) for each column of the table.
+    """
+    rows = etl.db.query(conn, "ANALYZE COMPRESSION {}".format(relation))
+    # The result columns are "Table", "Column", "Encoding" and "Est_reduction_pct"
+    return {row[1]: (row[2], float(row[3])) for row in rows}
+
+
+def suggest_encodings(columns: List[Dict[str, Any]],
+                      analysis: Dict[str, Tuple[str, float]]) -> Dict[str, Tuple[Optional[str], str, float]]:
+    """
+    Return the current encoding, suggested encoding, and estimated reduction for columns with new encodings.
+    Skipped columns are not in the table and so have no suggestions.
+
+    >>> columns = [{"name": "id", "encoding": "raw"}, {"name": "name"}, {"name": "notes", "skipped": True}]
+    >>> analysis = {"id": ("raw", 0.0), "name": ("zstd", 47.5)}
+    >>> dict(suggest_encodings(columns, analysis))
+    {'name': (None, 'zstd', 47.5)}
+    """
+    suggestions = OrderedDict()  # type: Dict[str, Tuple[Optional[str], str, float]]
+    for column in columns:
+        if column.get("skipped") or column["name"] not in analysis:
+            continue
+        encoding, reduction = analysis[column["name"]]
+        if column.get("encoding") != encoding:
+            suggestions[column["name"]] = (column.get("encoding"), encoding, reduction)
+    return suggestions
+
+
+def advise_encodings(dsn: dict, selected: List[RelationDescription], update_designs=False, dry_run=False) -> None:
+    """
+    Suggest compression encodings for the columns of the selected tables based on ANALYZE COMPRESSION,
+    and optionally write the suggestions into the (local) table design files.
+
+    The estimated savings of a table assume that all columns take up about the same space.
+    """
+    tables = [relation for relation in selected
+              if not (relation.is_view_relation or relation.is_matview_relation or relation.is_external_relation)]
+    if not tables:
+        logger.info("No tables were selected")
+        return
+
+    # ANALYZE COMPRESSION needs to lock the table and so cannot run on a read-only connection.
+    with closing(etl.db.connection(dsn, autocommit=True)) as conn:
+        table_info = fetch_table_info(conn, tables)
+        analyses = OrderedDict()  # type: Dict[str, Dict[str, Tuple[str, float]]]
+        for relation in tables:
+            logger.info("Analyzing compression of columns in '%s'", relation.identifier)
+            analyses[relation.identifier] = analyze_compression(conn, relation)
+
+    rows = []
+    total_size = 0
+    total_savings = 0.0
+    suggestions = OrderedDict()  # type: Dict[str, Dict[str, str]]
+    for relation in tables:
+        analysis = analyses[relation.identifier]
+        if not analysis:
+            logger.warning("Found no data to analyze compression of '%s'", relation.identifier)
+            continue
+        columns = suggest_encodings(relation.table_design["columns"], analysis)
+        size = table_info.get(relation.identifier, {}).get("size") or 0
+        savings = size * sum(reduction for _, reduction in analysis.values()) / len(analysis) / 100.0
+        total_size += size
+        total_savings += savings
+        if columns:
+            suggestions[relation.identifier] = {name: encoding for name, (_, encoding, _) in columns.items()}
+        for name, (current, encoding, reduction) in columns.items():
+            rows.append([relation.identifier, name, current or "(none)", encoding, "{:.2f}".format(reduction)])
+        logger.info("Estimated savings for '%s': %.0fMB of %dMB", relation.identifier, savings, size)
+    print(format_lines(rows, header_row=["relation", "column", "encoding", "suggested", "est. reduction (%)"]))
+    logger.info("Estimated savings for %d table(s): %.0fMB of %dMB", len(analyses), total_savings, total_size)
+
+    if update_designs:
+        for relation in tables:
+            if relation.identifier in suggestions:
+                update_table_design_encodings(relation, suggestions[relation.identifier], dry_run=dry_run)
+
+
+def update_table_design_encodings(relation: RelationDescription, encodings: Dict[str, str], dry_run=False) -> None:
+    """
+    Write the encodings into the columns in the (local) table design file of the relation.
+    """
+    filename = relation.design_file_name
+    with open(filename) as f:
+        table_design = yaml.safe_load(f)
+    for column in table_design["columns"]:
+        if column["name"] in encodings:
+            column["encoding"] = encodings[column["name"]]
+    # Validate before writing to make sure the table design is still usable.
+    etl.design.load.validate_table_design(table_design, relation.target_table_name)
+    if dry_run:
+        logger.info("Dry-run: Skipping update of encodings in '%s'", filename)
+        return
+    logger.info("Updating encodings of %d column(s) of '%s' in '%s'", len(encodings), relation.identifier, filename)
+    with open(filename, 'w') as o:
+        json.dump(table_design, o, indent="    ", item_sort_key=make_item_sorter())
+        o.write('\n')
@@ -19,6 +19,7 @@ from typing import List, Optional
 import boto3
 import simplejson as json
 
+import etl.advise
 import etl.config
 import etl.config.env
 import etl.design.bootstrap
@@ -92,6 +93,8 @@ def execute_or_bail():
         croak(exc, 5)
     else:
         logger.info("Ran for %.2fs and finished successfully!", timer.elapsed)
+    finally:
+        etl.db.close_connection_managers()
 
 
 def run_arg_as_command(my_name="arthur.py"):
@@ -266,7 +269,7 @@ def build_full_parser(prog_name):
             InitializeSetupCommand, CreateUserCommand, UpdateUserCommand,
             # Commands to help with table designs and uploading them
             BootstrapSourcesCommand, BootstrapTransformationsCommand, ValidateDesignsCommand, ExplainQueryCommand,
-            SyncWithS3Command,
+            AdviseKeysCommand, AdviseEncodingsCommand, SyncWithS3Command,
             # ETL commands to extract, load (or update), or transform
             ExtractToS3Command, LoadDataWarehouseCommand, UpgradeDataWarehouseCommand, UpdateDataWarehouseCommand,
             UnloadDataToS3Command,
@@ -310,10 +313,19 @@ def add_standard_arguments(parser, options):
         parser.add_argument("-x", "--max-concurrency", metavar="N", type=int,
                             help="set max number of parallel loads to N "
                                  "(overrides 'resources.RedshiftCluster.max_concurrency')")
+    if "min-concurrency" in options:
+        parser.add_argument("--min-concurrency", metavar="N", type=int,
+                            help="allow reducing the number of parallel loads down to N while WLM queues are backed up"
+                                 " (overrides 'resources.RedshiftCluster.min_concurrency', default: no adjustments)")
     if "wlm-query-slots" in options:
         parser.add_argument("-w", "--wlm-query-slots", metavar="N", type=int,
                             help="set the number of Redshift WLM query slots used for transformations"
                                  "(overrides 'resources.RedshiftCluster.wlm_query_slots')")
+    if "fail-fast" in options:
+        parser.add_argument("--fail-fast",
+                            help="abort loading source tables as soon as a required relation fails"
+                                 " (cancels queued loads and queries in flight)",
+                            default=False, action="store_true")
     if "skip-copy" in options:
         parser.add_argument("-y", "--skip-copy",
                             help="skip the COPY and INSERT commands (leaves tables empty, for debugging)",
@@ -646,7 +658,8 @@ class LoadDataWarehouseCommand(MonitoredSubCommand):
 
     def add_arguments(self, parser):
         add_standard_arguments(parser,
-                               ["pattern", "prefix", "max-concurrency", "wlm-query-slots", "skip-copy", "dry-run"])
+                               ["pattern", "prefix", "max-concurrency", "min-concurrency", "wlm-query-slots",
+                                "fail-fast", "skip-copy", "dry-run"])
         parser.add_argument("--concurrent-extract",
                             help="watch DynamoDB for extract step completion and load source tables as extracts finish"
                                  " assuming another Arthur in this prefix is running extract (default: %(default)s)",
@@ -661,6 +674,8 @@ class LoadDataWarehouseCommand(MonitoredSubCommand):
             args.pattern.selected_schemas()
         except ValueError as exc:
             raise InvalidArgumentError(exc) from exc
+        if args.fail_fast and args.concurrent_extract:
+            raise InvalidArgumentError("cannot fail fast when loading during extract")
 
         relations = self.find_relation_descriptions(args, default_scheme="s3",
                                                     required_relation_selector=config.required_in_full_load_selector,
@@ -668,12 +683,16 @@ class LoadDataWarehouseCommand(MonitoredSubCommand):
         etl.monitor.Monitor.marker_payload("load").emit(dry_run=args.dry_run)
         max_concurrency = (args.max_concurrency or
                            etl.config.get_config_int("resources.RedshiftCluster.max_concurrency", 1))
+        min_concurrency = (args.min_concurrency or
+                           etl.config.get_config_int("resources.RedshiftCluster.min_concurrency", max_concurrency))
         wlm_query_slots = (args.wlm_query_slots or
                            etl.config.get_config_int("resources.RedshiftCluster.wlm_query_slots", 1))
         etl.load.load_data_warehouse(relations, args.pattern,
                                      max_concurrency=max_concurrency,
+                                     min_concurrency=min_concurrency,
                                      wlm_query_slots=wlm_query_slots,
                                      concurrent_extract=args.concurrent_extract,
+                                     fail_fast=args.fail_fast,
                                      skip_copy=args.skip_copy,
                                      use_staging=args.use_staging_schemas,
                                      dry_run=args.dry_run)
@@ -690,8 +709,8 @@ class UpgradeDataWarehouseCommand(MonitoredSubCommand):
 
     def add_arguments(self, parser):
         add_standard_arguments(parser,
-                               ["pattern", "prefix", "max-concurrency", "wlm-query-slots",
-                                "continue-from", "skip-copy", "dry-run"])
+                               ["pattern", "prefix", "max-concurrency", "min-concurrency", "wlm-query-slots",
+                                "fail-fast", "continue-from", "skip-copy", "dry-run"])
         parser.add_argument("--only-selected",
                             help="skip rebuilding relations that depend on the selected ones"
                                  " (leaves warehouse in inconsistent state, for debugging only)",
@@ -700,23 +719,34 @@ class UpgradeDataWarehouseCommand(MonitoredSubCommand):
                             help="do all the work in hidden schemas and publish to standard names on completion"
                                  " (default: do not use staging schemas, note this is the opposite of load command)",
                             default=False, action="store_true", dest='use_staging_schemas')
+        parser.add_argument("--evolve-tables",
+                            help="alter selected tables in place where their designs only add columns or widen"
+                                 " VARCHAR columns (and only backfill new columns) instead of re-creating them",
+                            default=False, action="store_true")
 
     def callback(self, args, config):
+        if args.evolve_tables and args.use_staging_schemas:
+            raise InvalidArgumentError("cannot evolve tables when using staging schemas")
         relations = self.find_relation_descriptions(args, default_scheme="s3",
                                                     required_relation_selector=config.required_in_full_load_selector,
                                                     return_all=True)
         etl.monitor.Monitor.marker_payload("upgrade").emit(dry_run=args.dry_run)
         max_concurrency = (args.max_concurrency or
                            etl.config.get_config_int("resources.RedshiftCluster.max_concurrency", 1))
+        min_concurrency = (args.min_concurrency or
+                           etl.config.get_config_int("resources.RedshiftCluster.min_concurrency", max_concurrency))
         wlm_query_slots = (args.wlm_query_slots or
                            etl.config.get_config_int("resources.RedshiftCluster.wlm_query_slots", 1))
         etl.load.upgrade_data_warehouse(relations, args.pattern,
                                         max_concurrency=max_concurrency,
+                                        min_concurrency=min_concurrency,
                                         wlm_query_slots=wlm_query_slots,
                                         only_selected=args.only_selected,
                                         continue_from=args.continue_from,
                                         use_staging=args.use_staging_schemas,
                                         skip_copy=args.skip_copy,
+                                        evolve_tables=args.evolve_tables,
+                                        fail_fast=args.fail_fast,
                                         dry_run=args.dry_run)
 
 
@@ -845,13 +875,16 @@ class ValidateDesignsCommand(SubCommand):
         parser.add_argument("-n", "--skip-dependencies-check",
                             help="skip check of dependencies in designs against data warehouse",
                             default=False, action="store_true")
+        parser.add_argument("--full", help="validate all selected relations, even those that passed before"
+                                           " and did not change since",
+                            default=False, action="store_true")
 
     def callback(self, args, config):
         # NB This does not pick up all designs to speed things up but that may lead to false positives.
         descriptions = self.find_relation_descriptions(args)
         etl.validate.validate_designs(config, descriptions, keep_going=args.keep_going,
                                       skip_sources=args.skip_sources_check,
-                                      skip_dependencies=args.skip_dependencies_check)
+                                      skip_dependencies=args.skip_dependencies_check, full=args.full)
 
 
 class ExplainQueryCommand(SubCommand):
@@ -859,10 +892,14 @@ class ExplainQueryCommand(SubCommand):
     def __init__(self):
         super().__init__("explain",
                          "collect explain plans",
-                         "Run EXPLAIN on queries (for CTAS or VIEW), check query plan for distributions.")
+                         "Run EXPLAIN on queries (for CTAS, VIEW, or MATVIEW), check query plan for distributions.")
 
     def add_arguments(self, parser):
         add_standard_arguments(parser, ["pattern", "prefix", "scheme"])
+        parser.add_argument("--baseline", metavar="FILE", dest="baseline_file",
+                            help="write summaries of query plans into this baseline file")
+        parser.add_argument("--compare", metavar="FILE", dest="compare_file",
+                            help="compare query plans against this baseline file and flag any that got worse")
 
     def callback(self, args, config):
         if args.scheme == "file":
@@ -874,7 +911,54 @@ class ExplainQueryCommand(SubCommand):
             # When running with S3, we expect full sets of files (SQL plus table design)
             descriptions = self.find_relation_descriptions(args)
         with etl.db.log_error():
-            etl.explain.explain_queries(config.dsn_etl, descriptions)
+            etl.explain.explain_queries(config.dsn_etl, descriptions, baseline_file=args.baseline_file,
+                                        compare_file=args.compare_file)
+
+
+class AdviseKeysCommand(SubCommand):
+
+    def __init__(self):
+        super().__init__("advise_keys",
+                         "suggest distribution and sort keys",
+                         "Suggest distribution and sort keys for selected tables based on query plans of all"
+                         " transformations (and sizes of tables in the data warehouse).")
+
+    def add_arguments(self, parser):
+        add_standard_arguments(parser, ["pattern", "prefix", "scheme", "dry-run"])
+        parser.add_argument("-u", "--update-designs", help="write suggested attributes into local table design files",
+                            default=False, action="store_true")
+
+    def callback(self, args, config):
+        if args.update_designs and args.scheme != "file":
+            raise InvalidArgumentError("can only update local table design files")
+        relations = self.find_relation_descriptions(args, return_all=True)
+        selected = [relation for relation in relations if args.pattern.match(relation.target_table_name)]
+        with etl.db.log_error():
+            etl.advise.advise_keys(config.dsn_etl, relations, selected, update_designs=args.update_designs,
+                                   dry_run=args.dry_run)
+
+
+class AdviseEncodingsCommand(SubCommand):
+
+    def __init__(self):
+        super().__init__("advise_encodings",
+                         "suggest compression encodings of columns",
+                         "Suggest compression encodings for columns of selected tables based on the data in the"
+                         " data warehouse (using ANALYZE COMPRESSION) and estimate the savings in storage."
+                         " Tables with encodings for all columns are loaded without COMPUPDATE.")
+
+    def add_arguments(self, parser):
+        add_standard_arguments(parser, ["pattern", "prefix", "scheme", "dry-run"])
+        parser.add_argument("-u", "--update-designs", help="write suggested encodings into local table design files",
+                            default=False, action="store_true")
+
+    def callback(self, args, config):
+        if args.update_designs and args.scheme != "file":
+            raise InvalidArgumentError("can only update local table design files")
+        relations = self.find_relation_descriptions(args)
+        with etl.db.log_error():
+            etl.advise.advise_encodings(config.dsn_etl, relations, update_designs=args.update_designs,
+                                        dry_run=args.dry_run)
 
 
 class ListFilesCommand(SubCommand):
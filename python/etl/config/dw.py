@@ -5,7 +5,7 @@ Objects to deal with configuration of our data warehouse, like
 * its users
 """
 
-from typing import Dict
+from typing import Dict, FrozenSet
 
 import etl.config.env
 import etl.names
@@ -36,6 +36,8 @@ class DataWarehouseSchema:
     that the ETL will create a manifest file suitable for the COPY command.  No DSN
     is needed here.
     (2.5) Target in S3 for "unload" command, which may also be an upstream source.
+    (2.75) Upstream source backed by files in S3 which are not loaded but registered as external tables
+    in an external schema (for Redshift Spectrum).
     (3) Schemas with CTAS or VIEWs that are computed during the ETL.  Data cannot be extracted here
     (but maybe unload'ed).
     (4) Schemas reserved for users (where user could be a BI tool)
@@ -72,6 +74,15 @@ class DataWarehouseSchema:
         # When dealing with this schema of some upstream source, which tables should be used? skipped?
         self.include_tables = schema_info.get("include_tables", [self.name + ".*"])
         self.exclude_tables = schema_info.get("exclude_tables", [])
+        # Database sources may opt into a columnar format for extracted data, everything else uses CSV files.
+        self.extract_format = schema_info.get("extract_format", "csv")
+        # Constraints of tables from trusted sources are not checked after loading (but row counts still are).
+        self.verify_constraints = schema_info.get("verify_constraints", True)
+        # Views in this schema are created without schema binding (unless overridden in their table design).
+        self.late_binding_views = schema_info.get("late_binding_views", False)
+        # Static sources may be registered as external (Spectrum) tables in this database of the data catalog.
+        self.spectrum_database = schema_info.get("spectrum_database")
+        self.is_external = self.is_static_source and self.spectrum_database is not None
 
     @property
     def s3_bucket(self) -> str:
@@ -206,3 +217,7 @@ class DataWarehouseConfig:
 
     def schema_lookup(self, schema_name) -> DataWarehouseSchema:
         return self._schema_lookup[schema_name]
+
+    @property
+    def external_schema_names(self) -> FrozenSet[str]:
+        return frozenset(schema.name for schema in self.schemas if schema.is_external)
@@ -36,19 +36,28 @@ def create_schemas(schemas: List[DataWarehouseSchema], use_staging=False, dry_ru
     It's ok if any of the schemas already exist (in which case the owner and privileges are updated).
     """
     dsn_etl = etl.config.get_dw_config().dsn_etl
-    with closing(etl.db.connection(dsn_etl, autocommit=True, readonly=dry_run)) as conn:
+    with etl.db.connection_manager(dsn_etl).connection(autocommit=True, readonly=dry_run) as conn:
         for schema in schemas:
             create_schema_and_grant_access(conn, schema, use_staging=use_staging, dry_run=dry_run)
 
 
 def create_schema_and_grant_access(conn, schema, owner=None, use_staging=False, dry_run=False) -> None:
+    """
+    Create the schema (in staging position if so requested) and grant access to it.
+    External schemas are never staged (or backed up), they are always created in their standard position.
+    """
     group_names = join_with_quotes(schema.groups)
+    use_staging = use_staging and not schema.is_external
     name = schema.staging_name if use_staging else schema.name
     if dry_run:
         logger.info("Dry-run: Skipping creating schema '%s' and granting access to '%s'", name, group_names)
     else:
         logger.info("Creating schema '%s'", name)
-        etl.db.create_schema(conn, name, owner)
+        if schema.is_external:
+            aws_iam_role = str(etl.config.get_config_value("object_store.iam_role"))
+            etl.db.create_external_schema(conn, name, schema.spectrum_database, aws_iam_role, owner)
+        else:
+            etl.db.create_schema(conn, name, owner)
         etl.db.grant_all_on_schema_to_user(conn, name, schema.owner)
         if use_staging:
             # Don't grant usage on staging schemas to readers/writers
@@ -64,12 +73,14 @@ def _promote_schemas(schemas: List[DataWarehouseSchema], from_where: str, dry_ru
     Promote (staging or backup) schemas into their standard names and permissions
     Changes schema.from_name_attr -> schema.name; expects from_name_attr to be 'backup_name' or 'staging_name'
     """
+    # External schemas are neither staged nor backed up.
+    schemas = [schema for schema in schemas if not schema.is_external]
     attr_name = from_where + "_name"
     from_names = [getattr(schema, attr_name) for schema in schemas]
     from_name_schema_lookup = dict(zip(from_names, schemas))
 
     dsn_etl = etl.config.get_dw_config().dsn_etl
-    with closing(etl.db.connection(dsn_etl, autocommit=True, readonly=dry_run)) as conn:
+    with etl.db.connection_manager(dsn_etl).connection(autocommit=True, readonly=dry_run) as conn:
         need_promotion = etl.db.select_schemas(conn, from_names)
         if not need_promotion:
             logger.info("Found no %s schemas to promote", from_where)
@@ -97,8 +108,10 @@ def backup_schemas(schemas: List[DataWarehouseSchema], dry_run=False) -> None:
     For existing schemas, rename them and drop access.
     Once the access is revoked, the backup schemas "disappear" from BI tools.
     """
+    # External schemas are neither staged nor backed up.
+    schemas = [schema for schema in schemas if not schema.is_external]
     dsn_etl = etl.config.get_dw_config().dsn_etl
-    with closing(etl.db.connection(dsn_etl, autocommit=True, readonly=dry_run)) as conn:
+    with etl.db.connection_manager(dsn_etl).connection(autocommit=True, readonly=dry_run) as conn:
         names = [schema.name for schema in schemas]
         found = etl.db.select_schemas(conn, names)
         need_backup = [schema for schema in schemas if schema.name in found]
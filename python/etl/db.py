@@ -16,6 +16,7 @@ import os
 import os.path
 import re
 import textwrap
+import threading
 from contextlib import closing, contextmanager
 from typing import Dict, List, Optional
 
@@ -111,6 +112,152 @@ def connection_pool(max_conn, dsn_dict: Dict[str, str], application_name=psycopg
     return psycopg2.pool.ThreadedConnectionPool(1, max_conn, **dsn_values)
 
 
+# Settings for TCP keepalives of managed connections so that idle connections (e.g. while waiting on a long
+# COPY in another thread) are not dropped silently by NAT gateways or load balancers
+KEEPALIVE_SETTINGS = {"keepalives": 1, "keepalives_idle": 60, "keepalives_interval": 15, "keepalives_count": 4}
+
+
+class ConnectionManager:
+    """
+    Hand out connections to one database which are kept open (and alive) across all phases of a command.
+
+    Connections are validated when they are checked out, which is also when their session is tagged
+    with an application name and (optionally) a query group.  Broken connections are replaced transparently.
+    Note that re-using connections also avoids repeating the SSL handshakes (libpq cannot resume SSL sessions).
+
+    The manager keeps statistics about how long callers waited for a connection, how long it took to
+    set up new connections, and how many connections had to be reset.
+    """
+
+    def __init__(self, dsn_dict: Dict[str, str], application_name=psycopg2.__name__,
+                 max_connections: Optional[int]=None) -> None:
+        self._dsn_values = dict(_dsn_connection_values(dsn_dict, application_name), **KEEPALIVE_SETTINGS)
+        self.application_name = application_name
+        self.max_connections = max_connections
+        self._idle = []  # type: List[psycopg2.extensions.connection]
+        self._in_use = 0
+        self._condition = threading.Condition()
+        self.stats = {"checkouts": 0, "wait_time": 0.0, "connects": 0, "setup_time": 0.0, "resets": 0}
+
+    def _connect(self):
+        logger.info("Connecting to: %s", unparse_connection(self._dsn_values))
+        with Timer() as timer:
+            cx = psycopg2.connect(**self._dsn_values)
+        logger.debug("Connected successfully (backend pid: %d, server version: %s, is_superuser: %s) (%s)",
+                     cx.get_backend_pid(), cx.server_version, cx.get_parameter_status("is_superuser"), timer)
+        with self._condition:
+            self.stats["connects"] += 1
+            self.stats["setup_time"] += timer.elapsed
+        return cx
+
+    def _prepare_session(self, cx, autocommit: bool, readonly: bool, application_name: Optional[str],
+                         query_group: Optional[str]) -> None:
+        """
+        Reset and tag the session (which also tests the connection) and set the transaction characteristics.
+        """
+        cx.set_session(autocommit=True, readonly=False)
+        stmt = "RESET ALL; SET application_name TO %s"
+        args = [application_name or self.application_name]
+        if query_group is not None:
+            stmt += "; SET query_group TO %s"
+            args.append(query_group)
+        execute(cx, stmt, args)
+        cx.set_session(autocommit=autocommit, readonly=readonly)
+
+    def checkout(self, autocommit=False, readonly=False, application_name: Optional[str]=None,
+                 query_group: Optional[str]=None):
+        with Timer() as timer, self._condition:
+            while self.max_connections is not None and self._in_use >= self.max_connections:
+                self._condition.wait()
+            self._in_use += 1
+            cx = self._idle.pop() if self._idle else None
+            self.stats["checkouts"] += 1
+            self.stats["wait_time"] += timer.elapsed
+        try:
+            if cx is not None:
+                try:
+                    self._prepare_session(cx, autocommit, readonly, application_name, query_group)
+                    return cx
+                except (psycopg2.InterfaceError, psycopg2.OperationalError) as exc:
+                    logger.warning("Resetting connection which failed validation: %s", str(exc).strip())
+                    with self._condition:
+                        self.stats["resets"] += 1
+                    if not cx.closed:
+                        cx.close()
+            cx = self._connect()
+            self._prepare_session(cx, autocommit, readonly, application_name, query_group)
+            return cx
+        except Exception:
+            with self._condition:
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+
+    def checkin(self, cx) -> None:
+        """
+        Return the connection for re-use unless it is broken. Open transactions are rolled back.
+        """
+        if not cx.closed:
+            try:
+                if cx.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    cx.rollback()
+            except psycopg2.Error:
+                cx.close()
+        with self._condition:
+            if not cx.closed:
+                self._idle.append(cx)
+            self._in_use -= 1
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self, autocommit=False, readonly=False, application_name: Optional[str]=None,
+                   query_group: Optional[str]=None):
+        """
+        Check out a connection for the duration of the context (and return it afterwards).
+        """
+        cx = self.checkout(autocommit=autocommit, readonly=readonly, application_name=application_name,
+                           query_group=query_group)
+        try:
+            yield cx
+        finally:
+            self.checkin(cx)
+
+    def close_all(self) -> None:
+        with self._condition:
+            idle, self._idle = self._idle, []
+        for cx in idle:
+            cx.close()
+        logger.info("Connection statistics for %s: %d checkout(s) (waited %.2fs), %d connection(s) opened"
+                    " (setup %.2fs), %d reset(s)", unparse_connection(self._dsn_values), self.stats["checkouts"],
+                    self.stats["wait_time"], self.stats["connects"], self.stats["setup_time"], self.stats["resets"])
+
+
+_connection_managers = {}  # type: Dict[tuple, ConnectionManager]
+_connection_managers_lock = threading.Lock()
+
+
+def connection_manager(dsn_dict: Dict[str, str]) -> ConnectionManager:
+    """
+    Return the (process-wide) connection manager for the database described by the connection values.
+    """
+    key = tuple(sorted(dsn_dict.items()))
+    with _connection_managers_lock:
+        if key not in _connection_managers:
+            _connection_managers[key] = ConnectionManager(dsn_dict)
+        return _connection_managers[key]
+
+
+def close_connection_managers() -> None:
+    """
+    Close all idle connections of all connection managers (and log their statistics).
+    """
+    with _connection_managers_lock:
+        managers = list(_connection_managers.values())
+        _connection_managers.clear()
+    for manager in managers:
+        manager.close_all()
+
+
 def extract_dsn(dsn_dict: Dict[str, str], read_only=False):
     """
     Break the connection string into a JDBC URL and connection properties.
@@ -422,6 +569,52 @@ def create_schema(cx, schema, owner=None):
         execute(cx, """ALTER SCHEMA "{}" OWNER TO "{}" """.format(schema, owner))
 
 
+def create_external_schema(cx, schema, database, aws_iam_role, owner=None):
+    execute(cx, """CREATE EXTERNAL SCHEMA IF NOT EXISTS "{}" FROM DATA CATALOG DATABASE %s IAM_ROLE %s
+                   CREATE EXTERNAL DATABASE IF NOT EXISTS""".format(schema), (database, aws_iam_role))
+    if owner:
+        execute(cx, """ALTER SCHEMA "{}" OWNER TO "{}" """.format(schema, owner))
+
+
+def select_late_binding_views(cx, schemas) -> List[str]:
+    """
+    Return identifiers ("schema.view") of views in the given schemas which were created without schema binding.
+    """
+    rows = query(cx, """
+        SELECT schemaname || '.' || viewname AS identifier
+          FROM pg_catalog.pg_views
+         WHERE schemaname IN %s
+           AND definition ILIKE '%%with no schema binding%%'
+        """, (tuple(schemas),))
+    return [row["identifier"] for row in rows]
+
+
+def select_dependent_views(cx, schema, table) -> List[str]:
+    """
+    Return identifiers ("schema.view") of views which depend on the given table.
+
+    Late-binding views do not record their dependencies and so are never returned here.
+    """
+    rows = query(cx, """
+        SELECT DISTINCT view_ns.nspname || '.' || view_cls.relname AS identifier
+          FROM pg_catalog.pg_class AS cls
+          JOIN pg_catalog.pg_namespace AS ns ON cls.relnamespace = ns.oid
+          JOIN pg_catalog.pg_depend AS dep ON cls.oid = dep.refobjid
+          JOIN pg_catalog.pg_rewrite AS rw ON dep.objid = rw.oid
+          JOIN pg_catalog.pg_class AS view_cls ON rw.ev_class = view_cls.oid AND cls.oid <> view_cls.oid
+          JOIN pg_catalog.pg_namespace AS view_ns ON view_cls.relnamespace = view_ns.oid
+         WHERE ns.nspname = %s
+           AND cls.relname = %s
+         ORDER BY identifier
+        """, (schema, table))
+    return [row["identifier"] for row in rows]
+
+
+def external_table_exists(cx, schema, table) -> bool:
+    rows = query(cx, "SELECT 1 FROM svv_external_tables WHERE schemaname = %s AND tablename = %s", (schema, table))
+    return len(rows) > 0
+
+
 def grant_usage(cx, schema, group):
     execute(cx, """GRANT USAGE ON SCHEMA "{}" TO GROUP "{}" """.format(schema, group))
 
@@ -460,7 +653,7 @@ def revoke_select_and_write_on_all_tables_in_schema(cx, schema, group):
 
 def relation_kind(cx, schema, table) -> Optional[str]:
     """
-    Return "kind" of relation, either 'TABLE' or 'VIEW' for relations that actually exist.
+    Return "kind" of relation, either 'TABLE', 'VIEW', or 'MATERIALIZED VIEW' for relations that actually exist.
     If the relation doesn't exist, None is returned.
     """
     rows = query(cx, """
@@ -474,10 +667,14 @@ def relation_kind(cx, schema, table) -> Optional[str]:
            AND cls.relname = %s
            AND cls.relkind IN ('r', 'v')
         """, (schema, table))
-    if rows:
-        return rows[0][0]
-    else:
+    if not rows:
         return None
+    if rows[0][0] == 'VIEW':
+        # Materialized views show up as views in the catalog.
+        matviews = query(cx, "SELECT 1 FROM stv_mv_info WHERE schema = %s AND name = %s", (schema, table))
+        if matviews:
+            return 'MATERIALIZED VIEW'
+    return rows[0][0]
 
 
 def grant_select(cx, schema, table, group):
@@ -3,7 +3,7 @@ import os.path
 import re
 from contextlib import closing
 from datetime import datetime
-from typing import List, Mapping, Union
+from typing import Dict, List, Mapping, Union
 
 import simplejson as json
 from psycopg2.extensions import connection  # only for type annotation
@@ -141,6 +141,111 @@ def fetch_constraints(cx: connection, table_name: TableName) -> List[Mapping[str
     return found
 
 
+class CatalogSnapshot:
+    """
+    Attributes and constraints of a set of tables, looked up with a few queries for all tables
+    (instead of a few queries per table as with fetch_attributes and fetch_constraints).
+    """
+
+    def __init__(self, attributes: Dict[TableName, List[Attribute]],
+                 constraints: Dict[TableName, List[Mapping[str, List[str]]]]) -> None:
+        self._attributes = attributes
+        self._constraints = constraints
+
+    def attributes(self, table_name: TableName) -> List[Attribute]:
+        return self._attributes.get(table_name, [])
+
+    def constraints(self, table_name: TableName) -> List[Mapping[str, List[str]]]:
+        return self._constraints.get(table_name, [])
+
+
+def fetch_catalog_snapshot(cx: connection, table_names: List[TableName]) -> CatalogSnapshot:
+    """
+    Retrieve table definitions and constraints (see fetch_attributes and fetch_constraints) of all the tables at once.
+    """
+    wanted = frozenset(table_names)
+    if not wanted:
+        return CatalogSnapshot({}, {})
+    schemas = tuple(sorted({table_name.schema for table_name in wanted}))
+    tables = tuple(sorted({table_name.table for table_name in wanted}))
+
+    stmt_attributes = """
+        SELECT ns.nspname AS "schema_name"
+             , cls.relname AS "table_name"
+             , a.attname AS "name"
+             , pg_catalog.format_type(t.oid, a.atttypmod) AS "sql_type"
+             , a.attnotnull AS "not_null"
+          FROM pg_catalog.pg_attribute AS a
+          JOIN pg_catalog.pg_class AS cls ON a.attrelid = cls.oid
+          JOIN pg_catalog.pg_namespace AS ns ON cls.relnamespace = ns.oid
+          JOIN pg_catalog.pg_type AS t ON a.atttypid = t.oid
+         WHERE a.attnum > 0  -- skip system columns
+           AND NOT a.attisdropped
+           AND ns.nspname IN %s
+           AND cls.relname IN %s
+         ORDER BY ns.nspname, cls.relname, a.attnum"""
+    attributes = {}  # type: Dict[TableName, List[Attribute]]
+    for row in etl.db.query(cx, stmt_attributes, (schemas, tables)):
+        table_name = TableName(row["schema_name"], row["table_name"])
+        if table_name in wanted:
+            attributes.setdefault(table_name, []).append(
+                Attribute(name=row["name"], sql_type=row["sql_type"], not_null=row["not_null"]))
+
+    # See fetch_constraints for why we need a separate trip to the database to look up attributes of indices.
+    stmt_index = """
+        SELECT ns.nspname AS "schema_name"
+             , cls.relname AS "table_name"
+             , i.indexrelid AS index_id
+             , ic.relname AS index_name
+             , CASE
+                   WHEN i.indisprimary THEN 'primary_key'
+                   ELSE 'unique'
+               END AS "constraint_type"
+             , i.indnatts AS nr_atts
+          FROM pg_catalog.pg_class AS cls
+          JOIN pg_catalog.pg_namespace AS ns ON cls.relnamespace = ns.oid
+          JOIN pg_catalog.pg_index AS i ON cls.oid = i.indrelid
+          JOIN pg_catalog.pg_class AS ic ON i.indexrelid = ic.oid
+         WHERE i.indisunique
+           AND i.indpred IS NULL
+           AND i.indexprs IS NULL
+           AND ns.nspname IN %s
+           AND cls.relname IN %s
+         ORDER BY ns.nspname, cls.relname, "constraint_type", ic.relname"""
+    indices = [row for row in etl.db.query(cx, stmt_index, (schemas, tables))
+               if TableName(row["schema_name"], row["table_name"]) in wanted]
+
+    constraints = {}  # type: Dict[TableName, List[Mapping[str, List[str]]]]
+    if indices:
+        # Positions past the number of attributes of an index are NULL and so do not match any attribute.
+        max_nr_atts = max(row["nr_atts"] for row in indices)
+        cond = ' OR '.join("a.attnum = i.indkey[%d]" % i for i in range(max_nr_atts))
+        stmt_att = """
+            SELECT i.indexrelid AS index_id
+                 , a.attname AS "name"
+              FROM pg_catalog.pg_attribute AS a
+              JOIN pg_catalog.pg_index AS i ON a.attrelid = i.indrelid
+             WHERE i.indexrelid IN %s
+               AND ({cond})
+             ORDER BY i.indexrelid, a.attname"""
+        index_ids = tuple(row["index_id"] for row in indices)
+        columns_by_index = {}  # type: Dict[int, List[str]]
+        for row in etl.db.query(cx, stmt_att.format(cond=cond), (index_ids,)):
+            columns_by_index.setdefault(row["index_id"], []).append(row["name"])
+        for row in indices:
+            columns = columns_by_index.get(row["index_id"])
+            if columns:
+                table_name = TableName(row["schema_name"], row["table_name"])
+                constraint = {row["constraint_type"]: columns}  # type: Mapping[str, List[str]]
+                logger.info("Index '%s' of '%s' adds constraint %s",
+                            row["index_name"], table_name.identifier, json.dumps(constraint))
+                constraints.setdefault(table_name, []).append(constraint)
+
+    logger.info("Retrieved catalog information for %d table(s) (%d with constraints)",
+                len(attributes), len(constraints))
+    return CatalogSnapshot(attributes, constraints)
+
+
 def fetch_dependencies(cx: connection, table_name: TableName) -> List[str]:
     """
     Lookup dependencies (other tables)
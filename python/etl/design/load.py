@@ -153,11 +153,28 @@ def validate_semantics_of_view(table_design):
     for column in table_design["columns"]:
         if len(column) != 1:
             raise TableDesignSemanticError("too much information for column of a VIEW: {}".format(list(column)))
-    for obj in ("constraints", "attributes", "extract_settings"):
+    for obj in ("constraints", "attributes", "extract_settings", "load_settings"):
         if obj in table_design:
             raise TableDesignSemanticError("{} not supported for a VIEW".format(obj))
 
 
+def validate_semantics_of_matview(table_design):
+    """
+    Check for semantics that only apply to materialized views.
+
+    Like for views, definitions may only contain column names. But materialized views may have attributes
+    (except for interleaved sort keys).
+    """
+    for column in table_design["columns"]:
+        if len(column) != 1:
+            raise TableDesignSemanticError("too much information for column of a MATVIEW: {}".format(list(column)))
+    for obj in ("constraints", "extract_settings", "load_settings", "late_binding"):
+        if obj in table_design:
+            raise TableDesignSemanticError("{} not supported for a MATVIEW".format(obj))
+    if "interleaved_sort" in table_design.get("attributes", {}):
+        raise TableDesignSemanticError("interleaved sort key not supported for a MATVIEW")
+
+
 def validate_semantics_of_table_or_ctas(table_design):
     """
     Check for semantics that apply to tables that are in source schemas or are a CTAS
@@ -182,6 +199,8 @@ def validate_semantics_of_ctas(table_design):
     validate_semantics_of_table_or_ctas(table_design)
     if "extract_settings" in table_design:
         raise TableDesignSemanticError("Extract settings not supported for transformations")
+    if "late_binding" in table_design:
+        raise TableDesignSemanticError("Late binding only supported for a VIEW")
 
 
 def validate_semantics_of_table(table_design):
@@ -192,6 +211,10 @@ def validate_semantics_of_table(table_design):
 
     if "depends_on" in table_design:
         raise TableDesignSemanticError("upstream table '%s' has dependencies listed" % table_design["name"])
+    if "late_binding" in table_design:
+        raise TableDesignSemanticError("upstream table '%s' has late binding set" % table_design["name"])
+    if "load_settings" in table_design:
+        raise TableDesignSemanticError("upstream table '%s' has load settings" % table_design["name"])
 
     constraints = table_design.get("constraints", [])
     constraint_types_in_design = [t for c in constraints for t in c]
@@ -224,6 +247,11 @@ def validate_table_design_semantics(table_design, table_name):
         if schema.is_upstream_source:
             raise TableDesignSemanticError("invalid upstream source '%s' in view '%s'" %
                                            (table_name.schema, table_name.identifier))
+    elif table_design["source_name"] == "MATVIEW":
+        validate_semantics_of_matview(table_design)
+        if schema.is_upstream_source:
+            raise TableDesignSemanticError("invalid upstream source '%s' in materialized view '%s'" %
+                                           (table_name.schema, table_name.identifier))
     elif table_design["source_name"] == "CTAS":
         validate_semantics_of_ctas(table_design)
         if schema.is_upstream_source:
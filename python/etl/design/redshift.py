@@ -3,9 +3,10 @@ This module contains functions to maintain relations in Redshift.
 """
 
 import logging
+import re
 from contextlib import contextmanager
 from itertools import chain
-from typing import Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 
 import psycopg2
 import psycopg2.extensions
@@ -136,6 +137,228 @@ def build_table_ddl(table_design: dict, table_name: TableName, is_temp=False) ->
     return ddl
 
 
+# Aliases of SQL types (as used in table designs) to the names of the types in the catalog
+_sql_type_aliases = {
+    "int": "integer",
+    "int4": "integer",
+    "int2": "smallint",
+    "int8": "bigint",
+    "float": "double precision",
+    "float8": "double precision",
+    "float4": "real",
+    "bool": "boolean",
+    "varchar": "character varying",
+    "char": "character",
+    "decimal": "numeric",
+    "timestamp": "timestamp without time zone",
+    "timestamptz": "timestamp with time zone"
+}
+
+# Columns with these encodings cannot be altered, see
+# http://docs.aws.amazon.com/redshift/latest/dg/r_ALTER_TABLE.html
+_unalterable_encodings = frozenset(["bytedict", "runlength", "text255", "text32k"])
+
+_varchar_re = re.compile(r"^character varying\((\d+)\)$")
+
+
+def normalize_sql_type(sql_type: str) -> str:
+    """
+    Return the SQL type using the names of types in the catalog (without whitespace in parameters).
+
+    >>> normalize_sql_type("varchar(256)")
+    'character varying(256)'
+    >>> normalize_sql_type("DECIMAL(12, 2)")
+    'numeric(12,2)'
+    >>> normalize_sql_type("timestamp without time zone")
+    'timestamp without time zone'
+    """
+    match = re.match(r"^(\w+)\s*(\(.*\))?$", sql_type.strip().lower())
+    if match is None:
+        return " ".join(sql_type.lower().split())
+    base_type, parameters = match.groups()
+    base_type = _sql_type_aliases.get(base_type, base_type)
+    return base_type + (parameters or "").replace(" ", "")
+
+
+def fetch_table_definition(cx: connection, table_name: TableName) -> List[Dict[str, Any]]:
+    """
+    Retrieve the columns of a table along with their storage information (encoding, keys) from the catalog.
+    The list is empty if the table doesn't exist.
+    """
+    stmt = """
+        SELECT a.attname AS "name"
+             , pg_catalog.format_type(a.atttypid, a.atttypmod) AS "sql_type"
+             , a.attnotnull AS "not_null"
+             , pg_catalog.format_encoding(a.attencodingtype::INTEGER) AS "encoding"
+             , a.attisdistkey AS "is_distkey"
+             , a.attsortkeyord AS "sortkey_order"
+             , cls.reldiststyle AS "diststyle"
+          FROM pg_catalog.pg_attribute AS a
+          JOIN pg_catalog.pg_class AS cls ON a.attrelid = cls.oid
+          JOIN pg_catalog.pg_namespace AS ns ON cls.relnamespace = ns.oid
+         WHERE a.attnum > 0  -- skip system columns
+           AND NOT a.attisdropped
+           AND cls.relkind = 'r'
+           AND ns.nspname = %s
+           AND cls.relname = %s
+         ORDER BY a.attnum"""
+    return [dict(row) for row in etl.db.query(cx, stmt, (table_name.schema, table_name.table))]
+
+
+def _matches_live_attributes(table_design: dict, live_columns: List[Dict[str, Any]]) -> bool:
+    """
+    Return whether the distribution and sort key in the table design (if any) match the live table.
+    """
+    attributes = table_design.get("attributes", {})
+    distribution = attributes.get("distribution")
+    live_distkey = [column["name"] for column in live_columns if column["is_distkey"]]
+    if isinstance(distribution, list) and distribution != live_distkey:
+        return False
+    # Distribution styles in pg_class are 0 for EVEN, 1 for KEY, and 8 for ALL.
+    if distribution == "all" and live_columns[0]["diststyle"] != 8:
+        return False
+    if distribution == "even" and live_columns[0]["diststyle"] != 0:
+        return False
+    # Compound sort keys have positive numbers, interleaved sort keys have negative numbers.
+    sort_keys = sorted((column for column in live_columns if column["sortkey_order"]),
+                       key=lambda column: abs(column["sortkey_order"]))
+    live_compound_sort = [column["name"] for column in sort_keys if column["sortkey_order"] > 0]
+    live_interleaved_sort = [column["name"] for column in sort_keys if column["sortkey_order"] < 0]
+    return (attributes.get("compound_sort", []) == live_compound_sort and
+            attributes.get("interleaved_sort", []) == live_interleaved_sort)
+
+
+def build_alter_table_stmts(table_design: dict, table_name: TableName, live_columns: List[Dict[str, Any]],
+                            has_dependent_views=False) -> Optional[Tuple[List[str], List[str]]]:
+    """
+    Return statements to evolve the live table into the table design along with the names of new columns,
+    or None if the changes are not additive (and the table must be re-created).
+
+    Supported changes are new (nullable) columns at the end of the table and wider VARCHAR columns.
+    Changes that don't affect how the data is stored (like descriptions) don't matter.
+    (Redshift does not allow changing the type of columns that are part of constraints or have references,
+    nor of any column of a table that (schema-bound) views depend on.)
+
+    >>> live = [{"name": "id", "sql_type": "integer", "not_null": True, "encoding": "none",
+    ...          "is_distkey": True, "sortkey_order": 1, "diststyle": 1},
+    ...         {"name": "name", "sql_type": "character varying(10)", "not_null": False, "encoding": "lzo",
+    ...          "is_distkey": False, "sortkey_order": 0, "diststyle": 1}]
+    >>> design = {"columns": [{"name": "id", "sql_type": "int", "not_null": True},
+    ...                       {"name": "name", "sql_type": "varchar(20)"},
+    ...                       {"name": "email", "sql_type": "varchar(80)", "encoding": "zstd"}],
+    ...           "attributes": {"distribution": ["id"], "compound_sort": ["id"]}}
+    >>> stmts, new_columns = build_alter_table_stmts(design, TableName("s", "t"), live)
+    >>> for stmt in stmts:
+    ...     print(stmt)
+    ALTER TABLE "s"."t" ALTER COLUMN "name" TYPE character varying(20)
+    ALTER TABLE "s"."t" ADD COLUMN "email" varchar(80) ENCODE zstd
+    >>> new_columns
+    ['email']
+    >>> build_alter_table_stmts(dict(design, constraints=[{"unique": ["name"]}]), TableName("s", "t"), live) is None
+    True
+    >>> build_alter_table_stmts(design, TableName("s", "t"), live, has_dependent_views=True) is None
+    True
+    >>> widened = [live[0], dict(live[1], sql_type="character varying(20)")]
+    >>> build_alter_table_stmts(design, TableName("s", "t"), widened, has_dependent_views=True)
+    (['ALTER TABLE "s"."t" ADD COLUMN "email" varchar(80) ENCODE zstd'], ['email'])
+    >>> design["columns"][0]["sql_type"] = "bigint"
+    >>> build_alter_table_stmts(design, TableName("s", "t"), live) is None
+    True
+    """
+    columns = [column for column in table_design["columns"] if not column.get("skipped")]
+    if not live_columns or len(columns) < len(live_columns):
+        return None
+    if not _matches_live_attributes(table_design, live_columns):
+        return None
+
+    constrained_columns = {name for constraint in table_design.get("constraints", [])
+                           for names in constraint.values() for name in names}
+    stmts = []
+    for column, live_column in zip(columns, live_columns):
+        if column["name"] != live_column["name"] or bool(column.get("not_null")) != live_column["not_null"]:
+            return None
+        live_encoding = "raw" if live_column["encoding"] == "none" else live_column["encoding"]
+        if column.get("encoding", live_encoding) != live_encoding:
+            return None
+        sql_type = normalize_sql_type(column["sql_type"])
+        if sql_type == live_column["sql_type"]:
+            continue
+        new_length = _varchar_re.match(sql_type)
+        old_length = _varchar_re.match(live_column["sql_type"])
+        if (new_length is None or old_length is None or int(new_length.group(1)) < int(old_length.group(1)) or
+                live_encoding in _unalterable_encodings):
+            return None
+        if column["name"] in constrained_columns or "references" in column or has_dependent_views:
+            return None
+        stmts.append('ALTER TABLE {} ALTER COLUMN "{}" TYPE {}'.format(table_name, column["name"], sql_type))
+
+    new_columns = columns[len(live_columns):]
+    for column in new_columns:
+        # Adding a NOT NULL column would require a default value (and identity columns can't be added).
+        if column.get("not_null") or column.get("identity"):
+            return None
+        stmts.append("ALTER TABLE {} ADD COLUMN {}".format(table_name, build_column_description(column)))
+    return stmts, [column["name"] for column in new_columns]
+
+
+def build_external_table_ddl(table_design: dict, table_name: TableName, location: str) -> str:
+    """
+    Assemble the DDL of an external table (for Redshift Spectrum) over gzipped CSV files at the location.
+    External tables have neither constraints nor attributes (nor column encodings).
+
+    >>> print(build_external_table_ddl({"columns": [{"name": "id", "sql_type": "bigint", "not_null": True},
+    ...                                             {"name": "?", "skipped": True}]},
+    ...                                TableName("s", "t"), "s3://bucket/data/s/t/csv/"))
+    CREATE EXTERNAL TABLE "s"."t" (
+        "id" bigint
+    )
+    ROW FORMAT SERDE 'org.apache.hadoop.hive.serde2.OpenCSVSerde'
+    WITH SERDEPROPERTIES ('separatorChar' = ',', 'quoteChar' = '"', 'escapeChar' = '\\\\')
+    STORED AS TEXTFILE
+    LOCATION 's3://bucket/data/s/t/csv/'
+    """
+    columns = ['"{name}" {sql_type}'.format(**column)
+               for column in table_design["columns"] if not column.get("skipped", False)]
+    lines = ["CREATE EXTERNAL TABLE {} (".format(table_name),
+             "    " + ",\n    ".join(columns),
+             ")",
+             "ROW FORMAT SERDE 'org.apache.hadoop.hive.serde2.OpenCSVSerde'",
+             "WITH SERDEPROPERTIES ('separatorChar' = ',', 'quoteChar' = '\"', 'escapeChar' = '\\\\')",
+             "STORED AS TEXTFILE",
+             "LOCATION '{}'".format(location)]
+    return "\n".join(lines)
+
+
+def build_materialized_view_ddl(table_design: dict, view_name: TableName, query_stmt: str) -> str:
+    """
+    Assemble the DDL of a materialized view (which takes its columns from the query).
+
+    >>> print(build_materialized_view_ddl({"attributes": {"distribution": ["id"], "compound_sort": ["day"]}},
+    ...                                   TableName("s", "mv"), "SELECT id, day FROM s.t"))
+    CREATE MATERIALIZED VIEW "s"."mv"
+    DISTSTYLE KEY
+    DISTKEY ( "id" )
+    SORTKEY ( "day" )
+    AS
+    SELECT id, day FROM s.t
+    """
+    table_attributes = table_design.get("attributes", {})
+    distribution = table_attributes.get("distribution", [])
+    compound_sort = table_attributes.get("compound_sort", [])
+
+    lines = ["CREATE MATERIALIZED VIEW {}".format(view_name)]
+    if isinstance(distribution, list) and distribution:
+        lines.append("DISTSTYLE KEY")
+        lines.append("DISTKEY ( {} )".format(join_column_list(distribution)))
+    elif distribution:
+        lines.append("DISTSTYLE {}".format(distribution.upper()))
+    if compound_sort:
+        lines.append("SORTKEY ( {} )".format(join_column_list(compound_sort)))
+    lines.append("AS")
+    lines.append(query_stmt)
+    return "\n".join(lines)
+
+
 @contextmanager
 def log_load_error(cx):
     """Log any Redshift LOAD errors during a COPY command"""
@@ -169,28 +392,42 @@ def log_load_error(cx):
 
 
 def copy_from_uri(conn: connection, table_name: TableName, column_list: List[str], s3_uri: str, aws_iam_role: str,
-                  need_compupdate=False, dry_run=False) -> None:
+                  need_compupdate=False, data_format="csv", dry_run=False) -> Optional[int]:
     """
     Load data into table in the data warehouse using the COPY command.
+    Returns the number of rows loaded (or None in dry-run mode).
+
+    For data in Parquet files, the columns are matched by position (and a column list is not supported).
     """
     credentials = "aws_iam_role={}".format(aws_iam_role)
 
-    stmt = """
-        COPY {table} (
-            {columns}
-        )
-        FROM %s
-        CREDENTIALS %s MANIFEST
-        DELIMITER ',' ESCAPE REMOVEQUOTES GZIP
-        TIMEFORMAT AS 'auto' DATEFORMAT AS 'auto'
-        TRUNCATECOLUMNS
-        STATUPDATE OFF
-        COMPUPDATE {compupdate}
-        """.format(table=table_name, columns=join_column_list(column_list),
-                   compupdate="ON" if need_compupdate else "OFF")
+    if data_format == "parquet":
+        stmt = """
+            COPY {table}
+            FROM %s
+            CREDENTIALS %s MANIFEST
+            FORMAT AS PARQUET
+            STATUPDATE OFF
+            COMPUPDATE {compupdate}
+            """.format(table=table_name, compupdate="ON" if need_compupdate else "OFF")
+    else:
+        stmt = """
+            COPY {table} (
+                {columns}
+            )
+            FROM %s
+            CREDENTIALS %s MANIFEST
+            DELIMITER ',' ESCAPE REMOVEQUOTES GZIP
+            TIMEFORMAT AS 'auto' DATEFORMAT AS 'auto'
+            TRUNCATECOLUMNS
+            STATUPDATE OFF
+            COMPUPDATE {compupdate}
+            """.format(table=table_name, columns=join_column_list(column_list),
+                       compupdate="ON" if need_compupdate else "OFF")
     if dry_run:
         logger.info("Dry-run: Skipping copying data into '%s' from '%s'", table_name.identifier, s3_uri)
         etl.db.skip_query(conn, stmt, (s3_uri, credentials))
+        return None
     else:
         logger.info("Copying data into '%s' from '%s'", table_name.identifier, s3_uri)
         try:
@@ -198,6 +435,7 @@ def copy_from_uri(conn: connection, table_name: TableName, column_list: List[str
                 etl.db.execute(conn, stmt, (s3_uri, credentials))
             row_count = etl.db.query(conn, "SELECT pg_last_copy_count()")
             logger.info("Copied %d rows into '%s'", row_count[0][0], table_name.identifier)
+            return row_count[0][0]
         except psycopg2.InternalError as exc:
             raise TransientETLError(exc) from exc
 
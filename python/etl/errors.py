@@ -1,3 +1,4 @@
+import random
 import time
 from functools import partial
 
@@ -186,6 +187,12 @@ class MissingExtractEventError(RelationDataError):
         return self.message
 
 
+class RowCountMismatchError(RelationDataError):
+    """
+    Exception when the number of rows loaded differs from the number of rows that were extracted
+    """
+
+
 class FailedConstraintError(RelationDataError):
 
     def __init__(self, relation, constraint_type, columns, examples):
@@ -229,11 +236,35 @@ class RetriesExhaustedError(ETLRuntimeError):
     """
 
 
-def retry(max_retries: int, func: partial, logger):
+def backoff_delay(attempt: int, base_delay: float, max_delay: float, factor: float=5.0, jitter: float=0.5) -> float:
+    """
+    Return number of seconds to sleep before the next attempt.
+
+    The delay grows exponentially (base_delay * factor ^ attempt) until it reaches the max_delay.
+    Up to the "jitter" fraction of the delay is randomly added so that concurrent retries spread out
+    (without ever sleeping less than the exponential delay).
+
+    >>> backoff_delay(0, 5, 300, jitter=0)
+    5.0
+    >>> backoff_delay(2, 5, 300, jitter=0)
+    125.0
+    >>> backoff_delay(3, 5, 300, factor=2, jitter=0)
+    40.0
+    >>> backoff_delay(10, 5, 300)
+    300.0
+    >>> 25.0 <= backoff_delay(1, 5, 300) <= 37.5
+    True
+    """
+    delay = min(max_delay, base_delay * factor ** attempt)
+    return float(min(max_delay, delay * (1.0 + jitter * random.random())))
+
+
+def retry(max_retries: int, func: partial, logger, base_delay: float=5.0, max_delay: float=300.0,
+          factor: float=5.0):
     """
     Retry a function a maximum number of times and return its results.
     The function should be a functools.partial called with no arguments.
-    Sleeps for 5 ^ attempt_number seconds if there are remaining retry attempts.
+    Sleeps with an exponential backoff (with jitter, see backoff_delay) if there are remaining retry attempts.
 
     The given func function is only retried if it throws a TransientETLError. Any other error is considered
     permanent, and therefore no retry attempt is made.
@@ -249,8 +280,8 @@ def retry(max_retries: int, func: partial, logger):
             failure_reason = e
             remaining_attempts = max_retries - attempt
             if remaining_attempts:
-                sleep_time = 5 ** (attempt + 1)
-                logger.warning("Encountered the following error (retrying %s more times after %s second sleep): %s",
+                sleep_time = backoff_delay(attempt, base_delay, max_delay, factor)
+                logger.warning("Encountered the following error (retrying %s more times after %.1f second sleep): %s",
                                remaining_attempts, sleep_time, str(e))
                 time.sleep(sleep_time)
             continue
@@ -4,17 +4,25 @@ Help developers "debug" their queries using the explain command.
 In addition to showing the query plan, the output will also contain warnings
 regarding costly distributions or creation of temporary tables.
 
+The query plans are parsed into trees of plan nodes (with costs, row estimates, and join and distribution
+strategies).  A summary of the plans may be saved as a baseline to which later plans can be compared
+in order to find regressions.
+
 See http://docs.aws.amazon.com/redshift/latest/dg/c_data_redistribution.html
 """
 
+import concurrent.futures
 import logging
+import os.path
 import re
-from contextlib import closing
-from collections import Counter
-from typing import Dict, List
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional
+
+import simplejson as json
 
 import etl.db
 from etl.relation import RelationDescription
+from etl.text import join_with_quotes
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
@@ -33,8 +41,185 @@ leader_only_functions = [
 # the pattern matches while ignoring case if the name (or whatever is in {}) is not preceded by '.' and not in a word.
 leader_only_compiled = {name: re.compile(r"(?i)(?<!\.)\b{}\b".format(name)) for name in leader_only_functions}
 
+_plan_node_re = re.compile(r"""^(?P<indent>\s*(?:->\s+)?)
+                                (?P<operation>.*?)
+                                \s+\(cost=(?P<startup_cost>[\d.]+)\.\.(?P<total_cost>[\d.]+)
+                                \s+rows=(?P<rows>\d+)\s+width=(?P<width>\d+)\)\s*$""", re.VERBOSE)
+
+
+class PlanNode:
+    """
+    Single step in a query plan, like a scan, a join, or a network operation, with its estimates.
+
+    The operation is the "name" of the step as shown by EXPLAIN, for example "XN Hash Join DS_BCAST_INNER".
+    """
+
+    def __init__(self, operation: str, startup_cost: float, total_cost: float, rows: int, width: int) -> None:
+        self.operation = operation
+        self.startup_cost = startup_cost
+        self.total_cost = total_cost
+        self.rows = rows
+        self.width = width
+        self.details = []  # type: List[str]
+        self.children = []  # type: List[PlanNode]
+
+    @property
+    def distribution(self) -> Optional[str]:
+        """
+        Return the distribution strategy (like DS_DIST_NONE) of a join, or None.
+        """
+        for word in self.operation.split():
+            if word.startswith("DS_"):
+                return word
+        return None
+
+    @property
+    def is_join(self) -> bool:
+        return " Join" in self.operation or "Nested Loop" in self.operation
+
+    @property
+    def relation_name(self) -> Optional[str]:
+        """
+        Return name of the table (or temporary table) being scanned, or None.
+        """
+        match = re.search(r"\bon (\S+)", self.operation)
+        return match.group(1) if match else None
+
+    def walk(self):
+        """
+        Yield this node and all its descendants (depth-first).
+        """
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
 
-def explain_queries(dsn: dict, relations: List[RelationDescription]) -> None:
+def parse_plan(lines: List[str]) -> List[PlanNode]:
+    """
+    Parse the lines of a query plan (as returned by EXPLAIN) and return the root node for each sub-query.
+    (Sub-queries, which are separated by empty lines, create temporary tables.)
+
+    >>> roots = parse_plan([
+    ...     "XN Hash Join DS_BCAST_INNER  (cost=0.05..1200000000.11 rows=3 width=20)",
+    ...     '  Hash Cond: ("outer".a = "inner".a)',
+    ...     "  ->  XN Seq Scan on t1  (cost=0.00..0.03 rows=3 width=12)",
+    ...     "  ->  XN Hash  (cost=0.04..0.04 rows=3 width=8)",
+    ...     "        ->  XN Seq Scan on t2  (cost=0.00..0.03 rows=3 width=8)"])
+    >>> len(roots)
+    1
+    >>> roots[0].distribution, roots[0].total_cost, roots[0].rows, roots[0].details
+    ('DS_BCAST_INNER', 1200000000.11, 3, ['Hash Cond: ("outer".a = "inner".a)'])
+    >>> [(node.operation, len(node.children)) for node in roots[0].walk()]
+    [('XN Hash Join DS_BCAST_INNER', 2), ('XN Seq Scan on t1', 0), ('XN Hash', 1), ('XN Seq Scan on t2', 0)]
+    >>> roots[0].children[0].relation_name
+    't1'
+    """
+    roots = []  # type: List[PlanNode]
+    stack = []  # type: List[Any]
+    for line in lines:
+        if not line.strip():
+            stack = []
+            continue
+        match = _plan_node_re.match(line)
+        if match is None:
+            if stack:
+                stack[-1][1].details.append(line.strip())
+            continue
+        values = match.groupdict()
+        node = PlanNode(values["operation"].strip(), float(values["startup_cost"]), float(values["total_cost"]),
+                        int(values["rows"]), int(values["width"]))
+        indent = len(values["indent"])
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        if stack:
+            stack[-1][1].children.append(node)
+        else:
+            roots.append(node)
+        stack.append((indent, node))
+    return roots
+
+
+def summarize_plan(roots: List[PlanNode]) -> Dict[str, Any]:
+    """
+    Return summary of the query plan, suitable to compare plans of the same query over time.
+
+    >>> summary = summarize_plan(parse_plan([
+    ...     "XN Hash Join DS_DIST_BOTH  (cost=0.05..10.11 rows=3 width=20)",
+    ...     "  ->  XN Seq Scan on t1  (cost=0.00..0.03 rows=3 width=12)",
+    ...     "  ->  XN Seq Scan on t2  (cost=0.00..0.03 rows=3 width=8)"]))
+    >>> summary["cost"], summary["rows"], summary["sub_queries"], dict(summary["redistributions"])
+    (10.11, 3, 1, {'DS_DIST_BOTH': 1})
+    """
+    nodes = [node for root in roots for node in root.walk()]
+    redistributions = Counter(node.distribution for node in nodes if node.distribution in bad_distribution_styles)
+    return OrderedDict([
+        ("cost", sum(root.total_cost for root in roots)),
+        ("rows", roots[-1].rows if roots else 0),
+        ("sub_queries", len(roots)),
+        ("joins", [node.operation for node in nodes if node.is_join]),
+        ("redistributions", OrderedDict(sorted(redistributions.items())))
+    ])
+
+
+def compare_to_baseline(summary: Dict[str, Any], baseline: Dict[str, Any], cost_threshold=0.1) -> List[str]:
+    """
+    Return list of regressions in the summary of a query plan when compared to the baseline.
+
+    >>> compare_to_baseline({"cost": 100.0, "sub_queries": 1, "redistributions": {"DS_BCAST_INNER": 1}},
+    ...                     {"cost": 10.0, "sub_queries": 1, "redistributions": {}})
+    ['cost increased from 10.00 to 100.00', 'DS_BCAST_INNER steps increased from 0 to 1']
+    >>> compare_to_baseline({"cost": 10.5, "sub_queries": 1, "redistributions": {}},
+    ...                     {"cost": 10.0, "sub_queries": 1, "redistributions": {}})
+    []
+    """
+    regressions = []
+    if summary["cost"] > baseline["cost"] * (1.0 + cost_threshold):
+        regressions.append("cost increased from {:.2f} to {:.2f}".format(baseline["cost"], summary["cost"]))
+    if summary["sub_queries"] > baseline["sub_queries"]:
+        regressions.append("sub-queries increased from {:d} to {:d}".format(
+            baseline["sub_queries"], summary["sub_queries"]))
+    for ds in bad_distribution_styles:
+        before = baseline["redistributions"].get(ds, 0)
+        after = summary["redistributions"].get(ds, 0)
+        if after > before:
+            regressions.append("{} steps increased from {:d} to {:d}".format(ds, before, after))
+    return regressions
+
+
+def fetch_plans(dsn: dict, relations: List[RelationDescription], max_workers=8) -> Dict[str, List[str]]:
+    """
+    Retrieve query plans (as list of lines) concurrently using a pool of connections.
+    """
+    max_workers = min(max_workers, len(relations))
+    pool = etl.db.connection_pool(max_workers, dsn)
+
+    def fetch_plan(relation: RelationDescription) -> List[str]:
+        # We can't use a read-only connection here because Redshift needs to (or wants to) create
+        # temporary tables when building the query plan if temporary tables (probably from CTEs)
+        # will be needed during query execution.  (Look for scans on volt_tt_* tables.)
+        conn = pool.getconn()
+        conn.set_session(autocommit=True)
+        try:
+            logger.info("Retrieving query plan for '%s'", relation.identifier)
+            plan = etl.db.explain(conn, relation.query_stmt)
+        except Exception:
+            pool.putconn(conn, close=True)
+            raise
+        else:
+            pool.putconn(conn, close=False)
+        return plan
+
+    try:
+        # TODO With Python 3.6, we should pass in a thread_name_prefix
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            plans = list(executor.map(fetch_plan, relations))
+    finally:
+        pool.closeall()
+    return {relation.identifier: plan for relation, plan in zip(relations, plans)}
+
+
+def explain_queries(dsn: dict, relations: List[RelationDescription], baseline_file: Optional[str]=None,
+                    compare_file: Optional[str]=None) -> None:
     """
     Print query plans by running EXPLAIN on the queries.
 
@@ -49,6 +234,9 @@ def explain_queries(dsn: dict, relations: List[RelationDescription]) -> None:
 
     See http://docs.aws.amazon.com/redshift/latest/dg/c_data_redistribution.html
     and http://docs.aws.amazon.com/redshift/latest/dg/c_SQL_functions_leader_node_only.html
+
+    If a baseline file is given, the summaries of the query plans are written into it.  If a file to
+    compare against is given, relations with plans that got worse than in that (earlier) baseline are flagged.
     """
     transforms = [relation for relation in relations if relation.sql_file_name is not None]
     if not transforms:
@@ -57,25 +245,23 @@ def explain_queries(dsn: dict, relations: List[RelationDescription]) -> None:
 
     queries_with_temps = 0
     counter = Counter()  # type: Dict[str, int]
+    summaries = OrderedDict()  # type: Dict[str, Dict[str, Any]]
 
-    # We can't use a read-only connection here because Redshift needs to (or wants to) create
-    # temporary tables when building the query plan if temporary tables (probably from CTEs)
-    # will be needed during query execution.  (Look for scans on volt_tt_* tables.)
-    with closing(etl.db.connection(dsn, autocommit=True)) as conn:
-        for relation in transforms:
-            logger.info("Retrieving query plan for '%s'", relation.identifier)
-            plan = etl.db.explain(conn, relation.query_stmt)
-            print("Query plan for query of '{0.identifier}':\n | {1}".format(relation, "\n | ".join(plan)))
-            if any(row == "" for row in plan):
-                queries_with_temps += 1
-            for ds in bad_distribution_styles:
-                if any(ds in row for row in plan):
-                    counter[ds] += 1
-            # Poor man's detection of comments ... drop anything after '--' on every line.
-            lines = [line.split('--', 1)[0] for line in relation.query_stmt.split('\n)')]
-            for name in leader_only_compiled:
-                if any(leader_only_compiled[name].search(line) for line in lines):
-                    counter[name] += 1
+    plans = fetch_plans(dsn, transforms)
+    for relation in transforms:
+        plan = plans[relation.identifier]
+        print("Query plan for query of '{0.identifier}':\n | {1}".format(relation, "\n | ".join(plan)))
+        summary = summarize_plan(parse_plan(plan))
+        summaries[relation.identifier] = summary
+        if summary["sub_queries"] > 1:
+            queries_with_temps += 1
+        for ds in summary["redistributions"]:
+            counter[ds] += 1
+        # Poor man's detection of comments ... drop anything after '--' on every line.
+        lines = [line.split('--', 1)[0] for line in relation.query_stmt.split('\n)')]
+        for name in leader_only_compiled:
+            if any(leader_only_compiled[name].search(line) for line in lines):
+                counter[name] += 1
     if queries_with_temps:
         logger.warning("Found creation of temporary tables %d time(s)", queries_with_temps)
     for ds in bad_distribution_styles:
@@ -84,3 +270,45 @@ def explain_queries(dsn: dict, relations: List[RelationDescription]) -> None:
     for name in leader_only_functions:
         if counter[name]:
             logger.warning("Found leader-only function '%s' %d time(s)", name, counter[name])
+
+    if compare_file:
+        compare_with_baseline_file(summaries, compare_file)
+    if baseline_file:
+        write_baseline_file(summaries, baseline_file)
+
+
+def write_baseline_file(summaries: Dict[str, Dict[str, Any]], filename: str) -> None:
+    """
+    Write (or update) the summaries of query plans into the baseline file.
+    """
+    baseline = load_baseline_file(filename) if os.path.exists(filename) else {}
+    baseline.update(summaries)
+    with open(filename, "w") as f:
+        json.dump(baseline, f, indent="    ", sort_keys=True)
+        f.write("\n")
+    logger.info("Wrote summaries of %d query plan(s) to '%s'", len(summaries), filename)
+
+
+def load_baseline_file(filename: str) -> Dict[str, Dict[str, Any]]:
+    with open(filename) as f:
+        return json.load(f)
+
+
+def compare_with_baseline_file(summaries: Dict[str, Dict[str, Any]], filename: str) -> None:
+    """
+    Compare the summaries of query plans with the baseline and warn about relations whose plans got worse.
+    """
+    baseline = load_baseline_file(filename)
+    regressed = []
+    for identifier, summary in summaries.items():
+        if identifier not in baseline:
+            logger.info("Relation '%s' has no query plan in baseline '%s'", identifier, filename)
+            continue
+        for regression in compare_to_baseline(summary, baseline[identifier]):
+            logger.warning("Query plan of '%s' got worse: %s", identifier, regression)
+            regressed.append(identifier)
+    if regressed:
+        logger.warning("Found %d relation(s) with query plans worse than in baseline: %s",
+                       len(set(regressed)), join_with_quotes(sorted(set(regressed))))
+    else:
+        logger.info("Found no query plans worse than in baseline '%s'", filename)
@@ -2,7 +2,8 @@
 Extract data from an upstream source into S3.
 
 An "extract" refers to the wholesale extraction of data from relation(s) in some number
-of upstream sources. The data is stored in gzipped CSV form, into a specified keyspace in S3.
+of upstream sources. The data is stored in gzipped CSV form (or, if configured for a database source
+and using Spark, in Parquet files), into a specified keyspace in S3.
 
 (1) There are two main types of upstream sources: static sources and database sources.
 
@@ -4,7 +4,11 @@ DatabaseExtractors query upstream databases and save their data on S3 before wri
 from contextlib import closing
 from typing import Dict, List, Optional
 
+from psycopg2.extensions import connection  # only for type annotation
+
+import etl.config
 import etl.db
+import etl.s3
 from etl.extract.extractor import Extractor
 from etl.config.dw import DataWarehouseSchema
 from etl.relation import RelationDescription
@@ -20,6 +24,9 @@ class DatabaseExtractor(Extractor):
         super().__init__(name, schemas, relations, keep_going, needs_to_wait=True, dry_run=dry_run)
         self.max_partitions = max_partitions
         self.use_sampling = use_sampling
+        # With versioned extracts, data files are written to a new folder and the manifest then switched over
+        # so that loads (of other ETLs) never see partially written data.
+        self.versioned_extracts = bool(etl.config.get_config_value("arthur_settings.versioned_extracts"))
 
     def options_info(self) -> List[str]:
         info = super().options_info()
@@ -93,6 +100,27 @@ class DatabaseExtractor(Extractor):
                           partitions, self.max_partitions, int(partition_size), table_size, min_partition_size)
         return partitions
 
+    @staticmethod
+    def align_partitions_with_slices(num_partitions: int, num_slices: Optional[int]) -> int:
+        """
+        Return the number of partitions reduced to a multiple of the number of slices in the data warehouse,
+        so that every slice is busy while loading the data files.
+
+        Fewer partitions than slices are left alone since those tables are small anyways.
+
+        >>> DatabaseExtractor.align_partitions_with_slices(64, 16)
+        64
+        >>> DatabaseExtractor.align_partitions_with_slices(63, 16)
+        48
+        >>> DatabaseExtractor.align_partitions_with_slices(10, 16)
+        10
+        >>> DatabaseExtractor.align_partitions_with_slices(63, None)
+        63
+        """
+        if num_slices and num_partitions > num_slices:
+            return num_partitions - num_partitions % num_slices
+        return num_partitions
+
     def select_statement(self, relation: RelationDescription, add_sampling_on_column: Optional[str]) -> str:
         """
         Return something like
@@ -110,6 +138,21 @@ class DatabaseExtractor(Extractor):
             statement += """ WHERE (("{}" % 10) = 1)""".format(add_sampling_on_column)
         return statement
 
+    def _delete_directory_before_write(self, relation: RelationDescription) -> None:
+        """
+        Need to first delete data directory since Sqoop won't overwrite (and can't delete).
+        (Also used to remove leftovers when data is written in separate partitions.)
+        With versioned extracts, this only deletes leftovers of an earlier attempt in the current version.
+        """
+        data_prefix = self.data_prefix(relation)
+        deletable = sorted(etl.s3.list_objects_for_prefix(relation.bucket_name, data_prefix))
+        if deletable:
+            if self.dry_run:
+                self.logger.info("Dry-run: Skipping deletion of %d existing data file(s) in 's3://%s/%s'",
+                                 len(deletable), relation.bucket_name, data_prefix)
+            else:
+                etl.s3.delete_objects(relation.bucket_name, deletable, wait=True)
+
     def fetch_source_table_size(self, dsn_dict: Dict[str, str], relation: RelationDescription) -> int:
         """
         Return size or estimated size of source table for this relation in bytes.
@@ -117,21 +160,41 @@ class DatabaseExtractor(Extractor):
         For source tables in a postgres database, fetch the actual size from pg_catalog tables.
         Otherwise, pessimistically estimate a large fixed size.
         """
+        subprotocol = dsn_dict['subprotocol']
+        if subprotocol.startswith('postgres'):
+            with closing(etl.db.connection(dsn_dict, readonly=True)) as conn:
+                return self._query_source_table_size(conn, relation)
+        else:
+            return self._estimate_source_table_size(relation)
+
+    def fetch_source_table_sizes(self, dsn_dict: Dict[str, str],
+                                 relations: List[RelationDescription]) -> Dict[str, int]:
+        """
+        Return sizes or estimated sizes of source tables in bytes, keyed by the identifier of the relation.
+
+        This opens (at most) one connection to the upstream database for all relations.
+        """
+        subprotocol = dsn_dict['subprotocol']
+        if subprotocol.startswith('postgres'):
+            with closing(etl.db.connection(dsn_dict, readonly=True)) as conn:
+                return {relation.identifier: self._query_source_table_size(conn, relation) for relation in relations}
+        else:
+            return {relation.identifier: self._estimate_source_table_size(relation) for relation in relations}
+
+    def _query_source_table_size(self, conn: connection, relation: RelationDescription) -> int:
         stmt = """
             SELECT pg_catalog.pg_table_size(%s) AS "bytes"
                  , pg_catalog.pg_size_pretty(pg_catalog.pg_table_size(%s)) AS pretty_size
             """
         table = relation.source_table_name
-        subprotocol = dsn_dict['subprotocol']
-        if subprotocol.startswith('postgres'):
-            with closing(etl.db.connection(dsn_dict, readonly=True)) as conn:
-                rows = etl.db.query(conn, stmt, (str(table), str(table)))
-            bytes_size, pretty_size = rows[0]["bytes"], rows[0]["pretty_size"]
-            self.logger.info("Size of table '%s.%s': %s (%s)",
-                             relation.source_name, table.identifier, bytes_size, pretty_size)
-        else:
-            bytes_size, pretty_size = 671088640, '671 Mb'
-            self.logger.info("Pessimistic size estimate for non-postgres table '%s.%s': %s (%s)",
-                             relation.source_name, table.identifier, bytes_size, pretty_size)
+        rows = etl.db.query(conn, stmt, (str(table), str(table)))
+        bytes_size, pretty_size = rows[0]["bytes"], rows[0]["pretty_size"]
+        self.logger.info("Size of table '%s.%s': %s (%s)",
+                         relation.source_name, table.identifier, bytes_size, pretty_size)
+        return bytes_size
 
+    def _estimate_source_table_size(self, relation: RelationDescription) -> int:
+        bytes_size, pretty_size = 671088640, '671 Mb'
+        self.logger.info("Pessimistic size estimate for non-postgres table '%s.%s': %s (%s)",
+                         relation.source_name, relation.source_table_name.identifier, bytes_size, pretty_size)
         return bytes_size
@@ -5,10 +5,18 @@ Extractors leave usable (ie, COPY-ready) manifests on S3 that reference data fil
 """
 import concurrent.futures
 import logging
+import os.path
+import re
+import threading
+from collections import OrderedDict
+from contextlib import closing, contextmanager
+from datetime import datetime
 from itertools import groupby
 from functools import partial
 from operator import attrgetter
-from typing import Dict, List, Set
+from typing import Dict, List, Optional, Set, Tuple
+
+import psycopg2
 
 import etl.monitor
 import etl.s3
@@ -23,7 +31,7 @@ from etl.errors import (
 )
 from etl.text import join_with_quotes
 from etl.relation import RelationDescription
-from etl.timer import Timer
+from etl.timer import Timer, utc_now
 
 
 class Extractor:
@@ -47,6 +55,18 @@ class Extractor:
         self.dry_run = dry_run
         self.logger = logging.getLogger(__name__)
         self.failed_sources = set()  # type: Set[str]
+        # Number of relations of a single source that may be extracted at the same time
+        self.max_concurrent_tables = 1
+        # Elapsed time of "stages" (like reading or writing) while extracting a relation, see stage()
+        self._stage_timings = {}  # type: Dict[str, Dict[str, str]]
+        # Row counts (by relation and then by partition) which are written to the stats file next to the manifest
+        self._row_counts = {}  # type: Dict[str, Dict[str, Optional[int]]]
+        # Number of slices in the data warehouse, looked up when first needed
+        self._num_slices = None  # type: Optional[int]
+        self._num_slices_lock = threading.Lock()
+        # Extractors may write data files into a new "version" folder (below the data folder) for every extract.
+        self.versioned_extracts = False
+        self.version = version_name(utc_now(), str(etl.monitor.Monitor.etl_id))
 
     def extract_table(self, source: DataWarehouseSchema, relation: RelationDescription):
         raise NotImplementedError("Forgot to implement extract_table in {}".format(self.__class__.__name__))
@@ -67,39 +87,118 @@ class Extractor:
                 'schema': relation.source_table_name.schema,
                 'table': relation.source_table_name.table}
 
+    @property
+    def num_slices(self) -> Optional[int]:
+        """
+        Return the number of slices in the data warehouse cluster, or None if that cannot be determined.
+
+        COPY loads one file per slice at a time, so the number of data files should be a multiple of this.
+        """
+        with self._num_slices_lock:
+            if self._num_slices is None:
+                try:
+                    dsn_etl = etl.config.get_dw_config().dsn_etl
+                    with closing(etl.db.connection(dsn_etl, readonly=True)) as conn:
+                        rows = etl.db.query(conn, "SELECT COUNT(*) AS num_slices FROM stv_slices")
+                    self._num_slices = rows[0]["num_slices"]
+                    self.logger.info("Found %d slice(s) in the data warehouse cluster", self._num_slices)
+                except (KeyError, ValueError, psycopg2.Error) as exc:
+                    self.logger.warning("Failed to look up number of slices in the data warehouse: %s", exc)
+                    self._num_slices = 0
+        return self._num_slices or None
+
+    @contextmanager
+    def stage(self, relation: RelationDescription, name: str):
+        """
+        Measure the time of one stage of extracting the relation so that it will be reported by the monitor.
+        """
+        with Timer() as timer:
+            yield
+        self.logger.debug("Finished stage '%s' while extracting '%s' (%s)", name, relation.identifier, timer)
+        self._stage_timings.setdefault(relation.identifier, OrderedDict())[name] = str(timer)
+
+    def record_row_count(self, relation: RelationDescription, partition: str, rows: Optional[int]) -> None:
+        """
+        Remember the number of rows extracted for the relation (or one of its partitions) for the stats file.
+        Use the partition name "all" if the relation was extracted in one go.
+        """
+        self._row_counts.setdefault(relation.identifier, {})[partition] = rows
+
+    def extract_relation(self, source: DataWarehouseSchema, relation: RelationDescription, index: Dict,
+                         extract_retries: int) -> bool:
+        """
+        Extract the data of one relation (with retries) while reporting to the monitor.
+
+        Return True iff the extract failed and the failure can be ignored, raises an exception if the
+        failed relation is required (unless we keep going).
+        """
+        try:
+            extract_func = partial(self.extract_table, source, relation)
+            with etl.monitor.Monitor(relation.identifier,
+                                     "extract",
+                                     options=self.options_info(),
+                                     source=self.source_info(source, relation),
+                                     destination={'bucket_name': relation.bucket_name,
+                                                  'object_key': relation.manifest_file_name},
+                                     index=index,
+                                     dry_run=self.dry_run) as monitor:
+                try:
+                    retry(extract_retries, extract_func, self.logger,
+                          base_delay=etl.config.get_config_int("arthur_settings.retry_base_delay", 5),
+                          max_delay=etl.config.get_config_int("arthur_settings.retry_max_delay", 300),
+                          factor=etl.config.get_config_int("arthur_settings.retry_backoff_factor", 5))
+                finally:
+                    stages = self._stage_timings.pop(relation.identifier, None)
+                    if stages:
+                        monitor.add_extra("stages", stages)
+        except ETLRuntimeError:
+            self.failed_sources.add(source.name)
+            if not relation.is_required:
+                self.logger.warning("Extract failed for non-required relation '%s':", relation.identifier,
+                                    exc_info=True)
+            elif self.keep_going:
+                self.logger.warning("Ignoring failure of required relation '%s' and proceeding as requested:",
+                                    relation.identifier, exc_info=True)
+            else:
+                self.logger.error("Extract failed for required relation '%s'", relation.identifier)
+                raise
+            return True
+        return False
+
     def extract_source(self, source: DataWarehouseSchema,
                        relations: List[RelationDescription]) -> List[RelationDescription]:
         """
         For a given upstream source, iterate through given relations to extract the relations' data.
+
+        If the extractor allows for concurrent extracts, then up to that many relations are extracted at the
+        same time.  The first failure of a required relation (when not keeping going) cancels extracts
+        that have not started yet.
         """
         self.logger.info("Extracting %d relation(s) from source '%s'", len(relations), source.name)
         failed = []
         extract_retries = etl.config.get_config_int("arthur_settings.extract_retries")
+        indices = [{"current": i + 1, "final": len(relations), "name": source.name} for i in range(len(relations))]
         with Timer() as timer:
-            for i, relation in enumerate(relations):
-                try:
-                    extract_func = partial(self.extract_table, source, relation)
-                    with etl.monitor.Monitor(relation.identifier,
-                                             "extract",
-                                             options=self.options_info(),
-                                             source=self.source_info(source, relation),
-                                             destination={'bucket_name': relation.bucket_name,
-                                                          'object_key': relation.manifest_file_name},
-                                             index={"current": i + 1, "final": len(relations), "name": source.name},
-                                             dry_run=self.dry_run):
-                        retry(extract_retries, extract_func, self.logger)
-                except ETLRuntimeError:
-                    self.failed_sources.add(source.name)
-                    failed.append(relation)
-                    if not relation.is_required:
-                        self.logger.warning("Extract failed for non-required relation '%s':", relation.identifier,
-                                            exc_info=True)
-                    elif self.keep_going:
-                        self.logger.warning("Ignoring failure of required relation '%s' and proceeding as requested:",
-                                            relation.identifier, exc_info=True)
-                    else:
-                        self.logger.error("Extract failed for required relation '%s'", relation.identifier)
-                        raise
+            if self.max_concurrent_tables > 1 and len(relations) > 1:
+                max_workers = min(self.max_concurrent_tables, len(relations))
+                self.logger.info("Extracting up to %d relation(s) concurrently from source '%s'",
+                                 max_workers, source.name)
+                # TODO With Python 3.6, we should pass in a thread_name_prefix
+                with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    futures = [executor.submit(self.extract_relation, source, relation, index, extract_retries)
+                               for relation, index in zip(relations, indices)]
+                    done, not_done = concurrent.futures.wait(futures,
+                                                             return_when=concurrent.futures.FIRST_EXCEPTION)
+                    for future in not_done:
+                        future.cancel()
+                # Note that asking for the result will raise any exception from a failed required relation.
+                for relation, future in zip(relations, futures):
+                    if not future.cancelled() and future.result():
+                        failed.append(relation)
+            else:
+                for relation, index in zip(relations, indices):
+                    if self.extract_relation(source, relation, index, extract_retries):
+                        failed.append(relation)
             self.logger.info("Finished extract from source '%s': %d succeeded, %d failed (%s)",
                              source.name, len(relations) - len(failed), len(failed), timer)
         return failed
@@ -135,46 +234,237 @@ class Extractor:
         if not_done:
             raise DataExtractError("Extract failed to complete for {:d} source(s)".format(len(not_done)))
 
-    def write_manifest_file(self, relation: RelationDescription, source_bucket: str, source_prefix: str) -> None:
+    def data_prefix(self, relation: RelationDescription) -> str:
+        """
+        Return the prefix (in the relation's bucket) where the extract writes data files.
         """
-        Create manifest file to load all the CSV files for the given relation.
+        data_prefix = os.path.join(relation.prefix, relation.data_path_name)
+        if self.versioned_extracts:
+            return os.path.join(data_prefix, self.version)
+        return data_prefix
+
+    def remove_old_versions(self, relation: RelationDescription) -> None:
+        """
+        Delete data files from earlier extracts in the background (after the manifest was switched to the
+        current version). The files of the previous version are kept so that a load which started with the
+        previous manifest is still able to finish.
+        """
+        data_prefix = os.path.join(relation.prefix, relation.data_path_name)
+        keys = list(etl.s3.list_objects_for_prefix(relation.bucket_name, data_prefix + "/"))
+        deletable = find_outdated_data_files(data_prefix, keys, self.version)
+        if not deletable:
+            return
+        if self.dry_run:
+            self.logger.info("Dry-run: Skipping deletion of %d outdated data file(s) in 's3://%s/%s'",
+                             len(deletable), relation.bucket_name, data_prefix)
+        else:
+            etl.s3.delete_objects_in_background(relation.bucket_name, deletable)
+
+    def write_manifest_file(self, relation: RelationDescription, source_bucket: str, source_prefix: str,
+                            listing: Optional[List[Tuple[str, int]]]=None, wait_for_manifest: bool=True) -> None:
+        """
+        Create manifest file to load all the CSV (or Parquet) files for the given relation.
         The manifest file will be created in the folder ABOVE the CSV files.
 
         If the data files are in 'data/foo/bar/csv/part-r*', then the manifest is 'data/foo/bar.manifest'.
 
+        Manifests for files in a columnar format must also list the size of every file.
+
         Note that for static sources, we need to check the bucket of that source, not the
         bucket where the manifest will be written to.
 
         This will also test for the presence of the _SUCCESS file (added by map-reduce jobs).
+
+        If the objects (keys and sizes) below the source prefix were already listed by the caller, then that
+        listing is used instead of looking at the bucket again.  Callers that check for all their manifests at once
+        may skip waiting for the manifest.
         """
         self.logger.info("Preparing manifest file for data in 's3://%s/%s'", source_bucket, source_prefix)
 
-        have_success = etl.s3.get_s3_object_last_modified(source_bucket, source_prefix + "/_SUCCESS",
-                                                          wait=self.needs_to_wait and not self.dry_run)
-        if have_success is None:
+        if listing is None:
+            last_success = etl.s3.get_s3_object_last_modified(source_bucket, source_prefix + "/_SUCCESS",
+                                                              wait=self.needs_to_wait and not self.dry_run)
+            have_success = last_success is not None
+            listing = list(etl.s3.list_objects_with_size_for_prefix(source_bucket, source_prefix))
+        else:
+            success_key = source_prefix + "/_SUCCESS"
+            have_success = any(key == success_key for key, size in listing)
+        if not have_success:
             if self.dry_run:
                 self.logger.warning("No valid CSV files (_SUCCESS is missing)")
             else:
                 raise MissingCsvFilesError("No valid CSV files (_SUCCESS is missing)")
 
-        csv_files = sorted(key for key in etl.s3.list_objects_for_prefix(source_bucket, source_prefix)
-                           if "part" in key and key.endswith(".gz"))
-        remote_files = ["s3://{}/{}".format(source_bucket, filename) for filename in csv_files]
-        manifest = {"entries": [{"url": name, "mandatory": True} for name in remote_files]}
+        is_columnar = relation.extract_format == "parquet"
+        file_extension = ".parquet" if is_columnar else ".gz"
+        data_files = sorted((key, size)
+                            for key, size in listing
+                            if "part" in key and key.endswith(file_extension))
+        entries = []
+        for key, size in data_files:
+            entry = {"url": "s3://{}/{}".format(source_bucket, key), "mandatory": True}  # type: Dict[str, object]
+            if is_columnar:
+                entry["meta"] = {"content_length": size}
+            entries.append(entry)
+        manifest = {"entries": entries}  # type: Dict[str, object]
+
+        num_slices = self.num_slices
+        if entries and num_slices:
+            self.logger.info("Expected parallelism while loading %d data file(s) into %d slice(s): %.0f%%",
+                             len(entries), num_slices, 100.0 * expected_copy_parallelism(len(entries), num_slices))
+
+        if not entries and not self.dry_run:
+            raise MissingCsvFilesError("found no data files to add to manifest")
+
+        # The stats file is written before the manifest and the number of rows is also added to the manifest
+        # (in the same place as in manifests written by UNLOAD) so that a load never pairs a new manifest
+        # with the row count of an earlier extract.
+        total_rows = self.write_stats_file(relation, data_files)
+        if total_rows is not None:
+            manifest["meta"] = {"record_count": total_rows}
 
         if self.dry_run:
-            if not remote_files:
-                self.logger.warning("Dry-run: Found no CSV files to add to manifest")
+            if not entries:
+                self.logger.warning("Dry-run: Found no data files to add to manifest")
             else:
-                self.logger.info("Dry-run: Skipping writing manifest file 's3://%s/%s' for %d CSV file(s)",
-                                 relation.bucket_name, relation.manifest_file_name, len(csv_files))
+                self.logger.info("Dry-run: Skipping writing manifest file 's3://%s/%s' for %d data file(s)",
+                                 relation.bucket_name, relation.manifest_file_name, len(entries))
         else:
-            if not remote_files:
-                raise MissingCsvFilesError("found no CSV files to add to manifest")
-
-            self.logger.info("Writing manifest file to 's3://%s/%s' for %d CSV file(s)",
-                             relation.bucket_name, relation.manifest_file_name, len(csv_files))
+            self.logger.info("Writing manifest file to 's3://%s/%s' for %d data file(s)",
+                             relation.bucket_name, relation.manifest_file_name, len(entries))
             etl.s3.upload_data_to_s3(manifest, relation.bucket_name, relation.manifest_file_name)
 
-            # Make sure file exists before proceeding
-            etl.s3.get_s3_object_last_modified(relation.bucket_name, relation.manifest_file_name, wait=True)
+            if wait_for_manifest:
+                # Make sure file exists before proceeding
+                etl.s3.get_s3_object_last_modified(relation.bucket_name, relation.manifest_file_name, wait=True)
+
+        if self.versioned_extracts:
+            self.remove_old_versions(relation)
+
+    def write_stats_file(self, relation: RelationDescription, data_files: List[Tuple[str, int]]) -> Optional[int]:
+        """
+        Write statistics about the extract (number of rows and bytes, overall and by partition) next to the manifest.
+        The number of rows is unknown (null) if any partition has an unknown number of rows.
+
+        Return the total number of rows (if known) so that it can also be added to the manifest.
+        """
+        row_counts = self._row_counts.pop(relation.identifier, {})
+        total_bytes = sum(size for key, size in data_files)
+        partitions = []  # type: List[Dict[str, object]]
+        for name in sorted(row_counts):
+            if name == "all":
+                partition_bytes = total_bytes
+            else:
+                partition_bytes = sum(size for key, size in data_files if "/{}/".format(name) in key)
+            partitions.append({"name": name, "rows": row_counts[name], "bytes": partition_bytes})
+        known_rows = [rows for rows in row_counts.values() if rows is not None]
+        if row_counts and len(known_rows) == len(row_counts):
+            total_rows = sum(known_rows)  # type: Optional[int]
+        else:
+            total_rows = None
+        stats = {
+            "etl_id": etl.monitor.Monitor.etl_id,
+            "extractor": self.name,
+            "rows": total_rows,
+            "bytes": total_bytes,
+            "files": len(data_files),
+            "partitions": partitions
+        }
+        if self.dry_run:
+            self.logger.info("Dry-run: Skipping writing stats file 's3://%s/%s' (rows: %s, bytes: %d)",
+                             relation.bucket_name, relation.stats_file_name, total_rows, total_bytes)
+        else:
+            self.logger.info("Writing stats file to 's3://%s/%s' (rows: %s, bytes: %d)",
+                             relation.bucket_name, relation.stats_file_name, total_rows, total_bytes)
+            etl.s3.upload_data_to_s3(stats, relation.bucket_name, relation.stats_file_name)
+        return total_rows
+
+
+def expected_copy_parallelism(num_files: int, num_slices: int) -> float:
+    """
+    Return the fraction of slices that are (on average) busy when COPY loads the files, assuming similar file sizes.
+
+    Each slice loads one file at a time so the files are loaded in "rounds" of (at most) the number of slices.
+
+    >>> expected_copy_parallelism(16, 16)
+    1.0
+    >>> expected_copy_parallelism(32, 16)
+    1.0
+    >>> expected_copy_parallelism(1, 16)
+    0.0625
+    >>> expected_copy_parallelism(17, 16)
+    0.53125
+    """
+    rounds = -(-num_files // num_slices)
+    return num_files / (rounds * num_slices)
+
+
+_version_name_re = re.compile(r"^v\d{14}-\w+$")
+
+
+def version_name(timestamp: datetime, etl_id: str) -> str:
+    """
+    Return name of the folder for the data files of one extract.  Names of later extracts sort after earlier ones.
+
+    >>> version_name(datetime(2017, 3, 21, 17, 5, 42), "0123ABCD")
+    'v20170321170542-0123ABCD'
+    """
+    return "v{:%Y%m%d%H%M%S}-{}".format(timestamp, etl_id)
+
+
+def find_versions(data_prefix: str, keys: List[str], require_success=False) -> List[str]:
+    """
+    Return names of the version folders (below the data prefix) found in the keys, latest version first.
+    If success is required, only versions with a _SUCCESS file (i.e. from completed extracts) are returned.
+
+    >>> keys = ["data/s/t/csv/v20170101000000-A/part-0", "data/s/t/csv/v20170101000000-A/_SUCCESS",
+    ...         "data/s/t/csv/v20170102000000-B/part-0", "data/s/t/csv/part-0.gz"]
+    >>> find_versions("data/s/t/csv", keys)
+    ['v20170102000000-B', 'v20170101000000-A']
+    >>> find_versions("data/s/t/csv", keys, require_success=True)
+    ['v20170101000000-A']
+    """
+    versions = set()
+    for key in keys:
+        parts = key[len(data_prefix):].lstrip("/").split("/")
+        if len(parts) > 1 and _version_name_re.match(parts[0]):
+            if not require_success or parts[1:] == ["_SUCCESS"]:
+                versions.add(parts[0])
+    return sorted(versions, reverse=True)
+
+
+def find_outdated_data_files(data_prefix: str, keys: List[str], current_version: str) -> List[str]:
+    """
+    Return the keys of data files that belong neither to the current (or a later) version nor to the version
+    before (nor to the latest complete version before).  Files not in any version folder (from extracts before
+    using versions) count as the oldest version.
+
+    >>> keys = ["data/s/t/csv/v20170101000000-A/part-0", "data/s/t/csv/v20170102000000-B/part-0",
+    ...         "data/s/t/csv/v20170103000000-C/part-0", "data/s/t/csv/part-0.gz"]
+    >>> find_outdated_data_files("data/s/t/csv", keys, "v20170103000000-C")
+    ['data/s/t/csv/part-0.gz', 'data/s/t/csv/v20170101000000-A/part-0']
+    >>> find_outdated_data_files("data/s/t/csv", keys[2:], "v20170103000000-C")
+    []
+    >>> find_outdated_data_files("data/s/t/csv", keys + ["data/s/t/csv/v20170101000000-A/_SUCCESS"],
+    ...                          "v20170103000000-C")
+    ['data/s/t/csv/part-0.gz']
+    """
+    versions = find_versions(data_prefix, keys)
+    older_versions = [version for version in versions if version < current_version]
+    if older_versions:
+        keep = {version for version in versions if version >= current_version}
+        keep.add(older_versions[0])
+        complete_versions = find_versions(data_prefix, keys, require_success=True)
+        older_complete_versions = [version for version in complete_versions if version < current_version]
+        if older_complete_versions:
+            keep.add(older_complete_versions[0])
+    else:
+        # Keep unversioned files as the "previous version"
+        keep = set(versions) | {""}
+    outdated = []
+    for key in keys:
+        parts = key[len(data_prefix):].lstrip("/").split("/")
+        version = parts[0] if len(parts) > 1 and _version_name_re.match(parts[0]) else ""
+        if version not in keep:
+            outdated.append(key)
+    return sorted(outdated)
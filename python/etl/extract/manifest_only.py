@@ -2,8 +2,10 @@ import logging
 import os.path
 from typing import Dict, List
 
+import etl.s3
 from etl.config.dw import DataWarehouseSchema
-from etl.extract.extractor import Extractor
+from etl.errors import MissingCsvFilesError
+from etl.extract.extractor import Extractor, find_versions
 from etl.relation import RelationDescription
 
 
@@ -22,6 +24,17 @@ class ManifestOnlyExtractor(Extractor):
     def extract_table(self, source: DataWarehouseSchema, relation: RelationDescription):
         """
         Build a manifest file for the given table and write it to S3
+
+        If the data files were written by versioned extracts, then the manifest points to the latest version
+        that is complete (has a success file).
         """
-        csv_prefix = os.path.join(relation.prefix, relation.csv_path_name)
-        self.write_manifest_file(relation, relation.bucket_name, csv_prefix)
+        data_prefix = os.path.join(relation.prefix, relation.data_path_name)
+        keys = list(etl.s3.list_objects_for_prefix(relation.bucket_name, data_prefix + "/"))
+        if find_versions(data_prefix, keys):
+            versions = find_versions(data_prefix, keys, require_success=True)
+            if not versions:
+                raise MissingCsvFilesError("found no complete version of data files for '{}'".format(
+                    relation.identifier))
+            self.logger.info("Using latest version '%s' of data files for '%s'", versions[0], relation.identifier)
+            data_prefix = os.path.join(data_prefix, versions[0])
+        self.write_manifest_file(relation, relation.bucket_name, data_prefix)
@@ -1,13 +1,18 @@
+import concurrent.futures
 import logging
 import os.path
-from typing import List, Dict, Tuple
+import threading
+from typing import List, Dict, Optional, Set, Tuple
 from contextlib import closing
 
 import boto3
 from psycopg2.extensions import connection  # only for type annotation
 
+import etl.config
 import etl.db
+import etl.s3
 from etl.config.dw import DataWarehouseSchema
+from etl.errors import DataExtractError, TransientETLError
 from etl.extract.database_extractor import DatabaseExtractor
 from etl.names import TableName
 from etl.relation import RelationDescription
@@ -23,12 +28,25 @@ class SparkExtractor(DatabaseExtractor):
                  max_partitions: int, use_sampling: bool, keep_going: bool, dry_run: bool) -> None:
         super().__init__("spark", schemas, relations, max_partitions, use_sampling, keep_going, dry_run=dry_run)
         self.logger = logging.getLogger(__name__)
+        # Tables are extracted concurrently as jobs within the same Spark application (using FAIR scheduling)
+        self.max_concurrent_tables = etl.config.get_config_int("arthur_settings.spark_concurrent_jobs", 1)
         self._sql_context = None
+        self._sql_context_lock = threading.Lock()
+        # Partitioning (select statement and predicates) and partitions that were successfully written (by relation)
+        # so that retries only re-run failed partitions using the same predicates
+        self._completed_partitions = {}  # type: Dict[str, Tuple[str, List[str], Set[int]]]
+
+    def options_info(self) -> List[str]:
+        info = super().options_info()
+        info.append("concurrent-jobs={}".format(self.max_concurrent_tables))
+        return info
 
     @property
     def sql_context(self):
-        if self._sql_context is None:
-            self._sql_context = self._create_sql_context()
+        # Sources (and possibly tables) are extracted in separate threads which must share the one context.
+        with self._sql_context_lock:
+            if self._sql_context is None:
+                self._sql_context = self._create_sql_context()
         return self._sql_context
 
     def _create_sql_context(self):
@@ -46,11 +64,14 @@ class SparkExtractor(DatabaseExtractor):
 
         if "SPARK_ENV_LOADED" not in os.environ:
             self.logger.warning("SPARK_ENV_LOADED is not set")
+        if os.environ.get("PYSPARK_PIN_THREAD", "false").lower() != "true":
+            self.logger.warning("PYSPARK_PIN_THREAD is not set, concurrent extracts may not use their scheduler pools")
 
         self.logger.info("Starting SparkSQL context")
         conf = (SparkConf()
                 .setAppName(__name__)
-                .set("spark.logConf", "true"))
+                .set("spark.logConf", "true")
+                .set("spark.scheduler.mode", "FAIR"))
         sc = SparkContext(conf=conf)
 
         # Copy the credentials from the session into hadoop for access to S3
@@ -64,22 +85,55 @@ class SparkExtractor(DatabaseExtractor):
 
     def extract_table(self, source: DataWarehouseSchema, relation: RelationDescription):
         """
-        Using Spark's dataframe API, read the table in as a dataframe before writing it out to CSV.
+        Using Spark's dataframe API, read the table in as a dataframe before writing it out to CSV
+        (or Parquet if the source is configured for it).
+
+        Jobs of each table are submitted to their own scheduler pool so that concurrent extracts
+        share the executors of the cluster.  Since the pool is a local property of the (Python) thread, this
+        requires PySpark's pinned thread mode (PYSPARK_PIN_THREAD=true, see SPARK-22340), which must be set
+        before Spark starts (e.g. in submit_arthur.sh or the spark-env of the cluster).
+
+        If the table is partitioned, then every partition is read and written separately.  After a failure,
+        the retry will only extract the partitions that failed.
         """
         with etl.db.log_error():
-            df = self.read_table_as_dataframe(source, relation)
-            self.write_dataframe_as_csv(df, relation)
-            prefix = os.path.join(relation.prefix, relation.csv_path_name)
-            self.write_manifest_file(relation, relation.bucket_name, prefix)
+            # Local properties are set for the current thread only.
+            self.sql_context._sc.setLocalProperty("spark.scheduler.pool", relation.identifier)
+            with self.stage(relation, "prepare"):
+                if relation.identifier not in self._completed_partitions:
+                    select_statement, predicates, num_partitions = self.prepare_table_read(source, relation)
+                else:
+                    # Partition boundaries must not change between attempts or rows may be duplicated or lost.
+                    select_statement, predicates, _ = self._completed_partitions[relation.identifier]
+                    num_partitions = len(predicates)
+                    self.logger.info("Re-using %d partition(s) of '%s' from earlier attempt",
+                                     num_partitions, relation.identifier)
+            with self.stage(relation, "write"):
+                if predicates is None:
+                    df = self.read_table_as_dataframe(source, select_statement)
+                    if num_partitions > 1:
+                        # Without a partition key, the table is read in one piece but should still be written
+                        # to multiple files.
+                        self.logger.info("Repartitioning '%s' into %d partition(s)", relation.identifier,
+                                         num_partitions)
+                        df = df.repartition(num_partitions)
+                    rows = self.write_dataframe_counting_rows(df, relation, self._data_uri(relation))
+                    self.record_row_count(relation, "all", rows)
+                else:
+                    self.write_partitions(source, relation, select_statement, predicates)
+            with self.stage(relation, "manifest"):
+                self.write_manifest_file(relation, relation.bucket_name, self.data_prefix(relation))
+            self._completed_partitions.pop(relation.identifier, None)
 
-    def read_table_as_dataframe(self, source: DataWarehouseSchema, relation: RelationDescription):
+    def prepare_table_read(self, source: DataWarehouseSchema,
+                           relation: RelationDescription) -> Tuple[str, Optional[List[str]], int]:
         """
-        Read dataframe (with partitions) by contacting upstream JDBC-reachable source.
+        Return the select statement, the predicates that define partitions (if any) and the number of partitions.
         """
         partition_key = relation.find_partition_key()
 
         table_size = self.fetch_source_table_size(source.dsn, relation)
-        num_partitions = self.maximize_partitions(table_size)
+        num_partitions = self.align_partitions_with_slices(self.maximize_partitions(table_size), self.num_slices)
 
         if partition_key is None or num_partitions <= 1:
             predicates = None
@@ -93,7 +147,13 @@ class SparkExtractor(DatabaseExtractor):
             inner_select = self.select_statement(relation, None)
         select_statement = """({}) AS t""".format(inner_select)
         self.logger.debug("Table query: SELECT * FROM %s", select_statement)
+        return select_statement, predicates, num_partitions
 
+    def read_table_as_dataframe(self, source: DataWarehouseSchema, select_statement: str,
+                                predicates: Optional[List[str]]=None):
+        """
+        Read dataframe (with partitions) by contacting upstream JDBC-reachable source.
+        """
         jdbc_url, dsn_properties = etl.db.extract_dsn(source.dsn, read_only=True)
         df = self.sql_context.read.jdbc(url=jdbc_url,
                                         properties=dsn_properties,
@@ -101,6 +161,64 @@ class SparkExtractor(DatabaseExtractor):
                                         predicates=predicates)
         return df
 
+    def write_partitions(self, source: DataWarehouseSchema, relation: RelationDescription, select_statement: str,
+                         predicates: List[str]) -> None:
+        """
+        Read and write every partition (as defined by its predicate) in its own job, writing into a folder
+        'part-NNNN' below the data folder.  The jobs are submitted concurrently.
+
+        Partitions completed in an earlier attempt (using the same predicates) are skipped.  The success file
+        is written once all partitions are complete.
+
+        Only errors from Spark (or its connection to upstream sources) are considered transient so that
+        the extract of failed partitions may be retried.
+        """
+        from py4j.protocol import Py4JError
+
+        data_prefix = self.data_prefix(relation)
+        if relation.identifier not in self._completed_partitions:
+            # Start from a clean slate so that no partitions from an earlier extract are left behind.
+            self._delete_directory_before_write(relation)
+            self._completed_partitions[relation.identifier] = (select_statement, predicates, set())
+            self._row_counts.pop(relation.identifier, None)
+        completed = self._completed_partitions[relation.identifier][2]
+        pending = [i for i in range(len(predicates)) if i not in completed]
+        if completed:
+            self.logger.info("Skipping %d completed partition(s) of '%s', extracting remaining %d partition(s)",
+                             len(completed), relation.identifier, len(pending))
+
+        def write_partition(i: int) -> None:
+            self.sql_context._sc.setLocalProperty("spark.scheduler.pool", relation.identifier)
+            df = self.read_table_as_dataframe(source, select_statement, [predicates[i]])
+            partition_name = "part-{:04d}".format(i)
+            partition_uri = "{}/{}".format(self._data_uri(relation), partition_name)
+            rows = self.write_dataframe_counting_rows(df, relation, partition_uri)
+            self.record_row_count(relation, partition_name, rows)
+
+        failed = []
+        if pending:
+            # TODO With Python 3.6, we should pass in a thread_name_prefix
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(pending), self.max_partitions)) as executor:
+                futures = {executor.submit(write_partition, i): i for i in pending}
+                for future in concurrent.futures.as_completed(futures):
+                    i = futures[future]
+                    try:
+                        future.result()
+                    except (Py4JError, TransientETLError):
+                        self.logger.warning("Failed to extract partition %d of '%s':", i, relation.identifier,
+                                            exc_info=True)
+                        failed.append(i)
+                    else:
+                        completed.add(i)
+        if failed:
+            raise DataExtractError("failed to extract {:d} of {:d} partition(s) of '{}'".format(
+                len(failed), len(predicates), relation.identifier))
+
+        if self.dry_run:
+            self.logger.info("Dry-run: Skipping writing success file for all partitions of '%s'", relation.identifier)
+        else:
+            etl.s3.upload_empty_object(relation.bucket_name, data_prefix + "/_SUCCESS")
+
     def determine_partitioning(self, conn: connection, relation: RelationDescription,
                                partition_key: str, num_partitions: int) -> List[str]:
         """
@@ -144,11 +262,35 @@ class SparkExtractor(DatabaseExtractor):
         upper_bounds = (row["upper_bound"] for row in rows)
         return [(low, high) for low, high in zip(lower_bounds, upper_bounds)]
 
-    def write_dataframe_as_csv(self, df, relation: RelationDescription) -> None:
+    def _data_uri(self, relation: RelationDescription) -> str:
+        return "s3a://{}/{}".format(relation.bucket_name, self.data_prefix(relation))
+
+    def write_dataframe(self, df, relation: RelationDescription, s3_uri: str) -> None:
+        if relation.extract_format == "parquet":
+            self.write_dataframe_as_parquet(df, relation, s3_uri)
+        else:
+            self.write_dataframe_as_csv(df, relation, s3_uri)
+
+    def write_dataframe_counting_rows(self, df, relation: RelationDescription, s3_uri: str) -> Optional[int]:
+        """
+        Write the dataframe and return the number of rows written (if known), which is used for the stats file.
+
+        Parquet files store their number of rows in the footer so the rows of the committed files are counted
+        from metadata only.  For CSV files, the number of rows is unknown (and the load skips the check of the
+        row count): counting them would mean reading all data again and counting rows on their way to the writer
+        (e.g. with an accumulator) is not reliable since tasks may be retried or run speculatively.
+        """
+        self.write_dataframe(df, relation, s3_uri)
+        if self.dry_run or relation.extract_format != "parquet":
+            return None
+        rows = self.sql_context.read.parquet(s3_uri).count()
+        self.logger.debug("Wrote %d row(s) to '%s'", rows, s3_uri)
+        return rows
+
+    def write_dataframe_as_csv(self, df, relation: RelationDescription, s3_uri: str) -> None:
         """
         Write (partitioned) dataframe to CSV file(s)
         """
-        s3_uri = "s3a://{0.bucket_name}/{0.prefix}/{0.csv_path_name}".format(relation)
         if self.dry_run:
             self.logger.info("Dry-run: Skipping upload to '%s'", s3_uri)
         else:
@@ -166,3 +308,18 @@ class SparkExtractor(DatabaseExtractor):
                 .mode('overwrite') \
                 .options(**write_options) \
                 .csv(s3_uri)
+
+    def write_dataframe_as_parquet(self, df, relation: RelationDescription, s3_uri: str) -> None:
+        """
+        Write (partitioned) dataframe to Parquet file(s)
+
+        Note that COPY maps columns in Parquet files by position so the order of columns must match the table design.
+        """
+        if self.dry_run:
+            self.logger.info("Dry-run: Skipping upload to '%s'", s3_uri)
+        else:
+            self.logger.info("Writing dataframe for '%s' to '%s'", relation.source_path_name, s3_uri)
+            df.write \
+                .mode('overwrite') \
+                .option("compression", "snappy") \
+                .parquet(s3_uri)
@@ -1,17 +1,23 @@
+import gzip
 import logging
 import os.path
+import re
 import shlex
 import subprocess
-from tempfile import NamedTemporaryFile
+from contextlib import closing
+from tempfile import NamedTemporaryFile, TemporaryDirectory
 from typing import Dict, List, Optional
 
+import psycopg2
+
 import etl.config
 import etl.db
 import etl.s3
 from etl.config.dw import DataWarehouseSchema
-from etl.errors import SqoopExecutionError
+from etl.errors import ETLConfigError, SqoopExecutionError
 from etl.extract.database_extractor import DatabaseExtractor
 from etl.relation import RelationDescription
+from etl.text import join_with_quotes
 
 
 class SqoopExtractor(DatabaseExtractor):
@@ -24,9 +30,19 @@ class SqoopExtractor(DatabaseExtractor):
                  max_partitions: int, use_sampling: bool, keep_going: bool, dry_run: bool) -> None:
 
         super().__init__("sqoop", schemas, relations, max_partitions, use_sampling, keep_going, dry_run=dry_run)
+        columnar_sources = sorted(frozenset(relation.source_name for relation in relations
+                                            if schemas[relation.source_name].extract_format != "csv"))
+        if columnar_sources:
+            raise ETLConfigError("Sqoop extractor only supports CSV files but source(s) use columnar format: {}".format(
+                                 join_with_quotes(columnar_sources)))
 
         self.logger = logging.getLogger(__name__)
         self.sqoop_executable = "sqoop"
+        # Small tables are extracted by the local job runner which saves the overhead of a YARN application
+        self.local_mode_max_size = etl.config.get_config_int("arthur_settings.sqoop_local_mode_max_size", 0)
+        # Data files larger than this are split after the extract so that COPY can load them in parallel
+        self.max_data_file_size = etl.config.get_config_int("arthur_settings.max_data_file_size", 0)
+        self._table_sizes = {}  # type: Dict[str, int]
 
         # During Sqoop extraction we write out files to a temp location
         self._sqoop_options_dir = etl.config.etl_tmp_dir("sqoop")
@@ -34,11 +50,47 @@ class SqoopExtractor(DatabaseExtractor):
             self.logger.info("Creating directory '%s' (with mode 750)", self._sqoop_options_dir)
             os.makedirs(self._sqoop_options_dir, mode=0o750, exist_ok=True)
 
+    def options_info(self) -> List[str]:
+        info = super().options_info()
+        info.append("local-mode-max-size={}".format(self.local_mode_max_size))
+        return info
+
+    def use_local_mode_with_table(self, table_size: int) -> bool:
+        """
+        Return True iff the table is small enough to skip partitioning and be extracted by the local job runner.
+        """
+        return 0 < self.local_mode_max_size and table_size <= self.local_mode_max_size
+
+    def extract_source(self, source: DataWarehouseSchema,
+                       relations: List[RelationDescription]) -> List[RelationDescription]:
+        """
+        Fetch sizes of all tables of the source in one go before extracting the relations one by one.
+
+        Tables up to the "small table" size are batched to run in the local job runner (with a single mapper)
+        while larger tables keep their own partitioned MapReduce jobs.  Sizes are only prefetched when the local
+        job runner is enabled.  If that fails, sizes are unknown here and fetched again for each table (where
+        errors are subject to retries and "keep going").
+        """
+        if self.local_mode_max_size:
+            try:
+                self._table_sizes.update(self.fetch_source_table_sizes(source.dsn, relations))
+            except psycopg2.Error as exc:
+                self.logger.warning("Failed to fetch table sizes for source '%s' (%s), will fetch them per table",
+                                    source.name, str(exc).strip())
+            small_tables = [relation for relation in relations
+                            if relation.identifier in self._table_sizes and
+                            self.use_local_mode_with_table(self._table_sizes[relation.identifier])]
+            self.logger.info("Using local job runner for %d of %d relation(s) from source '%s' (max size: %d)",
+                             len(small_tables), len(relations), source.name, self.local_mode_max_size)
+        return super().extract_source(source, relations)
+
     def extract_table(self, source: DataWarehouseSchema, relation: RelationDescription) -> None:
         """
         Run Sqoop for one table; creates the sub-process and all the pretty args for Sqoop.
         """
-        table_size = self.fetch_source_table_size(source.dsn, relation)
+        table_size = self._table_sizes.get(relation.identifier)
+        if table_size is None:
+            table_size = self.fetch_source_table_size(source.dsn, relation)
 
         connection_params_file_path = self.write_connection_params()
         password_file_path = self.write_password_file(source.dsn["password"])
@@ -47,9 +99,11 @@ class SqoopExtractor(DatabaseExtractor):
         options_file = self.write_options_file(args)
         self._delete_directory_before_write(relation)
 
-        self.run_sqoop(options_file)
+        rows = self.run_sqoop(options_file)
+        self.record_row_count(relation, "all", rows)
 
-        prefix = os.path.join(relation.prefix, relation.csv_path_name)
+        prefix = self.data_prefix(relation)
+        self.split_oversized_data_files(relation.bucket_name, prefix)
         self.write_manifest_file(relation, relation.bucket_name, prefix)
 
     def write_password_file(self, password: str) -> str:
@@ -95,7 +149,13 @@ class SqoopExtractor(DatabaseExtractor):
 
         partition_key = relation.find_partition_key()
         select_statement = self.build_sqoop_select(relation, partition_key, table_size)
-        partition_options = self.build_sqoop_partition_options(relation, partition_key, table_size)
+        if self.use_local_mode_with_table(table_size):
+            self.logger.info("Extracting small table '%s' using the local job runner", relation.identifier)
+            generic_options = ["-D", "mapreduce.framework.name=local"]
+            partition_options = ["--num-mappers", "1"]
+        else:
+            generic_options = []
+            partition_options = self.build_sqoop_partition_options(relation, partition_key, table_size)
 
         # Only the paranoid survive ... quote arguments of options, except for --select
         def q(s):
@@ -116,15 +176,15 @@ class SqoopExtractor(DatabaseExtractor):
                 "--null-string", r"'\\N'",
                 "--null-non-string", r"'\\N'",
                 # NOTE Does not work with s3n:  "--delete-target-dir",
-                "--target-dir", '"s3n://{}/{}/{}"'.format(relation.bucket_name,
-                                                          relation.prefix,
-                                                          relation.csv_path_name),
+                "--target-dir", '"s3n://{}/{}"'.format(relation.bucket_name, self.data_prefix(relation)),
                 # NOTE Quoting the select statement (e.g. with shlex.quote) breaks the select in an unSQLy way.
                 "--query", select_statement,
                 # NOTE Embedded newlines are not escaped so we need to remove them.  WAT?
                 "--hive-drop-import-delims",
                 "--compress"]  # The default compression codec is gzip.
 
+        # Generic (Hadoop) options must immediately follow the tool name.
+        args[1:1] = generic_options
         args.extend(partition_options)
         self.logger.debug("Sqoop options are:\n%s", " ".join(args))
         return args
@@ -154,7 +214,7 @@ class SqoopExtractor(DatabaseExtractor):
                 # num_partitions explicitly set in the design file overrides the dynamic determination.
                 num_mappers = min(relation.num_partitions, self.max_partitions)
             else:
-                num_mappers = self.maximize_partitions(table_size)
+                num_mappers = self.align_partitions_with_slices(self.maximize_partitions(table_size), self.num_slices)
 
             if num_mappers > 1:
                 return ["--split-by", quoted_key_arg, "--num-mappers", str(num_mappers)]
@@ -178,22 +238,91 @@ class SqoopExtractor(DatabaseExtractor):
             self.logger.info("Wrote Sqoop options to '%s'", options_file_path)
         return options_file_path
 
-    def _delete_directory_before_write(self, relation: RelationDescription) -> None:
+    @staticmethod
+    def number_of_pieces(file_size: int, max_file_size: int, num_slices: Optional[int]) -> int:
+        """
+        Return into how many pieces a file must be split so that no piece is larger than the max file size.
+        The number is rounded up to a multiple of the number of slices (if known).
+
+        >>> SqoopExtractor.number_of_pieces(100, 200, 16)
+        1
+        >>> SqoopExtractor.number_of_pieces(300, 200, None)
+        2
+        >>> SqoopExtractor.number_of_pieces(300, 200, 16)
+        16
+        >>> SqoopExtractor.number_of_pieces(3300, 200, 16)
+        32
+        """
+        if file_size <= max_file_size:
+            return 1
+        num_pieces = -(-file_size // max_file_size)
+        if num_slices:
+            num_pieces = -(-num_pieces // num_slices) * num_slices
+        return num_pieces
+
+    def split_oversized_data_files(self, bucket_name: str, prefix: str) -> None:
         """
-        Need to first delete data directory since Sqoop won't overwrite (and can't delete).
+        Split data files that are larger than the max data file size into smaller files.
+
+        Sqoop produces a single file per mapper so unpartitioned tables end up in one (possibly huge)
+        file which would be loaded by just one slice.  Since Sqoop drops embedded newlines,
+        the lines in the file are distributed round-robin over the new (gzipped) files.
         """
-        csv_prefix = os.path.join(relation.prefix, relation.csv_path_name)
-        deletable = sorted(etl.s3.list_objects_for_prefix(relation.bucket_name, csv_prefix))
-        if deletable:
+        if not self.max_data_file_size:
+            return
+        data_files = [(key, size) for key, size in etl.s3.list_objects_with_size_for_prefix(bucket_name, prefix)
+                      if "part" in key and key.endswith(".gz")]
+        for key, size in data_files:
+            num_pieces = self.number_of_pieces(size, self.max_data_file_size, self.num_slices)
+            if num_pieces == 1:
+                continue
             if self.dry_run:
-                self.logger.info("Dry-run: Skipping deletion of %d existing CSV file(s) in 's3://%s/%s'",
-                                 len(deletable), relation.bucket_name, csv_prefix)
+                self.logger.info("Dry-run: Skipping splitting 's3://%s/%s' (%d bytes) into %d files",
+                                 bucket_name, key, size, num_pieces)
             else:
-                etl.s3.delete_objects(relation.bucket_name, deletable, wait=True)
+                self.split_data_file(bucket_name, key, num_pieces)
+
+    def split_data_file(self, bucket_name: str, object_key: str, num_pieces: int) -> None:
+        """
+        Split the gzipped file into the number of pieces (next to the original file) and delete the original.
+        """
+        self.logger.info("Splitting 's3://%s/%s' into %d files", bucket_name, object_key, num_pieces)
+        base_name = object_key[:-len(".gz")]
+        with TemporaryDirectory(dir=self._sqoop_options_dir, prefix="split_") as temp_dir:
+            file_names = [os.path.join(temp_dir, "piece-{:04d}.gz".format(i)) for i in range(num_pieces)]
+            pieces = [gzip.open(file_name, "wb") for file_name in file_names]
+            try:
+                with closing(etl.s3.get_s3_object_content(bucket_name, object_key)) as content:
+                    with gzip.GzipFile(fileobj=content) as lines:
+                        for i, line in enumerate(lines):
+                            pieces[i % num_pieces].write(line)
+            finally:
+                for piece in pieces:
+                    piece.close()
+            uploader = etl.s3.S3Uploader(bucket_name)
+            for i, file_name in enumerate(file_names):
+                uploader(file_name, "{}-{:04d}.gz".format(base_name, i))
+        etl.s3.delete_objects(bucket_name, [object_key], wait=True)
+
+    @staticmethod
+    def parse_retrieved_records(output: str) -> Optional[int]:
+        """
+        Return the number of records that Sqoop reported in its log as retrieved (or None if not found).
+
+        >>> SqoopExtractor.parse_retrieved_records("INFO mapreduce.ImportJobBase: Retrieved 1234 records.")
+        1234
+        >>> SqoopExtractor.parse_retrieved_records("INFO mapreduce.ImportJobBase: Transferred 0 bytes") is None
+        True
+        """
+        match = re.search(r"\bRetrieved (\d+) records\b", output)
+        if match:
+            return int(match.group(1))
+        return None
 
-    def run_sqoop(self, options_file_path: str):
+    def run_sqoop(self, options_file_path: str) -> Optional[int]:
         """
         Run Sqoop in a sub-process with the help of the given options file.
+        Return the number of records retrieved (if Sqoop told us).
         """
         args = [self.sqoop_executable, "--options-file", options_file_path]
         cmdline = " ".join(map(shlex.quote, args))
@@ -213,6 +342,8 @@ class SqoopExtractor(DatabaseExtractor):
                 # TODO: Be more intelligent about detecting whether certain Sqoop errors are retryable, instead of
                 # assuming they all are.
                 raise SqoopExecutionError("Sqoop failed with return code %s" % sqoop.returncode)
+            return self.parse_retrieved_records(str(err) + str(out))
+        return None
 
 
 class FakeSqoopExtractor(SqoopExtractor):
@@ -1,10 +1,13 @@
 import logging
 import os.path
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
+import etl.s3
 from etl.config.dw import DataWarehouseSchema
+from etl.errors import DataExtractError
 from etl.extract.extractor import Extractor
 from etl.relation import RelationDescription
+from etl.text import join_with_quotes
 
 
 class StaticExtractor(Extractor):
@@ -14,11 +17,17 @@ class StaticExtractor(Extractor):
     """
     # TODO Describe expected file paths, existence of "_SUCCESS" file
 
+    # Writing a manifest is mostly waiting for S3, so we can write many of them at the same time.
+    MAX_CONCURRENT_MANIFESTS = 8
+
     def __init__(self, schemas: Dict[str, DataWarehouseSchema], relations: List[RelationDescription],
                  keep_going: bool, dry_run: bool) -> None:
         # For static sources, we go straight to failure when the success file does not exist
         super().__init__("static", schemas, relations, keep_going, needs_to_wait=False, dry_run=dry_run)
         self.logger = logging.getLogger(__name__)
+        self.max_concurrent_tables = self.MAX_CONCURRENT_MANIFESTS
+        # Objects (keys and sizes) of every source by location of a relation's data files, see extract_source()
+        self._listings = {}  # type: Dict[str, Dict[str, List[Tuple[str, int]]]]
 
     @staticmethod
     def _current_location(source: DataWarehouseSchema, relation: RelationDescription):
@@ -30,6 +39,62 @@ class StaticExtractor(Extractor):
                 'bucket_name': source.s3_bucket,
                 'object_prefix': StaticExtractor._current_location(source, relation)}
 
+    def list_source_objects(self, source: DataWarehouseSchema,
+                            relations: List[RelationDescription]) -> Dict[str, List[Tuple[str, int]]]:
+        """
+        List the objects of all the given relations with one listing of the source's bucket (instead of
+        a listing per relation) and return the keys and sizes grouped by the location of each relation.
+        """
+        locations = [self._current_location(source, relation) for relation in relations]
+        # Make sure that we list whole "directories" and that "foo/csv" does not match "foo/csv_backup".
+        common_prefix = os.path.commonprefix([location + "/" for location in locations])
+        common_prefix = common_prefix[:common_prefix.rfind("/") + 1]
+        grouped = {location: [] for location in locations}  # type: Dict[str, List[Tuple[str, int]]]
+        num_objects = 0
+        for key, size in etl.s3.list_objects_with_size_for_prefix(source.s3_bucket, common_prefix):
+            num_objects += 1
+            # Data files may be in sub-directories below the location of the relation.
+            location = key[:key.rfind("/")]
+            while location and location not in grouped:
+                location = location[:location.rfind("/")] if "/" in location else ""
+            if location:
+                grouped[location].append((key, size))
+        self.logger.info("Found %d object(s) in 's3://%s/%s' for %d relation(s) of source '%s'",
+                         num_objects, source.s3_bucket, common_prefix, len(relations), source.name)
+        return grouped
+
+    def check_manifests_exist(self, relations: List[RelationDescription]) -> None:
+        """
+        Make sure that the manifests of all the given relations exist, using one listing per bucket.
+        """
+        manifest_names = {}  # type: Dict[str, List[str]]
+        for relation in relations:
+            manifest_names.setdefault(relation.bucket_name, []).append(relation.manifest_file_name)
+        for bucket_name, object_keys in manifest_names.items():
+            common_prefix = os.path.commonprefix(object_keys)
+            found = set(etl.s3.list_objects_for_prefix(bucket_name, common_prefix))
+            missing = [key for key in object_keys if key not in found]
+            if missing:
+                raise DataExtractError("Missing {:d} manifest(s) in 's3://{}': {}".format(
+                    len(missing), bucket_name, join_with_quotes(missing)))
+        self.logger.info("Found all %d manifest(s) that were written", len(relations))
+
+    def extract_source(self, source: DataWarehouseSchema,
+                       relations: List[RelationDescription]) -> List[RelationDescription]:
+        """
+        List all data files of the source at once, write the manifests concurrently based on that listing,
+        and finally check that all manifests are present.
+        """
+        self._listings[source.name] = self.list_source_objects(source, relations)
+        try:
+            failed = super().extract_source(source, relations)
+        finally:
+            del self._listings[source.name]
+        succeeded = [relation for relation in relations if relation not in failed]
+        if succeeded and not self.dry_run:
+            self.check_manifests_exist(succeeded)
+        return failed
+
     def extract_table(self, source: DataWarehouseSchema, relation: RelationDescription):
         """
         Render the S3 path template for a given source to check for data files before writing
@@ -37,4 +102,8 @@ class StaticExtractor(Extractor):
         """
         bucket = source.s3_bucket
         prefix = self._current_location(source, relation)
-        self.write_manifest_file(relation, bucket, prefix)
+        listing = self._listings.get(source.name, {}).get(prefix)
+        if listing is None:
+            self.write_manifest_file(relation, bucket, prefix)
+        else:
+            self.write_manifest_file(relation, bucket, prefix, listing=listing, wait_for_manifest=False)
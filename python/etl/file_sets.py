@@ -5,7 +5,9 @@ The basic location of a file depends on the data source and can be one of:
 .../schemas/{source_or_schema_name}/{source_schema_name}-{table_name}.yaml -- for table design files
 .../schemas/{schema_name}/{source_schema_name}-{table_name}.sql -- for queries for CTAS or views
 .../data/{source_name}/{source_schema_name}-{table_name}.manifest -- for a manifest of data files
+.../data/{source_name}/{source_schema_name}-{table_name}.stats -- for statistics (like row counts) of the extract
 .../data/{source_name}/{source_schema_name}-{table_name}/csv/part-*.gz -- for the data files themselves.
+.../data/{source_name}/{source_schema_name}-{table_name}/parquet/part-*.parquet -- for data files in Parquet format.
 
 If the files are in S3, then the start of the path is always s3://{bucket_name}/{prefix}/...
 
@@ -123,6 +125,10 @@ class TableFileSet:
     def csv_path_name(self):
         return os.path.join("data", self.source_path_name, "csv")
 
+    @property
+    def parquet_path_name(self):
+        return os.path.join("data", self.source_path_name, "parquet")
+
     def norm_path(self, filename: str) -> str:
         """
         Return "normalized" path based on filename of design file or SQL file.
@@ -231,7 +237,7 @@ def _find_matching_files_from(iterable, pattern, return_success_file=False):
     file_names_re = re.compile(r"""(?:^schemas|/schemas|^data|/data)
                                    /(?P<source_name>\w+)
                                    /(?P<schema_name>\w+)-(?P<table_name>\w+)
-                                   (?:(?P<file_ext>.yaml|.sql|.manifest|/csv/(:?part-.*(:?\.gz)?|_SUCCESS)))$
+                                   (?:(?P<file_ext>.yaml|.sql|.manifest|.stats|/(?:csv|parquet)/(?:v\d{14}-\w+/)?(:?part-.*(:?\.gz)?|_SUCCESS)))$
                                """, re.VERBOSE)
 
     for filename in iterable:
@@ -241,11 +247,11 @@ def _find_matching_files_from(iterable, pattern, return_success_file=False):
             target_table_name = TableName(values['source_name'], values['table_name'])
             if pattern.match(target_table_name):
                 file_ext = values["file_ext"]
-                if file_ext in [".yaml", ".sql", ".manifest"]:
+                if file_ext in [".yaml", ".sql", ".manifest", ".stats"]:
                     values["file_type"] = file_ext[1:]
                 elif file_ext.endswith("_SUCCESS"):
                     values["file_type"] = "success"
-                elif file_ext.startswith("/csv"):
+                elif file_ext.startswith(("/csv", "/parquet")):
                     values["file_type"] = "data"
                 # E.g. when deleting files out of a folder we want to know about the /csv/_SUCCESS file.
                 if return_success_file or values["file_type"] != "success":
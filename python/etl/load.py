@@ -39,17 +39,19 @@ These are the general pre-requisites:
 
 import concurrent.futures
 import logging
+import os.path
 import re
 import time
 import threading
 import queue
-from contextlib import closing
+from contextlib import closing, contextmanager
 from datetime import datetime, timedelta
 from calendar import timegm
 from functools import partial
-from typing import Any, Dict, List, Optional, Set
+from typing import Any, Dict, List, Optional, Set, Tuple
 
-from psycopg2.extensions import connection  # only for type annotation
+import simplejson as json
+from psycopg2.extensions import TRANSACTION_STATUS_INERROR, connection
 
 import etl
 import etl.data_warehouse
@@ -57,10 +59,12 @@ import etl.monitor
 import etl.db
 import etl.design.redshift
 import etl.relation
+import etl.s3
+import etl.wlm
 from etl.config.dw import DataWarehouseSchema
-from etl.errors import (ETLRuntimeError, FailedConstraintError, MissingManifestError, RelationDataError,
-                        RelationConstructionError, RequiredRelationLoadError, UpdateTableError,
-                        MissingExtractEventError, retry)
+from etl.errors import (ETLRuntimeError, FailedConstraintError, InvalidArgumentError, MissingManifestError,
+                        RelationDataError, RelationConstructionError, RequiredRelationLoadError, RowCountMismatchError,
+                        UpdateTableError, MissingExtractEventError, retry)
 from etl.names import TableName, TableSelector, TempTableName
 from etl.text import join_column_list, join_with_quotes
 from etl.relation import RelationDescription
@@ -115,9 +119,9 @@ class LoadableRelation:
         >>> import etl.file_sets
         >>> import etl.config
         >>> from collections import namedtuple
-        >>> MockDWConfig = namedtuple('MockDWConfig', ['schemas'])
+        >>> MockDWConfig = namedtuple('MockDWConfig', ['schemas', 'external_schema_names'])
         >>> MockSchema = namedtuple('MockSchema', ['name'])
-        >>> etl.config._dw_config = MockDWConfig(schemas=[MockSchema(name='c')])
+        >>> etl.config._dw_config = MockDWConfig(schemas=[MockSchema(name='c')], external_schema_names=frozenset())
         >>> fs = etl.file_sets.TableFileSet(TableName("a", "b"), TableName("c", "b"), None)
         >>> relation = LoadableRelation(RelationDescription(fs), {}, skip_copy=True)
         >>> "As delimited identifier: {:s}, as string: {:x}".format(relation, relation)
@@ -140,10 +144,13 @@ class LoadableRelation:
                  use_staging=False, skip_copy=False, in_transaction=False) -> None:
         self._relation_description = relation
         self.info = info
-        self.skip_copy = skip_copy or relation.is_view_relation
+        self.skip_copy = skip_copy or relation.is_view_relation or relation.is_external_relation
         self.failed = False
         self.use_staging = use_staging
         self.in_transaction = in_transaction
+        # Statements to alter the table in place instead of re-creating it (and the columns to backfill)
+        self.alter_stmts = None  # type: Optional[List[str]]
+        self.new_columns = []  # type: List[str]
 
     def monitor(self):
         return etl.monitor.Monitor(**self.info)
@@ -155,8 +162,9 @@ class LoadableRelation:
 
     @property
     def target_table_name(self):
-        # Load context changes our target table
-        if self.use_staging:
+        # Load context changes our target table (but tables in external schemas are never in staging)
+        external_schemas = etl.config.get_dw_config().external_schema_names
+        if self.use_staging and self._relation_description.target_table_name.schema not in external_schemas:
             return self._relation_description.target_table_name.as_staging_table_name()
         else:
             return self._relation_description.target_table_name
@@ -187,8 +195,11 @@ class LoadableRelation:
     def query_stmt(self) -> str:
         stmt = self._relation_description.query_stmt
         if self.use_staging:
-            # Rewrite the query to use staging schemas:
+            # Rewrite the query to use staging schemas (except for external schemas):
+            external_schemas = etl.config.get_dw_config().external_schema_names
             for dependency in self.dependencies:
+                if dependency.schema in external_schemas:
+                    continue
                 staging_dependency = dependency.as_staging_table_name()
                 stmt = re.sub(r'\b' + dependency.identifier + r'\b', staging_dependency.identifier, stmt)
         return stmt
@@ -222,7 +233,7 @@ class LoadableRelation:
         for i, relation in enumerate(relations):
             target = relation.target_table_name
             source = dict(bucket_name=relation.bucket_name)
-            if relation.is_view_relation or relation.is_ctas_relation:
+            if relation.is_transformation:
                 source['object_key'] = relation.sql_file_name
             else:
                 source['object_key'] = relation.manifest_file_name
@@ -273,19 +284,61 @@ def create_table(conn: connection, relation: LoadableRelation, table_name: Optio
 def create_view(conn: connection, relation: LoadableRelation, dry_run=False) -> None:
     """
     Create VIEW using the relation's query.
+
+    Late-binding views are created WITH NO SCHEMA BINDING unless they are created in staging schemas, where
+    the query references the staging schemas by name (which would no longer exist after promotion).
+    Views over external tables must always be late-binding views.
     """
     view_name = relation.target_table_name
     columns = join_column_list(relation.unquoted_columns)
     stmt = """CREATE VIEW {} (\n{}\n) AS\n{}""".format(view_name, columns, relation.query_stmt)
+    if relation.is_late_binding_view and (relation.has_external_dependencies or not relation.use_staging):
+        stmt += "\nWITH NO SCHEMA BINDING"
     etl.db.run(conn, "Creating view {:x}".format(relation), stmt, dry_run=dry_run)
 
 
+def create_external_table(conn: connection, relation: LoadableRelation, dry_run=False) -> None:
+    """
+    Create EXTERNAL TABLE over the data files of the relation's upstream (static) source.
+    """
+    source = relation.schema_config
+    location = "s3://{}/{}/".format(source.s3_bucket, os.path.join(source.s3_path_prefix, relation.csv_path_name))
+    stmt = etl.design.redshift.build_external_table_ddl(relation.table_design, relation.target_table_name, location)
+    etl.db.run(conn, "Creating external table {:x}".format(relation), stmt, dry_run=dry_run)
+
+
+def create_materialized_view(conn: connection, relation: LoadableRelation, dry_run=False) -> None:
+    """
+    Create MATERIALIZED VIEW using the relation's query (which also fills it).
+
+    Materialized views are never created in staging schemas: Redshift can no longer refresh a materialized view
+    after the schemas of its base tables were renamed (see defer_materialized_views).
+    """
+    stmt = etl.design.redshift.build_materialized_view_ddl(relation.table_design, relation.target_table_name,
+                                                           relation.query_stmt)
+    etl.db.run(conn, "Creating materialized view {:x}".format(relation), stmt, dry_run=dry_run)
+
+
+def refresh_materialized_view(conn: connection, relation: LoadableRelation, dry_run=False) -> None:
+    """
+    Bring materialized view up-to-date, which Redshift may do incrementally.
+    """
+    stmt = "REFRESH MATERIALIZED VIEW {}".format(relation)
+    etl.db.run(conn, "Refreshing materialized view {:x}".format(relation), stmt, dry_run=dry_run)
+
+
 def drop_relation_if_exists(conn: connection, relation: LoadableRelation, dry_run=False) -> None:
     """
     Run either DROP VIEW or DROP TABLE depending on type of existing relation. It's ok if the relation
     doesn't already exist.
     """
     try:
+        if relation.is_external_relation:
+            # External tables are not in pg_class and other relations can only depend on them with late binding.
+            if etl.db.external_table_exists(conn, relation.target_table_name.schema, relation.target_table_name.table):
+                stmt = """DROP TABLE {}""".format(relation)
+                etl.db.run(conn, "Dropping external table {:x}".format(relation), stmt, dry_run=dry_run)
+            return
         kind = etl.db.relation_kind(conn, relation.target_table_name.schema, relation.target_table_name.table)
         if kind is not None:
             stmt = """DROP {} {} CASCADE""".format(kind, relation)
@@ -296,15 +349,21 @@ def drop_relation_if_exists(conn: connection, relation: LoadableRelation, dry_ru
 
 def create_or_replace_relation(conn: connection, relation: LoadableRelation, dry_run=False) -> None:
     """
-    Create fresh VIEW or TABLE and grant groups access permissions.
+    Create fresh VIEW, MATERIALIZED VIEW, or TABLE and grant groups access permissions.
+    (Access to EXTERNAL TABLEs is granted by granting usage on their external schema.)
 
     Note that we cannot use CREATE OR REPLACE statements since we want to allow going back and forth
     between VIEW and TABLE (or in table design terms: VIEW and CTAS).
     """
     try:
         drop_relation_if_exists(conn, relation, dry_run=dry_run)
+        if relation.is_external_relation:
+            create_external_table(conn, relation, dry_run=dry_run)
+            return
         if relation.is_view_relation:
             create_view(conn, relation, dry_run=dry_run)
+        elif relation.is_matview_relation:
+            create_materialized_view(conn, relation, dry_run=dry_run)
         else:
             create_table(conn, relation, dry_run=dry_run)
         if not relation.use_staging:
@@ -351,11 +410,14 @@ def delete_whole_table(conn: connection, table: LoadableRelation, dry_run=False)
     etl.db.run(conn, "Deleting all rows in table {:x}".format(table), stmt, dry_run=dry_run)
 
 
-def copy_data(conn: connection, relation: LoadableRelation, dry_run=False):
+def copy_data(conn: connection, relation: LoadableRelation, table_name: Optional[TableName]=None, dry_run=False):
     """
     Load data into table in the data warehouse using the COPY command.
-    A manifest for the CSV files must be provided -- it is an error if the manifest is missing.
+    A manifest for the CSV (or Parquet) files must be provided -- it is an error if the manifest is missing.
+    (The table name may be overridden to load into a temp table.)
     """
+    if table_name is None:
+        table_name = relation.target_table_name
     aws_iam_role = str(etl.config.get_config_value("object_store.iam_role"))
     s3_uri = "s3://{}/{}".format(relation.bucket_name, relation.manifest_file_name)
 
@@ -367,13 +429,46 @@ def copy_data(conn: connection, relation: LoadableRelation, dry_run=False):
             raise MissingManifestError("relation '{}' is missing manifest file '{}'".format(
                                            relation.identifier, s3_uri))
     copy_func = partial(etl.design.redshift.copy_from_uri,
-                        conn, relation.target_table_name, relation.unquoted_columns, s3_uri, aws_iam_role,
-                        need_compupdate=relation.is_missing_encoding, dry_run=dry_run)
+                        conn, table_name, relation.unquoted_columns, s3_uri, aws_iam_role,
+                        need_compupdate=relation.is_missing_encoding, data_format=relation.extract_format,
+                        dry_run=dry_run)
 
+    # The number of extracted rows must be taken from the same manifest that COPY is about to use.
+    extracted_rows = fetch_extracted_row_count(relation) if relation.has_manifest else None
     if relation.in_transaction:
-        copy_func()
+        row_count = copy_func()
     else:
-        retry(etl.config.get_config_int("arthur_settings.copy_data_retries"), copy_func, logger)
+        row_count = retry(etl.config.get_config_int("arthur_settings.copy_data_retries"), copy_func, logger,
+                          base_delay=etl.config.get_config_int("arthur_settings.retry_base_delay", 5),
+                          max_delay=etl.config.get_config_int("arthur_settings.retry_max_delay", 300),
+                          factor=etl.config.get_config_int("arthur_settings.retry_backoff_factor", 5))
+    if row_count is not None:
+        verify_row_count(relation, row_count, extracted_rows)
+
+
+def fetch_extracted_row_count(relation: LoadableRelation) -> Optional[int]:
+    """
+    Return the number of extracted rows which the extract added to the manifest (if it is known).
+    """
+    with closing(etl.s3.get_s3_object_content(relation.bucket_name, relation.manifest_file_name)) as content:
+        manifest = json.load(content)
+    return manifest.get("meta", {}).get("record_count")
+
+
+def verify_row_count(relation: LoadableRelation, row_count: int, extracted_rows: Optional[int]) -> None:
+    """
+    Raise a RowCountMismatchError if the number of rows loaded differs from the number of rows extracted.
+
+    The number of extracted rows is taken from the manifest of the extract (and matches the stats file).
+    If the manifest does not have a row count, then the check is skipped.
+    """
+    if extracted_rows is None:
+        logger.info("Number of extracted rows is unknown for {:x}, skipping check of row count".format(relation))
+    elif extracted_rows != row_count:
+        raise RowCountMismatchError("relation {:x} has {:d} row(s) loaded but {:d} row(s) were extracted".format(
+                                    relation, row_count, extracted_rows))
+    else:
+        logger.info("Verified row count of {:x} matches extract ({:d} rows)".format(relation, row_count))
 
 
 def insert_from_query(conn: connection, relation: LoadableRelation,
@@ -433,28 +528,132 @@ def create_missing_dimension_row(columns: List[dict]) -> List[str]:
     return na_values_row
 
 
-def load_ctas_using_temp_table(conn: connection, relation: LoadableRelation, dry_run=False) -> None:
+def find_unique_key(table_design: Dict[str, Any]) -> Optional[List[str]]:
+    """
+    Return columns of the first primary key, natural key, or unique constraint which doesn't use
+    the identity column (so that rows may be matched against rows from the table's query or source).
+
+    >>> find_unique_key({"columns": [{"name": "id", "identity": True}], "constraints": [{"primary_key": ["id"]}]})
+    >>> find_unique_key({"columns": [{"name": "id"}], "constraints": [{"unique": ["id"]}]})
+    ['id']
+    """
+    identity_columns = {column["name"] for column in table_design["columns"] if column.get("identity")}
+    for constraint_type in ("primary_key", "natural_key", "unique"):
+        for constraint in table_design.get("constraints", []):
+            key_columns = constraint.get(constraint_type)
+            if key_columns and not identity_columns.intersection(key_columns):
+                return list(key_columns)
+    return None
+
+
+def find_stable_ordering(table_design: Dict[str, Any]) -> List[str]:
+    """
+    Return columns by which to order the rows of a CTAS so that keys may be generated with ROW_NUMBER().
+    This is a unique key (like the natural key) if there is one, otherwise all (non-identity) columns.
+
+    >>> columns = [{"name": "id", "identity": True}, {"name": "nm"}, {"name": "mail"}, {"name": "x", "skipped": True}]
+    >>> find_stable_ordering({"columns": columns})
+    ['nm', 'mail']
+    >>> constraints = [{"primary_key": ["id"]}, {"natural_key": ["mail"]}]
+    >>> find_stable_ordering({"columns": columns, "constraints": constraints})
+    ['mail']
+    """
+    key_columns = find_unique_key(table_design)
+    if key_columns is not None:
+        return key_columns
+    return [column["name"] for column in table_design["columns"]
+            if not (column.get("skipped") or column.get("identity"))]
+
+
+def load_ctas_using_row_numbers(conn: connection, relation: LoadableRelation, dry_run=False) -> None:
     """
-    Run query to fill temp table, then copy data (possibly along with missing dimension) into CTAS relation.
+    Run query to fill CTAS relation in a single pass where the identity column is filled in using ROW_NUMBER()
+    over a stable ordering (possibly along with a missing dimension row which has key 0).
+
+    The identity column starts at 1 just like the IDENTITY(1, 1) column we used to have in a temp table.
+    """
+    ordering = join_column_list(find_stable_ordering(relation.table_design))
+    select_list = []
+    for column in relation.table_design["columns"]:
+        if column.get("skipped"):
+            continue
+        elif column.get("identity"):
+            select_list.append('ROW_NUMBER() OVER (ORDER BY {}) AS "{}"'.format(ordering, column["name"]))
+        else:
+            select_list.append('"{}"'.format(column["name"]))
+
+    stmt = "SELECT {}\nFROM (\n{}\n) AS ctas_query".format(", ".join(select_list), relation.query_stmt)
+    if relation.target_table_name.table.startswith("dim_"):
+        missing_dimension = create_missing_dimension_row(relation.table_design["columns"])
+        stmt += "\nUNION ALL SELECT {}".format(", ".join(missing_dimension))
+
+    insert_from_query(conn, relation, query_stmt=stmt, dry_run=dry_run)
+
+
+def backfill_columns(conn: connection, relation: LoadableRelation, dry_run=False) -> None:
     """
+    Fill in the values of new columns by matching rows on a unique key with rows from the query (for CTAS)
+    or from the data files (loaded into a temp table for tables from upstream sources).
+    If there's no such key, then all rows are replaced instead.
+    """
+    key_columns = find_unique_key(relation.table_design)
+    if key_columns is None or set(key_columns).intersection(relation.new_columns):
+        logger.info("Found no key to backfill new column(s) in {:x}, reloading all rows instead".format(relation))
+        delete_whole_table(conn, relation, dry_run=dry_run)
+        update_table(conn, relation, dry_run=dry_run)
+        return
+
+    assignments = ", ".join('"{0}" = backfill."{0}"'.format(column) for column in relation.new_columns)
+    condition = " AND ".join('{0}."{1}" = backfill."{1}"'.format(relation, column) for column in key_columns)
+    stmt_template = "UPDATE {table} SET {assignments}\nFROM {source} AS backfill\nWHERE {condition}"
+    message = "Backfilling {:d} column(s) in {:x}".format(len(relation.new_columns), relation)
+    if relation.is_ctas_relation:
+        source = "(\n{}\n)".format(relation.query_stmt)
+        stmt = stmt_template.format(table=relation, assignments=assignments, source=source, condition=condition)
+        etl.db.run(conn, message, stmt, dry_run=dry_run)
+        return
+
     temp_name = TempTableName.for_table(relation.target_table_name)
     create_table(conn, relation, table_name=temp_name, dry_run=dry_run)
     try:
-        temp_columns = [column["name"] for column in relation.table_design["columns"]
-                        if not (column.get("skipped") or column.get("identity"))]
-        insert_from_query(conn, relation, table_name=temp_name, columns=temp_columns, dry_run=dry_run)
-
-        inner_stmt = "SELECT {} FROM {}".format(join_column_list(relation.unquoted_columns), temp_name)
-        if relation.target_table_name.table.startswith("dim_"):
-            missing_dimension = create_missing_dimension_row(relation.table_design["columns"])
-            inner_stmt += "\nUNION ALL SELECT {}".format(", ".join(missing_dimension))
-
-        insert_from_query(conn, relation, query_stmt=inner_stmt, dry_run=dry_run)
+        copy_data(conn, relation, table_name=temp_name, dry_run=dry_run)
+        stmt = stmt_template.format(table=relation, assignments=assignments, source=temp_name, condition=condition)
+        etl.db.run(conn, message, stmt, dry_run=dry_run)
     finally:
         stmt = "DROP TABLE {}".format(temp_name)
         etl.db.run(conn, "Dropping temporary table for {:x}".format(relation), stmt, dry_run=dry_run)
 
 
+def alter_table(conn: connection, relation: LoadableRelation, dry_run=False) -> None:
+    """
+    Evolve the table in place using ALTER TABLE statements, then only backfill new columns.
+    (Without new columns, the rows are replaced to pick up changes in the query or in the data.)
+    """
+    assert relation.alter_stmts is not None, "missing statements to alter table"
+    try:
+        for stmt in relation.alter_stmts:
+            etl.db.run(conn, "Altering table {:x}".format(relation), stmt, dry_run=dry_run)
+    except Exception as exc:
+        raise RelationConstructionError(exc) from exc
+
+    if relation.skip_copy:
+        logger.info("Skipping loading data into {:x}".format(relation))
+    elif relation.failed:
+        logger.info("Bypassing already failed relation {:x}".format(relation))
+    else:
+        if relation.new_columns:
+            try:
+                backfill_columns(conn, relation, dry_run=dry_run)
+                analyze(conn, relation, dry_run=dry_run)
+            except Exception as exc:
+                raise UpdateTableError(exc) from exc
+        else:
+            delete_whole_table(conn, relation, dry_run=dry_run)
+            update_table(conn, relation, dry_run=dry_run)
+        if relation.schema_config.verify_constraints:
+            verify_constraints(conn, relation, dry_run=dry_run)
+
+
 def analyze(conn: connection, table: LoadableRelation, dry_run=False) -> None:
     """
     Update table statistics.
@@ -559,9 +758,11 @@ def update_table(conn: connection, relation: LoadableRelation, dry_run=False) ->
 
     1. For tables backed by upstream sources, data is copied in.
     2. If the CTAS doesn't have a key (no identity column), then values are inserted straight from a view.
-    3. If a column is marked as being a key (identity is true), then a temporary table is built from
-    the query and then copied into the "CTAS" relation. If the name of the relation starts with "dim_",
-    then it's assumed to be a dimension and a row with missing values (mostly 0, false, etc.) is added as well.
+    3. If a column is marked as being a key (identity is true), then the values of the key are generated
+    using ROW_NUMBER() while inserting the rows from the query into the "CTAS" relation. If the name of the relation
+    starts with "dim_", then it's assumed to be a dimension and a row with missing values (mostly 0, false, etc.)
+    is added as well.
+    4. Materialized views are refreshed (instead of deleting and inserting rows).
 
     Finally, we run an ANALYZE statement to update table statistics (unless we're updating the table
     within a transaction since -- we've been having problems with locks so skip the ANALYZE for updates).
@@ -569,9 +770,12 @@ def update_table(conn: connection, relation: LoadableRelation, dry_run=False) ->
     try:
         if relation.is_ctas_relation:
             if relation.has_identity_column:
-                load_ctas_using_temp_table(conn, relation, dry_run=dry_run)
+                load_ctas_using_row_numbers(conn, relation, dry_run=dry_run)
             else:
                 load_ctas_directly(conn, relation, dry_run=dry_run)
+        elif relation.is_matview_relation:
+            refresh_materialized_view(conn, relation, dry_run=dry_run)
+            return
         else:
             copy_data(conn, relation, dry_run=dry_run)
         if not relation.in_transaction:
@@ -590,9 +794,14 @@ def build_one_relation(conn: connection, relation: LoadableRelation, dry_run=Fal
     """
     with relation.monitor():
 
+        # Tables which were evolved in place keep their rows (except for new columns)
+        if relation.alter_stmts is not None:
+            alter_table(conn, relation, dry_run=dry_run)
+            return
+
         # Step 1 -- clear out existing data (by deletion or by re-creation)
         if relation.in_transaction:
-            if not relation.is_view_relation:
+            if not (relation.is_view_relation or relation.is_matview_relation or relation.is_external_relation):
                 delete_whole_table(conn, relation, dry_run=dry_run)
         else:
             create_or_replace_relation(conn, relation, dry_run=dry_run)
@@ -600,41 +809,88 @@ def build_one_relation(conn: connection, relation: LoadableRelation, dry_run=Fal
         # Step 2 -- load data (and verify)
         if relation.is_view_relation:
             pass
+        elif relation.is_matview_relation and not relation.in_transaction:
+            logger.info("Materialized view {:x} was filled when it was created".format(relation))
+        elif relation.is_external_relation:
+            logger.info("External table {:x} reads data files directly, nothing to load".format(relation))
         elif relation.skip_copy:
             logger.info("Skipping loading data into {:x}".format(relation))
         elif relation.failed:
             logger.info("Bypassing already failed relation {:x}".format(relation))
         else:
             update_table(conn, relation, dry_run=dry_run)
-            verify_constraints(conn, relation, dry_run=dry_run)
+            if relation.schema_config.verify_constraints:
+                verify_constraints(conn, relation, dry_run=dry_run)
+            else:
+                logger.info("Skipping check of constraints for {:x} from trusted source".format(relation))
 
 
-def build_one_relation_using_pool(pool, relation: LoadableRelation, dry_run=False) -> None:
-    conn = pool.getconn()
-    conn.set_session(autocommit=True, readonly=dry_run)
-    try:
-        build_one_relation(conn, relation, dry_run=dry_run)
-    except Exception as exc:
-        # Add (some) exception information close to when it happened
-        message = str(exc).split('\n', 1)[0]
-        if relation.is_required:
-            logger.error("Exception information for required relation {:x}: {}".format(relation, message))
-        else:
-            logger.warning("Exception information for relation {:x}: {}".format(relation, message))
-        pool.putconn(conn, close=True)
-        raise
-    else:
-        pool.putconn(conn, close=False)
+class BusyBackends:
+    """
+    Keep track of the backends (by process id) of pooled connections which are busy building relations
+    so that their queries can be cancelled when loading is aborted.  Once aborted, no new work is started.
+    """
+
+    def __init__(self) -> None:
+        self.aborted = False
+        self._pids = {}  # type: Dict[str, int]
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def register(self, relation: LoadableRelation, conn: connection):
+        with self._lock:
+            if self.aborted:
+                raise concurrent.futures.CancelledError()
+            self._pids[relation.identifier] = conn.get_backend_pid()
+        try:
+            yield
+        finally:
+            with self._lock:
+                del self._pids[relation.identifier]
+
+    def abort(self) -> Dict[str, int]:
+        """
+        Stop any new work from starting and return the process ids of backends that are still busy.
+        """
+        with self._lock:
+            self.aborted = True
+            return dict(self._pids)
+
+
+def build_one_relation_using_manager(manager: etl.db.ConnectionManager, relation: LoadableRelation,
+                                     backends: Optional[BusyBackends]=None, dry_run=False) -> None:
+    """
+    Build the relation using a connection from the manager (which replaces the connection if it ends up broken).
+    """
+    query_group = etl.wlm.query_group_for(relation.identifier)
+    with manager.connection(autocommit=True, readonly=dry_run, query_group=query_group) as conn:
+        try:
+            if backends is None:
+                build_one_relation(conn, relation, dry_run=dry_run)
+            else:
+                with backends.register(relation, conn):
+                    build_one_relation(conn, relation, dry_run=dry_run)
+        except concurrent.futures.CancelledError:
+            logger.info("Not starting to build {:x} after loading was aborted".format(relation))
+            raise
+        except Exception as exc:
+            # Add (some) exception information close to when it happened
+            message = str(exc).split('\n', 1)[0]
+            if relation.is_required:
+                logger.error("Exception information for required relation {:x}: {}".format(relation, message))
+            else:
+                logger.warning("Exception information for relation {:x}: {}".format(relation, message))
+            raise
 
 
 def vacuum(relations: List[RelationDescription], dry_run=False) -> None:
     """
     Final step ... tidy up the warehouse before guests come over.
 
-    This needs to open a new connection since it needs to happen outside a transaction.
+    This needs to use a connection in autocommit mode since it needs to happen outside a transaction.
     """
     dsn_etl = etl.config.get_dw_config().dsn_etl
-    with Timer() as timer, closing(etl.db.connection(dsn_etl, autocommit=True, readonly=dry_run)) as conn:
+    with Timer() as timer, etl.db.connection_manager(dsn_etl).connection(autocommit=True, readonly=dry_run) as conn:
         for relation in relations:
             etl.db.run(conn, "Running vacuum on {:x}".format(relation), "VACUUM {}".format(relation), dry_run=dry_run)
         if not dry_run:
@@ -645,7 +901,7 @@ def vacuum(relations: List[RelationDescription], dry_run=False) -> None:
 
 def create_source_tables_when_ready(relations: List[LoadableRelation], max_concurrency=1,
                                     look_back_minutes=15, idle_termination_seconds=60 * 60,
-                                    dry_run=False) -> None:
+                                    min_concurrency: Optional[int]=None, dry_run=False) -> None:
     """
     Create source relations in several threads, as we observe their extracts to be done, using a connection pool.
     We assume here that the relations have no dependencies on each other and just gun it.
@@ -654,6 +910,8 @@ def create_source_tables_when_ready(relations: List[LoadableRelation], max_concu
     Since these relations may have downstream dependents, we make sure to mark skip_copy on
     any relation from the full set of relations that depends on a source relation that failed
     to load.
+
+    If a minimum concurrency is given, the number of active loaders adapts to the pressure in WLM queues.
     """
     source_relations = [relation for relation in relations if not relation.is_transformation]
     if not source_relations:
@@ -661,7 +919,9 @@ def create_source_tables_when_ready(relations: List[LoadableRelation], max_concu
         return
 
     dsn_etl = etl.config.get_dw_config().dsn_etl
-    pool = etl.db.connection_pool(max_concurrency, dsn_etl)
+    manager = etl.db.connection_manager(dsn_etl)
+    concurrency = etl.wlm.AdaptiveConcurrency(dsn_etl, min_concurrency or max_concurrency, max_concurrency,
+                                              dry_run=dry_run)
 
     recent_cutoff = datetime.utcnow() - timedelta(minutes=look_back_minutes)
     cutoff_epoch = timegm(recent_cutoff.utctimetuple())
@@ -735,7 +995,7 @@ def create_source_tables_when_ready(relations: List[LoadableRelation], max_concu
         """
         Look for a ready-to-load relation from queue 'to_load'
         If the item
-            - is a relation: load it using connection pool 'pool'
+            - is a relation: load it using a connection from the connection manager
             - is None: we're giving up, so return
         """
         while True:
@@ -744,7 +1004,8 @@ def create_source_tables_when_ready(relations: List[LoadableRelation], max_concu
                 break
             logger.info("Loader: Found %s ready to be loaded", item.identifier)
             try:
-                build_one_relation_using_pool(pool, item, dry_run=dry_run)
+                with concurrency.slot():
+                    build_one_relation_using_manager(manager, item, dry_run=dry_run)
             except (RelationConstructionError, RelationDataError):
                 item.mark_failure(relations)
             except:
@@ -755,6 +1016,7 @@ def create_source_tables_when_ready(relations: List[LoadableRelation], max_concu
 
     to_poll = queue.Queue()  # type: ignore
     to_load = queue.Queue()  # type: ignore
+    concurrency.start()
     threads = []
     for i in range(max_concurrency):
         t = threading.Thread(target=load_worker)
@@ -789,6 +1051,7 @@ def create_source_tables_when_ready(relations: List[LoadableRelation], max_concu
         to_load.put(None)
     for t in threads:
         t.join()
+    concurrency.stop()
     # If the poller queue wasn't emptied, it exited unhappily
     if to_poll.qsize():
         raise ETLRuntimeError("Extract poller exited while to-poll queue was not empty")
@@ -809,7 +1072,48 @@ def create_source_tables_when_ready(relations: List[LoadableRelation], max_concu
 
 # ---- Section 4: Functions related to control flow ----
 
-def create_source_tables_in_parallel(relations: List[LoadableRelation], max_concurrency=1, dry_run=False) -> None:
+def build_one_relation_with_limit(concurrency: etl.wlm.AdaptiveConcurrency, manager: etl.db.ConnectionManager,
+                                  relation: LoadableRelation, backends: Optional[BusyBackends]=None,
+                                  dry_run=False) -> None:
+    with concurrency.slot():
+        build_one_relation_using_manager(manager, relation, backends=backends, dry_run=dry_run)
+
+
+def wait_for_failure_of_required_relation(relations: List[LoadableRelation],
+                                          futures: Dict[str, concurrent.futures.Future]) -> Optional[str]:
+    """
+    Wait until either all work is done or a required relation failed to build. Return the failed relation, if any.
+    """
+    lookup = {futures[relation.identifier]: relation for relation in relations}
+    not_done = set(futures.values())
+    while not_done:
+        done, not_done = concurrent.futures.wait(not_done, return_when=concurrent.futures.FIRST_EXCEPTION)
+        for future in done:
+            relation = lookup[future]
+            if relation.is_required and not future.cancelled() and future.exception() is not None:
+                return relation.identifier
+    return None
+
+
+def cancel_parallel_loads(dsn_etl: dict, futures: Dict[str, concurrent.futures.Future], backends: BusyBackends,
+                          dry_run=False) -> None:
+    """
+    Cancel work that has not started yet and cancel queries of relations that are being built right now.
+    """
+    cancelled = [future for future in futures.values() if future.cancel()]
+    busy = backends.abort()
+    logger.info("Cancelled %d queued relation(s), now cancelling queries for %d relation(s) in flight",
+                len(cancelled), len(busy))
+    if not busy:
+        return
+    with etl.db.connection_manager(dsn_etl).connection(autocommit=True) as conn:
+        for identifier, pid in sorted(busy.items()):
+            etl.db.run(conn, "Cancelling query of backend {} which is building '{}'".format(pid, identifier),
+                       "SELECT pg_cancel_backend(%s)", (pid,), dry_run=dry_run)
+
+
+def create_source_tables_in_parallel(relations: List[LoadableRelation], max_concurrency=1,
+                                     min_concurrency: Optional[int]=None, fail_fast=False, dry_run=False) -> None:
     """
     Create relations in parallel operations, using a connection pool, a thread pool, and a kiddie pool.
     We assume here that the relations have no dependencies on each other and just gun it.
@@ -818,6 +1122,11 @@ def create_source_tables_in_parallel(relations: List[LoadableRelation], max_conc
     Since these relations may have downstream dependents, we make sure to mark skip_copy on
     any relation from the full set of relations that depends on a source relation that failed
     to load.
+
+    If a minimum concurrency is given, the number of active workers adapts to the pressure in WLM queues.
+
+    In fail-fast mode, the first failure of a required relation stops queued work and cancels queries in flight
+    (so that the caller can restore schemas right away).
     """
     source_relations = [relation for relation in relations if not relation.is_transformation]
     if not source_relations:
@@ -825,20 +1134,26 @@ def create_source_tables_in_parallel(relations: List[LoadableRelation], max_conc
         return
     timer = Timer()
     dsn_etl = etl.config.get_dw_config().dsn_etl
-    pool = etl.db.connection_pool(max_concurrency, dsn_etl)
+    manager = etl.db.connection_manager(dsn_etl)
+    concurrency = etl.wlm.AdaptiveConcurrency(dsn_etl, min_concurrency or max_concurrency, max_concurrency,
+                                              dry_run=dry_run)
+    backends = BusyBackends() if fail_fast else None
     futures = {}  # type: Dict[str, concurrent.futures.Future]
-    try:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency) as executor:
-            for relation in source_relations:
-                future = executor.submit(build_one_relation_using_pool, pool, relation, dry_run=dry_run)
-                futures[relation.identifier] = future
-            # For fail-fast, switch to FIRST_EXCEPTION below.
-            done, not_done = concurrent.futures.wait(futures.values(), return_when=concurrent.futures.ALL_COMPLETED)
-            cancelled = [future for future in not_done if future.cancel()]
-            logger.info("Wrapping up work in %d worker(s): %d done, %d not done (%d cancelled) (%s)",
-                        max_concurrency, len(done), len(not_done), len(cancelled), timer)
-    finally:
-        pool.closeall()
+    with concurrency, concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        for relation in source_relations:
+            future = executor.submit(build_one_relation_with_limit, concurrency, manager, relation,
+                                     backends=backends, dry_run=dry_run)
+            futures[relation.identifier] = future
+        if backends is not None:
+            failed_identifier = wait_for_failure_of_required_relation(source_relations, futures)
+            if failed_identifier is not None:
+                logger.error("Aborting load of source tables after failure of required relation '%s'",
+                             failed_identifier)
+                cancel_parallel_loads(dsn_etl, futures, backends, dry_run=dry_run)
+        done, not_done = concurrent.futures.wait(futures.values(), return_when=concurrent.futures.ALL_COMPLETED)
+        cancelled = [future for future in futures.values() if future.cancelled()]
+        logger.info("Wrapping up work in %d worker(s): %d done, %d not done (%d cancelled) (%s)",
+                    max_concurrency, len(done), len(not_done), len(cancelled), timer)
 
     for relation in source_relations:
         try:
@@ -875,11 +1190,13 @@ def create_transformations_sequentially(relations: List[LoadableRelation], wlm_q
 
     timer = Timer()
     dsn_etl = etl.config.get_dw_config().dsn_etl
-    with closing(etl.db.connection(dsn_etl, autocommit=True, readonly=dry_run)) as conn:
+    wlm_plan = etl.wlm.plan_wlm_query_slots(dsn_etl, transformations, wlm_query_slots)
+    with etl.db.connection_manager(dsn_etl).connection(autocommit=True, readonly=dry_run) as conn:
         set_redshift_wlm_slots(conn, wlm_query_slots, dry_run=dry_run)
         for relation in transformations:
             try:
-                build_one_relation(conn, relation, dry_run=dry_run)
+                with relation_wlm_slots(conn, relation, wlm_plan, wlm_query_slots, dry_run=dry_run):
+                    build_one_relation(conn, relation, dry_run=dry_run)
             except (RelationConstructionError, RelationDataError) as exc:
                 if relation.is_required:
                     raise RequiredRelationLoadError([relation.identifier]) from exc
@@ -900,16 +1217,102 @@ def set_redshift_wlm_slots(conn: connection, slots: int, dry_run: bool) -> None:
                "SET wlm_query_slot_count TO {}".format(slots), dry_run=dry_run)
 
 
+@contextmanager
+def relation_wlm_slots(conn: connection, relation: LoadableRelation, wlm_plan: Dict[str, int], default_slots: int,
+                       dry_run=False):
+    """
+    Run the queries for a CTAS with its own number of WLM query slots and in its own query group.
+
+    The query group allows looking up the memory used by the relation's queries in the next run.
+    Settings are restored even if building the relation fails, unless the failure aborted the transaction
+    (which is then rolled back, and the connection manager resets the session before the connection is re-used).
+    """
+    if relation.identifier not in wlm_plan:
+        yield
+        return
+    slots = wlm_plan[relation.identifier]
+    if slots != default_slots:
+        etl.db.run(conn, "Using {} WLM queue slot(s) for {:x}".format(slots, relation),
+                   "SET wlm_query_slot_count TO {}".format(slots), dry_run=dry_run)
+    etl.db.run(conn, "Setting query group for {:x}".format(relation),
+               "SET query_group TO '{}'".format(etl.wlm.query_group_for(relation.identifier)), dry_run=dry_run)
+    try:
+        yield
+    finally:
+        if conn.get_transaction_status() != TRANSACTION_STATUS_INERROR:
+            etl.db.run(conn, "Resetting query group", "RESET query_group", dry_run=dry_run)
+            if slots != default_slots:
+                set_redshift_wlm_slots(conn, default_slots, dry_run=dry_run)
+
+
+def check_no_materialized_views_in_staging(relations: List[RelationDescription], use_staging: bool) -> None:
+    """
+    Raise InvalidArgumentError if materialized views would be built in staging schemas.
+
+    Their queries would reference the staging schemas, and after publishing (which renames the schemas),
+    a REFRESH fails since Redshift does not follow the renamed schemas. (A load builds them after publishing
+    its schemas instead, see defer_materialized_views.)
+    """
+    if not use_staging:
+        return
+    matviews = [relation.identifier for relation in relations if relation.is_matview_relation]
+    if matviews:
+        raise InvalidArgumentError("cannot build materialized view(s) in staging schemas: {} "
+                                   "(try again without staging schemas)".format(join_with_quotes(matviews)))
+
+
+def defer_materialized_views(relations: List[LoadableRelation]
+                             ) -> Tuple[List[LoadableRelation], List[LoadableRelation]]:
+    """
+    Split relations into those that are built in staging schemas and those that must be built after the
+    staging schemas were published, namely materialized views and (transitively) their dependents.
+
+    The queries of materialized views in staging schemas would reference the staging schemas, and after
+    publishing (which renames the schemas), a REFRESH fails since Redshift does not follow the renamed schemas.
+    So deferred relations are built in the standard position instead.
+    """
+    matviews = [relation for relation in relations if relation.is_matview_relation]
+    if not matviews:
+        return relations, []
+    deferred_identifiers = {relation.identifier for relation in matviews}
+    for matview in matviews:
+        deferred_identifiers.update(dependent.identifier for dependent in matview.find_dependents(relations))
+    staged = [relation for relation in relations if relation.identifier not in deferred_identifiers]
+    deferred = [relation for relation in relations if relation.identifier in deferred_identifiers]
+    for relation in deferred:
+        relation.use_staging = False
+    return staged, deferred
+
+
+def create_deferred_relations(relations: List[LoadableRelation], deferred: List[LoadableRelation],
+                              wlm_query_slots=1, dry_run=False) -> None:
+    """
+    Build the relations that were deferred until after publishing the staging schemas.
+
+    Deferred relations are left empty when relations that they depend on failed in the staging schemas.
+    """
+    deferred_identifiers = frozenset(relation.identifier for relation in deferred)
+    for relation in relations:
+        if relation.failed:
+            for dependent in relation.find_dependents(relations):
+                if dependent.identifier in deferred_identifiers:
+                    dependent.skip_copy = True
+    logger.info("Building %d relation(s) in standard position after publishing schemas", len(deferred))
+    create_transformations_sequentially(deferred, wlm_query_slots, dry_run=dry_run)
+
+
 def create_relations(relations: List[LoadableRelation], max_concurrency=1, wlm_query_slots=1,
-                     concurrent_extract=False, dry_run=False) -> None:
+                     concurrent_extract=False, min_concurrency: Optional[int]=None, fail_fast=False,
+                     dry_run=False) -> None:
     """
     "Building" relations refers to creating them, granting access, and if they should hold data, loading them.
     """
 
     if concurrent_extract:
-        create_source_tables_when_ready(relations, max_concurrency, dry_run=dry_run)
+        create_source_tables_when_ready(relations, max_concurrency, min_concurrency=min_concurrency, dry_run=dry_run)
     else:
-        create_source_tables_in_parallel(relations, max_concurrency, dry_run=dry_run)
+        create_source_tables_in_parallel(relations, max_concurrency, min_concurrency=min_concurrency,
+                                         fail_fast=fail_fast, dry_run=dry_run)
 
     create_transformations_sequentially(relations, wlm_query_slots, dry_run=dry_run)
 
@@ -918,7 +1321,7 @@ def create_relations(relations: List[LoadableRelation], max_concurrency=1, wlm_q
 
 def load_data_warehouse(all_relations: List[RelationDescription], selector: TableSelector, use_staging=True,
                         max_concurrency=1, wlm_query_slots=1, concurrent_extract=False,
-                        skip_copy=False, dry_run=False):
+                        skip_copy=False, min_concurrency: Optional[int]=None, fail_fast=False, dry_run=False):
     """
     Fully "load" the data warehouse after creating a blank slate by moving existing schemas out of the way.
 
@@ -931,9 +1334,11 @@ def load_data_warehouse(all_relations: List[RelationDescription], selector: Tabl
       4.1 Create relation (and give access)
       4.2 Load data into tables or CTAS (no further action for views)
           If it's a source table, use COPY to load data.
-          If it's a CTAS with an identity column, create temp table, then move data into final table.
+          If it's a CTAS with an identity column, insert values with keys from ROW_NUMBER() into final table.
           If it's a CTAS without an identity column, insert values straight into final table.
     On error: exit if use_staging, otherwise restore schemas from backup position
+    5 If use_staging, publish the schemas, then build materialized views (and their dependents)
+      in the standard position
 
     N.B. If arthur gets interrupted (eg. because the instance is inadvertently shut down),
     then there will be an incomplete state.
@@ -945,17 +1350,18 @@ def load_data_warehouse(all_relations: List[RelationDescription], selector: Tabl
     relations = LoadableRelation.from_descriptions(selected_relations, "load",
                                                    skip_copy=skip_copy, use_staging=use_staging)
     traversed_schemas = find_traversed_schemas(relations)
+    staged, deferred = defer_materialized_views(relations) if use_staging else (relations, [])
     logger.info("Starting to load %d relation(s) in %d schema(s)", len(relations), len(traversed_schemas))
 
     dsn_etl = etl.config.get_dw_config().dsn_etl
-    with closing(etl.db.connection(dsn_etl, autocommit=True)) as conn:
+    with etl.db.connection_manager(dsn_etl).connection(autocommit=True) as conn:
         tx_info = etl.data_warehouse.list_open_transactions(conn)
         etl.db.print_result("List of sessions that have open transactions:", tx_info)
 
     create_schemas_for_rebuild(traversed_schemas, use_staging=use_staging, dry_run=dry_run)
     try:
-        create_relations(relations, max_concurrency, wlm_query_slots,
-                         concurrent_extract=concurrent_extract, dry_run=dry_run)
+        create_relations(staged, max_concurrency, wlm_query_slots, concurrent_extract=concurrent_extract,
+                         min_concurrency=min_concurrency, fail_fast=fail_fast, dry_run=dry_run)
     except ETLRuntimeError:
         if not use_staging:
             logger.info("Restoring %d schema(s) after load failure", len(traversed_schemas))
@@ -965,18 +1371,107 @@ def load_data_warehouse(all_relations: List[RelationDescription], selector: Tabl
     if use_staging:
         logger.info("Publishing %d schema(s) after load success", len(traversed_schemas))
         etl.data_warehouse.publish_schemas(traversed_schemas, dry_run=dry_run)
+        if deferred:
+            create_deferred_relations(relations, deferred, wlm_query_slots, dry_run=dry_run)
+
+
+def find_live_late_binding_views(relations: List[RelationDescription]) -> Set[str]:
+    """
+    Return identifiers of those views among the relations that currently exist as late-binding views.
+
+    The configuration is not good enough here: a view that was switched to late binding in its table design
+    (or schema) is still schema-bound until it is re-created.
+    """
+    views = [relation for relation in relations if relation.is_view_relation]
+    if not views:
+        return set()
+    schemas = sorted({relation.target_table_name.schema for relation in views})
+    dsn_etl = etl.config.get_dw_config().dsn_etl
+    with etl.db.connection_manager(dsn_etl).connection(readonly=True) as conn:
+        found = etl.db.select_late_binding_views(conn, schemas)
+    return {relation.identifier for relation in views if relation.identifier in found}
+
+
+def skip_surviving_views(relations: List[RelationDescription], selector: TableSelector,
+                         altered: Optional[Set[str]]=None,
+                         late_binding: Optional[Set[str]]=None) -> List[RelationDescription]:
+    """
+    Return relations without those views that were only added as dependents and that will not be dropped
+    when the relations that they depend on are recreated.
+
+    A (live) late-binding view is not dropped along with its dependencies, and any other view is only dropped
+    if one of its dependencies is (recreated and thus) dropped. Tables that are altered in place
+    are not dropped. (The list must be in execution order.)
+    """
+    late_binding = late_binding or set()
+    rebuilt = set()  # type: Set[str]
+    remaining = []
+    for relation in relations:
+        if relation.is_view_relation and not selector.match(relation.target_table_name):
+            if relation.identifier in late_binding or not any(dependency.identifier in rebuilt
+                                                              for dependency in relation.dependencies):
+                continue
+        if altered is None or relation.identifier not in altered:
+            rebuilt.add(relation.identifier)
+        remaining.append(relation)
+    skipped = len(relations) - len(remaining)
+    if skipped:
+        logger.info("Skipping %d dependent view(s) which will not be dropped", skipped)
+    return remaining
+
+
+def find_table_evolutions(relations: List[RelationDescription],
+                          selector: TableSelector) -> Dict[str, Tuple[List[str], List[str]]]:
+    """
+    Compare the table designs of selected tables with the live tables and return statements to alter the
+    tables in place (along with new columns) where the changes are additive.
+
+    Tables with (schema-bound) views on top are re-created instead of having their columns widened
+    since Redshift cannot alter the type of a column used by a view.
+    """
+    evolutions = {}  # type: Dict[str, Tuple[List[str], List[str]]]
+    tables = [relation for relation in relations
+              if not (relation.is_view_relation or relation.is_matview_relation or relation.is_external_relation) and
+              selector.match(relation.target_table_name)]
+    if not tables:
+        return evolutions
+    dsn_etl = etl.config.get_dw_config().dsn_etl
+    with etl.db.connection_manager(dsn_etl).connection(readonly=True) as conn:
+        for relation in tables:
+            live_columns = etl.design.redshift.fetch_table_definition(conn, relation.target_table_name)
+            dependent_views = etl.db.select_dependent_views(conn, relation.target_table_name.schema,
+                                                            relation.target_table_name.table)
+            if dependent_views:
+                logger.debug("Found views depending on '%s': %s", relation.identifier,
+                             join_with_quotes(dependent_views))
+            evolution = etl.design.redshift.build_alter_table_stmts(relation.table_design,
+                                                                    relation.target_table_name, live_columns,
+                                                                    has_dependent_views=bool(dependent_views))
+            if evolution is None:
+                logger.info("Changes to '%s' require re-creating the table", relation.identifier)
+                continue
+            evolutions[relation.identifier] = evolution
+            logger.info("Altering '%s' in place using %d statement(s) with %d new column(s)",
+                        relation.identifier, len(evolution[0]), len(evolution[1]))
+    return evolutions
 
 
 def upgrade_data_warehouse(all_relations: List[RelationDescription], selector: TableSelector,
                            max_concurrency=1, wlm_query_slots=1,
                            only_selected=False, continue_from: Optional[str]=None, use_staging=False,
-                           skip_copy=False, dry_run=False) -> None:
+                           skip_copy=False, evolve_tables=False, min_concurrency: Optional[int]=None,
+                           fail_fast=False, dry_run=False) -> None:
     """
     Push new (structural) changes and fresh data through data warehouse.
 
     This will create schemas as needed to house the relations being created or replaced.
     The set of relations is usually expanded to include all those in (transitively) depending
     on the selected ones. But this can be kept to just the selected ones for faster testing.
+    Dependent views that survive the upgrade of the selected relations (like late-binding views)
+    are not rebuilt unless we're using staging schemas.
+
+    When evolving tables, selected tables whose designs only add (nullable) columns or widen VARCHAR columns
+    compared to the live tables are altered in place instead, and only new columns are backfilled.
 
     For all relations:
         1 Drop relation
@@ -990,15 +1485,28 @@ def upgrade_data_warehouse(all_relations: List[RelationDescription], selector: T
                                                                 continue_from=continue_from)
     if not selected_relations:
         return
+    check_no_materialized_views_in_staging(selected_relations, use_staging)
+
+    evolutions = {}  # type: Dict[str, Tuple[List[str], List[str]]]
+    if not use_staging:
+        if evolve_tables:
+            evolutions = find_table_evolutions(selected_relations, selector)
+        if not only_selected:
+            selected_relations = skip_surviving_views(selected_relations, selector, set(evolutions),
+                                                      find_live_late_binding_views(selected_relations))
 
     relations = LoadableRelation.from_descriptions(selected_relations, "upgrade",
                                                    skip_copy=skip_copy, use_staging=use_staging)
+    for relation in relations:
+        if relation.identifier in evolutions:
+            relation.alter_stmts, relation.new_columns = evolutions[relation.identifier]
 
     traversed_schemas = find_traversed_schemas(relations)
     logger.info("Starting to upgrade %d relation(s) in %d schema(s)", len(relations), len(traversed_schemas))
 
     etl.data_warehouse.create_schemas(traversed_schemas, use_staging=use_staging, dry_run=dry_run)
-    create_relations(relations, max_concurrency, wlm_query_slots, dry_run=dry_run)
+    create_relations(relations, max_concurrency, wlm_query_slots, min_concurrency=min_concurrency,
+                     fail_fast=fail_fast, dry_run=dry_run)
 
 
 def update_data_warehouse(all_relations: List[RelationDescription], selector: TableSelector, wlm_query_slots=1,
@@ -1037,13 +1545,16 @@ def update_data_warehouse(all_relations: List[RelationDescription], selector: Ta
     logger.info("Starting to update %d tables(s)", len(relations))
     # Run update within a transaction:
     dsn_etl = etl.config.get_dw_config().dsn_etl
-    with closing(etl.db.connection(dsn_etl, readonly=dry_run)) as tx_conn, tx_conn as conn:
+    wlm_plan = etl.wlm.plan_wlm_query_slots(dsn_etl, relations, wlm_query_slots)
+    with etl.db.connection_manager(dsn_etl).connection(readonly=dry_run) as tx_conn, tx_conn as conn:
         set_redshift_wlm_slots(conn, wlm_query_slots, dry_run=dry_run)
         for relation in relations:
-            build_one_relation(conn, relation, dry_run=dry_run)
+            with relation_wlm_slots(conn, relation, wlm_plan, wlm_query_slots, dry_run=dry_run):
+                build_one_relation(conn, relation, dry_run=dry_run)
 
     if run_vacuum:
-        vacuum(tables, dry_run=dry_run)
+        vacuum([table for table in tables if not (table.is_matview_relation or table.is_external_relation)],
+               dry_run=dry_run)
 
 
 def show_downstream_dependents(relations: List[RelationDescription], selector: TableSelector,
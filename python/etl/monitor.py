@@ -190,6 +190,13 @@ class Monitor(metaclass=MetaMonitor):
     def monitor_id(self):
         return self._monitor_id
 
+    def add_extra(self, key: str, value) -> None:
+        """
+        Add extra information (which must be of type list, dict, str, or int) to the payload of
+        the event at the end of the step.
+        """
+        self._extra[key] = deepcopy(value)
+
     def __enter__(self):
         if self._index:
             logger.info("Starting %s step for '%s' (%d/%d)",
@@ -218,9 +225,9 @@ class Monitor(metaclass=MetaMonitor):
         payload.emit(dry_run=self._dry_run)
 
     @classmethod
-    def marker_payload(cls, step: str):
+    def marker_payload(cls, step: str, extra: Optional[dict]=None):
         monitor = cls(_DUMMY_TARGET, step)
-        return MonitorPayload(monitor, STEP_FINISH, utc_now(), elapsed=0, extra={"is_marker": True})
+        return MonitorPayload(monitor, STEP_FINISH, utc_now(), elapsed=0, extra=dict(extra or {}, is_marker=True))
 
 
 class MonitorPayload:
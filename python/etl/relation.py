@@ -1,16 +1,18 @@
 """
-Work with relations: tables, CTAS tables, or views
+Work with relations: tables, CTAS tables, views, or materialized views
 
 Table descriptions -- model around the notion of relations and their support files
     "Table" relations are tables created based on data probably coming from an upstream source.
     "CTAS" relations are tables that are created using queries and transform data; unlike
         views they have disk storage and thus distributions and column encodings.
     "VIEW" relations are views that are queries but unlike CTAS don't use disk space.
+    "MATVIEW" relations are materialized views that store the results of their queries like CTAS
+        but which can be refreshed (incrementally) by Redshift.
 
 The descriptions of relations contain access to:
     "table designs" which describe the name and columns as well as constraints and attributes
          for the table or its columns
-    "queries" which are the SQL SELECT statements backing the CTAS or VIEW
+    "queries" which are the SQL SELECT statements backing the CTAS, VIEW, or MATVIEW
     "manifests" which are lists of data files for tables backed by upstream sources
 """
 
@@ -70,6 +72,7 @@ class RelationDescription:
             self.prefix = None
         # Note the subtle difference to TableFileSet--here the manifest_file_name is always present since it's computed
         self.manifest_file_name = os.path.join(discovered_files.path or "", "data", self.source_path_name + ".manifest")
+        self.stats_file_name = os.path.join(discovered_files.path or "", "data", self.source_path_name + ".stats")
         # Lazy-loading of table design and query statement and any derived information from the table design
         self._table_design = None  # type: Optional[Dict[str, Any]]
         self._query_stmt = None  # type: Optional[str]
@@ -141,7 +144,7 @@ class RelationDescription:
 
     @property
     def kind(self) -> str:
-        if self.table_design["source_name"] in ("CTAS", "VIEW"):
+        if self.table_design["source_name"] in ("CTAS", "VIEW", "MATVIEW"):
             return self.table_design["source_name"]
         else:
             return "DATA"
@@ -154,10 +157,40 @@ class RelationDescription:
     def is_view_relation(self) -> bool:
         return self.kind == "VIEW"
 
+    @property
+    def is_matview_relation(self) -> bool:
+        return self.kind == "MATVIEW"
+
     @property
     def is_transformation(self) -> bool:
         return self.kind != "DATA"
 
+    @property
+    def is_external_relation(self) -> bool:
+        """
+        Return whether this is a table from an upstream source which is registered as an external table
+        (for Redshift Spectrum) over the data files instead of being loaded.
+        """
+        return not self.is_transformation and self.schema_config.is_external
+
+    @property
+    def has_external_dependencies(self) -> bool:
+        external_schemas = etl.config.get_dw_config().external_schema_names
+        return any(dependency.schema in external_schemas for dependency in self.dependencies)
+
+    @property
+    def is_late_binding_view(self) -> bool:
+        """
+        Return whether this is a view which is created WITH NO SCHEMA BINDING, meaning that it
+        doesn't get dropped when any of the relations that it depends on get dropped.
+        (Views that depend on external tables must always be late-binding views.)
+        """
+        if not self.is_view_relation:
+            return False
+        if self.has_external_dependencies:
+            return True
+        return self.table_design.get("late_binding", self.schema_config.late_binding_views)
+
     @property
     def is_unloadable(self) -> bool:
         return "unload_target" in self.table_design
@@ -204,6 +237,22 @@ class RelationDescription:
         dw_config = etl.config.get_dw_config()
         return dw_config.schema_lookup(self.source_name)
 
+    @property
+    def extract_format(self) -> str:
+        """
+        Format of the data files ("csv" or "parquet") as configured for the upstream source
+        """
+        return self.schema_config.extract_format
+
+    @property
+    def data_path_name(self) -> str:
+        """
+        Path (below the prefix) of the data files, which depends on the format of the data files
+        """
+        if self.extract_format == "parquet":
+            return self.parquet_path_name
+        return self.csv_path_name
+
     @property
     def unquoted_columns(self) -> List[str]:
         """
@@ -277,6 +326,10 @@ class RelationDescription:
     def num_partitions(self):
         return self.table_design.get("extract_settings", {}).get("num_partitions")
 
+    @property
+    def wlm_query_slots(self) -> Optional[int]:
+        return self.table_design.get("load_settings", {}).get("wlm_query_slots")
+
     def find_partition_key(self) -> Union[str, None]:
         """
         Return valid partition key for a relation which fulfills the conditions that
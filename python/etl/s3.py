@@ -5,15 +5,19 @@ Common code around interacting with AWS S3
 import boto3
 import botocore.exceptions
 import botocore.response
+import concurrent.futures
 import logging
+import os.path
 import simplejson as json
 import tempfile
 import threading
 import time
 
-from typing import Iterator, List, Union, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Union, Tuple
 from datetime import datetime
+from functools import partial
 
+import etl.config
 from etl.json_encoder import FancyJsonEncoder
 from etl.errors import S3ServiceError
 
@@ -22,6 +26,13 @@ logger.addHandler(logging.NullHandler())
 
 _resources_for_thread = threading.local()
 
+# Requests to delete objects can contain at most this many keys, but we can send multiple requests at the same time.
+DELETE_CHUNK_SIZE = 1000
+MAX_CONCURRENT_DELETES = 8
+
+# Deletions that callers don't need to wait for (like removing old data files) run in this thread pool.
+_background_deletes = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
 
 def _get_s3_bucket(bucket_name: str):
     """
@@ -101,25 +112,41 @@ def upload_data_to_s3(data: dict, bucket_name: str, object_key: str) -> None:
         uploader(local_file.name, object_key)
 
 
+def _delete_chunk(bucket_name: str, object_keys: List[str]) -> List[str]:
+    """
+    Delete the objects (in a single request) and return the keys of objects that could not be deleted.
+    """
+    bucket = _get_s3_bucket(bucket_name)
+    result = bucket.delete_objects(Delete={'Objects': [{'Key': key} for key in object_keys]})
+    for deleted in sorted(obj['Key'] for obj in result.get('Deleted', [])):
+        logger.info("Deleted 's3://%s/%s'", bucket_name, deleted)
+    failed = []
+    for error in result.get('Errors', []):
+        logger.error("Failed to delete 's3://%s/%s' with %s: %s", bucket_name, error['Key'],
+                     error['Code'], error['Message'])
+        failed.append(error['Key'])
+    return failed
+
+
 def delete_objects(bucket_name: str, object_keys: List[str], wait=False, _retry=True) -> None:
     """
     For each object key in object_keys, attempt to delete the key and its content from an S3 bucket.
+    Requests to delete objects are sent concurrently in chunks.
 
     If the optional parameter "wait" is true, then we'll wait until the object has actually been deleted.
     """
-    bucket = _get_s3_bucket(bucket_name)
-    keys = [{'Key': key} for key in object_keys]
-    failed = []
-    chunk_size = 1000
-    while len(keys) > 0:
-        result = bucket.delete_objects(Delete={'Objects': keys[:chunk_size]})
-        del keys[:chunk_size]
-        for deleted in sorted(obj['Key'] for obj in result.get('Deleted', [])):
-            logger.info("Deleted 's3://%s/%s'", bucket_name, deleted)
-        for error in result.get('Errors', []):
-            logger.error("Failed to delete 's3://%s/%s' with %s: %s", bucket_name, error['Key'],
-                         error['Code'], error['Message'])
-            failed.append(error['Key'])
+    chunks = [object_keys[i:i + DELETE_CHUNK_SIZE] for i in range(0, len(object_keys), DELETE_CHUNK_SIZE)]
+    failed = []  # type: List[str]
+    if len(chunks) > 1:
+        max_workers = min(len(chunks), MAX_CONCURRENT_DELETES)
+        logger.debug("Deleting %d object(s) in %d chunk(s) using %d thread(s)",
+                     len(object_keys), len(chunks), max_workers)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for chunk_failed in executor.map(partial(_delete_chunk, bucket_name), chunks):
+                failed.extend(chunk_failed)
+    else:
+        for chunk in chunks:
+            failed.extend(_delete_chunk(bucket_name, chunk))
     if failed:
         if _retry:
             logger.warning("Failed to delete %d object(s), trying one more time in 5s", len(failed))
@@ -128,26 +155,170 @@ def delete_objects(bucket_name: str, object_keys: List[str], wait=False, _retry=
         else:
             raise S3ServiceError("Failed to delete %d file(s)" % len(failed))
     if wait and _retry:  # check only in initial call
-        logger.debug("Waiting for %d object(s) to no longer exist", len(object_keys))
-        for key in object_keys:
-            bucket.Object(key).wait_until_not_exists()
+        wait_until_deleted(bucket_name, object_keys)
+
+
+def wait_until_deleted(bucket_name: str, object_keys: List[str]) -> None:
+    """
+    Wait until none of the objects are listed any more, with one listing (of the common prefix) per poll.
+    """
+    if not object_keys:
+        return
+    poll_interval = etl.config.get_config_int("arthur_settings.s3_poll_interval", 5)
+    deadline = time.monotonic() + etl.config.get_config_int("arthur_settings.s3_wait_timeout", 100)
+    prefix = os.path.commonprefix(object_keys)
+    remaining = frozenset(object_keys)
+    logger.debug("Waiting for %d object(s) in 's3://%s/%s' to no longer exist", len(remaining), bucket_name, prefix)
+    while True:
+        bucket = _get_s3_bucket(bucket_name)
+        remaining = remaining.intersection(obj.key for obj in bucket.objects.filter(Prefix=prefix))
+        if not remaining:
+            break
+        if time.monotonic() >= deadline:
+            raise S3ServiceError("Failed to delete %d file(s) in 's3://%s/%s' before timeout" %
+                                 (len(remaining), bucket_name, prefix))
+        time.sleep(poll_interval)
+
+
+def delete_objects_in_background(bucket_name: str, object_keys: List[str]) -> concurrent.futures.Future:
+    """
+    Start deleting the objects without waiting for the deletion to finish.
+
+    Background deletions run one after another and are finished before the process exits.
+    """
+    logger.info("Deleting %d object(s) from 's3://%s' in the background", len(object_keys), bucket_name)
+    future = _background_deletes.submit(delete_objects, bucket_name, object_keys)
+
+    def log_failure(done: concurrent.futures.Future) -> None:
+        if done.exception() is not None:
+            logger.warning("Failed to delete objects from 's3://%s' in the background: %s",
+                           bucket_name, done.exception())
+
+    future.add_done_callback(log_failure)
+    return future
+
+
+class S3ObjectReadiness:
+    """
+    Wait for objects to appear in S3 while sharing the work of looking for them between all waiting threads.
+
+    Instead of every thread polling for its object (and sleeping while holding on to its slot), one of the waiting
+    threads lists every "directory" that has pending objects (once, for all objects in that directory) and then
+    wakes up all the waiters whose objects appeared.
+    """
+
+    def __init__(self, poll_interval: float, timeout: float) -> None:
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self._condition = threading.Condition()
+        # Number of threads waiting for an object (by bucket and key)
+        self._waiters = {}  # type: Dict[Tuple[str, str], int]
+        # Timestamp of last modification of objects that were found
+        self._found = {}  # type: Dict[Tuple[str, str], datetime]
+        self._is_polling = False
+        self._next_poll = 0.0
+
+    def wait_for_objects(self, bucket_name: str, object_keys: Iterable[str],
+                         timeout: Optional[float]=None) -> Dict[str, Optional[datetime]]:
+        """
+        Wait (up to timeout seconds) for the objects to exist and return their timestamp of last modification.
+        The timestamp is None for any object that did not appear before the timeout.
+        """
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        wanted = [(bucket_name, object_key) for object_key in object_keys]
+        with self._condition:
+            for item in wanted:
+                self._waiters[item] = self._waiters.get(item, 0) + 1
+            try:
+                while not all(item in self._found for item in wanted):
+                    now = time.monotonic()
+                    if now >= deadline:
+                        break
+                    if self._is_polling:
+                        self._condition.wait(deadline - now)
+                    elif now < self._next_poll:
+                        self._condition.wait(min(self._next_poll, deadline) - now)
+                    else:
+                        self._poll()
+                return {key: self._found.get((bucket, key)) for bucket, key in wanted}
+            finally:
+                for item in wanted:
+                    self._waiters[item] -= 1
+                    if self._waiters[item] == 0:
+                        del self._waiters[item]
+                        self._found.pop(item, None)
+
+    def _poll(self) -> None:
+        """
+        List objects for all pending objects and wake up waiters. Must be called while holding the lock.
+        """
+        self._is_polling = True
+        pending = [item for item in self._waiters if item not in self._found]
+        self._condition.release()
+        try:
+            found = _find_objects(pending)
+        finally:
+            self._condition.acquire()
+            self._is_polling = False
+            self._next_poll = time.monotonic() + self.poll_interval
+            self._condition.notify_all()
+        self._found.update(found)
+
+
+def _find_objects(items: List[Tuple[str, str]]) -> Dict[Tuple[str, str], datetime]:
+    """
+    Look for the given objects (as pairs of bucket name and object key) with one listing per directory.
+    """
+    by_prefix = {}  # type: Dict[Tuple[str, str], List[str]]
+    for bucket_name, object_key in items:
+        by_prefix.setdefault((bucket_name, os.path.dirname(object_key) + "/"), []).append(object_key)
+    found = {}
+    for (bucket_name, prefix), object_keys in sorted(by_prefix.items()):
+        logger.debug("Looking for %d object(s) at 's3://%s/%s'", len(object_keys), bucket_name, prefix)
+        wanted = frozenset(object_keys)
+        bucket = _get_s3_bucket(bucket_name)
+        for obj in bucket.objects.filter(Prefix=prefix, Delimiter="/"):
+            if obj.key in wanted:
+                found[(bucket_name, obj.key)] = obj.last_modified
+    return found
+
+
+_object_readiness = None  # type: Optional[S3ObjectReadiness]
+_object_readiness_lock = threading.Lock()
+
+
+def object_readiness() -> S3ObjectReadiness:
+    """
+    Return the (shared) service to wait for objects, configured from the settings.
+    """
+    global _object_readiness
+    with _object_readiness_lock:
+        if _object_readiness is None:
+            _object_readiness = S3ObjectReadiness(
+                poll_interval=etl.config.get_config_int("arthur_settings.s3_poll_interval", 5),
+                timeout=etl.config.get_config_int("arthur_settings.s3_wait_timeout", 100))
+    return _object_readiness
 
 
 def get_s3_object_last_modified(bucket_name: str, object_key: str, wait=True) -> Union[datetime, None]:
     """
     Return the last_modified datetime timestamp for an S3 Object.
     If the call errors out, return None.
+
+    When waiting for the object, the check is batched with all other objects that threads are waiting for.
     """
+    if wait:
+        timestamp = object_readiness().wait_for_objects(bucket_name, [object_key])[object_key]
+        if timestamp is None:
+            logger.debug("Waiting for object in 's3://%s/%s' failed", bucket_name, object_key)
+        else:
+            logger.debug("Object in 's3://%s/%s' was last modified %s", bucket_name, object_key, timestamp)
+        return timestamp
     try:
         bucket = _get_s3_bucket(bucket_name)
         s3_object = bucket.Object(object_key)
-        if wait:
-            s3_object.wait_until_exists()
         timestamp = s3_object.last_modified
         logger.debug("Object in 's3://%s/%s' was last modified %s", bucket_name, object_key, timestamp)
-    except botocore.exceptions.WaiterError:
-        logger.debug("Waiting for object in 's3://%s/%s' failed", bucket_name, object_key)
-        timestamp = None
     except botocore.exceptions.ClientError as exc:
         error_code = exc.response['Error']['Code']
         if error_code == "404":
@@ -194,13 +365,21 @@ def list_objects_for_prefix(bucket_name: str, *prefixes: str) -> Iterator[str]:
     List all the files in "s3://{bucket_name}/{prefix}" for each given prefix
     (where prefix is probably a path and not an object key).
     """
+    for key, size in list_objects_with_size_for_prefix(bucket_name, *prefixes):
+        yield key
+
+
+def list_objects_with_size_for_prefix(bucket_name: str, *prefixes: str) -> Iterator[Tuple[str, int]]:
+    """
+    List all the files in "s3://{bucket_name}/{prefix}" for each given prefix along with their size in bytes.
+    """
     if not prefixes:
         raise ValueError("List of prefixes may not be empty")
     bucket = _get_s3_bucket(bucket_name)
     for prefix in prefixes:
         logger.info("Looking for files at 's3://%s/%s'", bucket_name, prefix)
         for obj in bucket.objects.filter(Prefix=prefix):
-            yield obj.key
+            yield obj.key, obj.size
 
 
 def test_object_creation(bucket_name: str, prefix: str) -> None:
@@ -12,26 +12,33 @@ Validating the warehouse schemas (definition of upstream tables and their transf
 * Valid SQL in CTAS or views
 # Correct list of columns in CTAS or views
 * Correct description of dependencies
+
+Relations that passed the checks against upstream sources or the data warehouse are remembered in a
+validation cache (by a hash of their design, their query, their dependencies, and the settings) so that only
+new or changed relations (or relations whose dependencies changed) are validated again in the next run.
 """
 
 import concurrent.futures
 import difflib
+import hashlib
 import logging
+import os.path
 import threading
-from contextlib import closing
 from copy import deepcopy
 from itertools import groupby
 from operator import attrgetter
-from typing import Iterable, List, Optional
+from typing import Dict, Iterable, List, Optional
 
 import psycopg2
 import simplejson as json
 from psycopg2.extensions import connection  # only for type annotation
 
+import etl.config
 import etl.design.bootstrap
 import etl.db
 import etl.relation
 from etl.config.dw import DataWarehouseConfig, DataWarehouseSchema
+from etl.design.bootstrap import CatalogSnapshot
 from etl.errors import ETLConfigError, ETLDelayedExit, ETLRuntimeError  # Exception classes that we might catch
 from etl.errors import TableDesignValidationError, UpstreamValidationError  # Exception classes that we might raise
 from etl.names import TableName
@@ -45,6 +52,94 @@ logger.addHandler(logging.NullHandler())
 _error_occurred = threading.Event()
 
 
+class ValidationCache:
+    """
+    Remember for each kind of check (like "upstream" or "transform") which relations passed it and
+    for which hash of the relation's design etc.  (See compute_validation_hashes.)
+
+    A relation passes a check "from the cache" iff its current hash is the hash remembered for that check.
+    When ignoring what's in the cache, all relations are checked (but the cache is still updated).
+    """
+
+    def __init__(self, filename: str, hashes: Dict[str, str], ignore_cached: bool=False) -> None:
+        self.filename = filename
+        self.hashes = hashes
+        self.ignore_cached = ignore_cached
+        self._lock = threading.Lock()
+        self._hits = {}  # type: Dict[str, int]
+        self._misses = {}  # type: Dict[str, int]
+        self._passed = {}  # type: Dict[str, Dict[str, str]]
+        if os.path.exists(filename):
+            try:
+                with open(filename) as f:
+                    self._passed = json.load(f)
+                logger.info("Loaded validation cache from '%s'", filename)
+            except (OSError, ValueError) as exc:
+                logger.warning("Ignoring validation cache in '%s' which failed to load: %s", filename, exc)
+
+    def select_relations(self, check: str, relations: List[RelationDescription]) -> List[RelationDescription]:
+        """
+        Return the relations that need to be checked since they did not pass the check with their current hash.
+        """
+        passed = self._passed.get(check, {})
+        selected = [relation for relation in relations
+                    if self.ignore_cached or passed.get(relation.identifier) != self.hashes.get(relation.identifier)]
+        with self._lock:
+            self._hits[check] = self._hits.get(check, 0) + len(relations) - len(selected)
+            self._misses[check] = self._misses.get(check, 0) + len(selected)
+        if len(selected) < len(relations):
+            logger.info("Skipping %d relation(s) which passed '%s' check before and did not change",
+                        len(relations) - len(selected), check)
+        return selected
+
+    def add(self, check: str, relation: RelationDescription) -> None:
+        if relation.identifier in self.hashes:
+            with self._lock:
+                self._passed.setdefault(check, {})[relation.identifier] = self.hashes[relation.identifier]
+
+    def save(self) -> None:
+        with self._lock:
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+            with open(self.filename, "w") as f:
+                json.dump(self._passed, f, indent="    ", sort_keys=True)
+                f.write("\n")
+        logger.info("Saved validation cache to '%s'", self.filename)
+
+    def log_summary(self) -> None:
+        for check in sorted(self._misses):
+            logger.info("Validation cache for '%s' check: %d hit(s), %d miss(es)",
+                        check, self._hits[check], self._misses[check])
+
+
+def settings_hash() -> str:
+    """
+    Return hash of the current settings (except for dates which change every day).
+    """
+    settings = {name: value for name, value in etl.config.get_config_map().items()
+                if not name.startswith("date.")}  # type: Dict[str, object]
+    settings["_schemas"] = [vars(schema) for schema in etl.config.get_dw_config().schemas]
+    return hashlib.sha1(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def compute_validation_hashes(relations: List[RelationDescription], base_hash: str) -> Dict[str, str]:
+    """
+    Return a hash for each relation based on its table design, its query, the hashes of its dependencies
+    and the base hash (of the settings).  So a change to a relation "changes" all relations that depend on it.
+
+    Relations must be ordered by their dependencies (or else the hashes of dependencies are not known yet).
+    """
+    hashes = {}  # type: Dict[str, str]
+    for relation in relations:
+        digest = hashlib.sha1(base_hash.encode())
+        digest.update(json.dumps(relation.table_design, sort_keys=True).encode())
+        if relation.is_transformation:
+            digest.update(relation.query_stmt.encode())
+        for dependency in sorted(relation.dependencies, key=attrgetter("identifier")):
+            digest.update(hashes.get(dependency.identifier, dependency.identifier).encode())
+        hashes[relation.identifier] = digest.hexdigest()
+    return hashes
+
+
 def validate_relation_description(relation: RelationDescription, keep_going=False) -> Optional[RelationDescription]:
     """
     Load table design (which always also validates against the schema).
@@ -142,12 +237,14 @@ def validate_column_ordering(conn: connection, relation: RelationDescription, tm
         logger.info("Order of columns in design of '%s' matches result of running SQL query", relation.identifier)
 
 
-def validate_single_transform(conn: connection, relation: RelationDescription, keep_going: bool= False) -> None:
+def validate_single_transform(conn: connection, relation: RelationDescription, keep_going: bool= False) -> bool:
     """
-    Test-run a relation (CTAS or VIEW) by creating a temporary view.
+    Test-run a relation (CTAS, VIEW, or MATVIEW) by creating a temporary view.
 
     With a view created, we can extract dependency information and a list of columns
     to make sure table design and query match up.
+
+    Return True if the relation is valid, False if it's not (but we keep going).
     """
     try:
         with relation.matching_temporary_view(conn) as tmp_view_name:
@@ -158,24 +255,96 @@ def validate_single_transform(conn: connection, relation: RelationDescription, k
             _error_occurred.set()
             logger.exception("Ignoring failure to validate '%s' and proceeding as requested:",
                              relation.identifier)
+            return False
         else:
             raise
+    return True
 
 
-def validate_transforms(dsn: dict, relations: List[RelationDescription], keep_going: bool=False) -> None:
+def validate_single_transform_using_pool(pool, relation: RelationDescription, keep_going: bool=False,
+                                         cache: Optional[ValidationCache]=None) -> bool:
+    """
+    Validate transform with a connection from the pool.  Since temporary views live in the temporary
+    schema of their session, every worker uses its own temporary schema.
     """
-    Validate transforms (CTAS or VIEW relations) by trying to run them in the database.
+    conn = pool.getconn()
+    conn.set_session(autocommit=True)
+    try:
+        valid = validate_single_transform(conn, relation, keep_going=keep_going)
+    except Exception:
+        pool.putconn(conn, close=True)
+        raise
+    else:
+        pool.putconn(conn, close=False)
+    if valid and cache is not None:
+        cache.add("transform", relation)
+    return valid
+
+
+def validate_transforms(dsn: dict, relations: List[RelationDescription], keep_going: bool=False,
+                        max_workers: int=8, cache: Optional[ValidationCache]=None) -> None:
+    """
+    Validate transforms (CTAS, VIEW, or MATVIEW relations) by trying to run them in the database.
     This allows us to check their syntax, their dependencies, etc.
+
+    Transforms are validated concurrently (using a pool of connections) but a transform is only validated
+    after all the transforms that it depends on.
     """
-    transforms = [relation for relation in relations if relation.is_ctas_relation or relation.is_view_relation]
+    transforms = [relation for relation in relations if relation.is_transformation]
     if not transforms:
-        logger.info("No transforms found or selected, skipping CTAS or VIEW validation")
+        logger.info("No transforms found or selected, skipping CTAS, VIEW, or MATVIEW validation")
         return
-
-    # TODO Parallelize but use separate connections per thread
-    with closing(etl.db.connection(dsn, autocommit=True)) as conn:
-        for relation in transforms:
-            validate_single_transform(conn, relation, keep_going=keep_going)
+    if cache is not None:
+        transforms = cache.select_relations("transform", transforms)
+        if not transforms:
+            return
+
+    # Only wait for dependencies that are validated here as well.
+    identifiers = frozenset(relation.identifier for relation in transforms)
+    waiting_for = {relation.identifier: {dependency.identifier for dependency in relation.dependencies
+                                         if dependency.identifier in identifiers and
+                                         dependency.identifier != relation.identifier}
+                   for relation in transforms}
+    remaining = list(transforms)
+    invalid = []  # type: List[str]
+
+    max_workers = min(max_workers, len(transforms))
+    logger.info("Validating %d transform(s) using %d connection(s)", len(transforms), max_workers)
+    pool = etl.db.connection_pool(max_workers, dsn)
+    try:
+        # TODO With Python 3.6, we should pass in a thread_name_prefix
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}  # type: Dict[concurrent.futures.Future, RelationDescription]
+            while remaining or futures:
+                ready = [relation for relation in remaining if not waiting_for[relation.identifier]]
+                if not ready and not futures:
+                    # This only happens with cyclic dependencies (when we keep going), so ignore the order.
+                    ready = remaining
+                for relation in ready:
+                    future = executor.submit(validate_single_transform_using_pool, pool, relation, keep_going,
+                                             cache)
+                    futures[future] = relation
+                remaining = [relation for relation in remaining if relation not in ready]
+
+                done, not_done = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    relation = futures.pop(future)
+                    try:
+                        valid = future.result()
+                    except Exception:
+                        # Do not start validating anything else when we're not keeping going.
+                        for pending in futures:
+                            pending.cancel()
+                        raise
+                    if not valid:
+                        invalid.append(relation.identifier)
+                    for dependencies in waiting_for.values():
+                        dependencies.discard(relation.identifier)
+    finally:
+        pool.closeall()
+
+    if invalid:
+        logger.warning("Failed to validate %d transform(s): %s", len(invalid), join_with_quotes(invalid))
 
 
 def get_list_difference(list1: List[str], list2: List[str]) -> List[str]:
@@ -257,13 +426,17 @@ def check_select_permission(conn: connection, table_name: TableName):
         raise UpstreamValidationError("failed to read from upstream table '%s'" % table_name.identifier) from exc
 
 
-def validate_upstream_columns(conn: connection, table: RelationDescription) -> None:
+def validate_upstream_columns(conn: connection, table: RelationDescription,
+                              catalog: Optional[CatalogSnapshot]=None) -> None:
     """
     Compare columns in upstream table to the table design file.
     """
     source_table_name = table.source_table_name
 
-    columns_info = etl.design.bootstrap.fetch_attributes(conn, source_table_name)
+    if catalog is None:
+        columns_info = etl.design.bootstrap.fetch_attributes(conn, source_table_name)
+    else:
+        columns_info = catalog.attributes(source_table_name)
     if not columns_info:
         raise UpstreamValidationError("table '%s' is gone or has no columns left" % source_table_name.identifier)
     logger.info("Found %d column(s) in relation '%s'", len(columns_info), source_table_name.identifier)
@@ -288,14 +461,18 @@ def validate_upstream_columns(conn: connection, table: RelationDescription) -> N
                                              (column["name"], table.identifier))
 
 
-def validate_upstream_constraints(conn: connection, table: RelationDescription) -> None:
+def validate_upstream_constraints(conn: connection, table: RelationDescription,
+                                  catalog: Optional[CatalogSnapshot]=None) -> None:
     """
     Compare table constraints between database and table design file.
 
     Note that "natural_key" or "surrogate_key" constraints are not valid in upstream (source) tables.
     Also, a "primary_key" in upstream may be used as a "unique" constraint in the design (but not vice versa).
     """
-    current_constraint = etl.design.bootstrap.fetch_constraints(conn, table.source_table_name)
+    if catalog is None:
+        current_constraint = etl.design.bootstrap.fetch_constraints(conn, table.source_table_name)
+    else:
+        current_constraint = catalog.constraints(table.source_table_name)
     design_constraint = table.table_design.get("constraints", [])
 
     current_primary_key = frozenset([col for c in current_constraint for col in c.get("primary_key", [])])
@@ -343,26 +520,85 @@ def validate_upstream_constraints(conn: connection, table: RelationDescription)
                            constraint_type, join_with_quotes(columns), table.table_design["source_name"])
 
 
-def validate_upstream_table(conn: connection, table: RelationDescription, keep_going: bool=False) -> None:
+def validate_upstream_table(conn: connection, table: RelationDescription, keep_going: bool=False,
+                            catalog: Optional[CatalogSnapshot]=None) -> bool:
     """
     Validate table design of an upstream table against its source database.
+
+    If a snapshot of the catalog is passed in, then columns and constraints are looked up there.
+    Return True if the table is valid, False if it's not (but we keep going).
     """
     try:
         with etl.db.log_error():
             check_select_permission(conn, table.source_table_name)
-            validate_upstream_columns(conn, table)
-            validate_upstream_constraints(conn, table)
+            validate_upstream_columns(conn, table, catalog)
+            validate_upstream_constraints(conn, table, catalog)
         logger.info("Successfully validated '%s' against its upstream source", table.identifier)
     except (ETLConfigError, ETLRuntimeError, psycopg2.Error):
         if keep_going:
             _error_occurred.set()
             logger.exception("Ignoring failure to validate '%s' and proceeding as requested:", table.identifier)
+            return False
         else:
             raise
+    return True
+
+
+def validate_upstream_table_using_pool(pool, table: RelationDescription, catalog: CatalogSnapshot,
+                                       keep_going: bool=False, cache: Optional[ValidationCache]=None) -> None:
+    conn = pool.getconn()
+    conn.set_session(autocommit=True, readonly=True)
+    try:
+        valid = validate_upstream_table(conn, table, keep_going=keep_going, catalog=catalog)
+    except Exception:
+        pool.putconn(conn, close=True)
+        raise
+    else:
+        pool.putconn(conn, close=False)
+    if valid and cache is not None:
+        cache.add("upstream", table)
+
+
+def validate_upstream_source(source: DataWarehouseSchema, tables: List[RelationDescription],
+                             keep_going: bool=False, max_connections: int=4,
+                             cache: Optional[ValidationCache]=None) -> None:
+    """
+    Validate the tables of one upstream source concurrently using a (small) pool of connections.
+
+    Columns and constraints of all tables are retrieved at once before validating the individual tables.
+    """
+    logger.info("Checking %d table(s) in upstream source '%s'", len(tables), source.name)
+    max_workers = min(max_connections, len(tables))
+    with Timer() as timer:
+        pool = etl.db.connection_pool(max_workers, source.dsn)
+        try:
+            conn = pool.getconn()
+            conn.set_session(autocommit=True, readonly=True)
+            try:
+                with etl.db.log_error():
+                    catalog = etl.design.bootstrap.fetch_catalog_snapshot(
+                        conn, [table.source_table_name for table in tables])
+            finally:
+                pool.putconn(conn)
+            # TODO With Python 3.6, we should pass in a thread_name_prefix
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(validate_upstream_table_using_pool, pool, table, catalog, keep_going,
+                                           cache)
+                           for table in tables]
+                done, not_done = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_EXCEPTION)
+                for future in not_done:
+                    future.cancel()
+            # Note that asking for the result will raise any exception (which only happens when not keeping going).
+            for future in futures:
+                if not future.cancelled():
+                    future.result()
+        finally:
+            pool.closeall()
+        logger.info("Finished checking %d table(s) in upstream source '%s' (%s)", len(tables), source.name, timer)
 
 
 def validate_upstream_sources(schemas: List[DataWarehouseSchema], relations: List[RelationDescription],
-                              keep_going: bool=False) -> None:
+                              keep_going: bool=False, cache: Optional[ValidationCache]=None) -> None:
     """
     Validate the designs (and the current configuration) in comparison to upstream databases.
 
@@ -372,6 +608,8 @@ def validate_upstream_sources(schemas: List[DataWarehouseSchema], relations: Lis
     (3) the upstream table does not exist
     (4) the upstream columns are not a superset of the columns in the table design
     (5) the upstream column does not have the null constraint set while the table design does
+
+    Sources are validated concurrently (and so are the tables within each source).
     """
     source_lookup = {schema.name: schema for schema in schemas if schema.is_database_source}
 
@@ -380,16 +618,22 @@ def validate_upstream_sources(schemas: List[DataWarehouseSchema], relations: Lis
     if not upstream_tables:
         logger.info("No upstream tables found or selected, skipping source validation")
         return
+    if cache is not None:
+        upstream_tables = cache.select_relations("upstream", upstream_tables)
+        if not upstream_tables:
+            return
     upstream_tables.sort(key=attrgetter("source_name"))
 
-    # TODO Parallelize around sources (like extract)
-    for source_name, table_group in groupby(upstream_tables, attrgetter("source_name")):
-        tables = list(table_group)
-        source = source_lookup[source_name]
-        logger.info("Checking %d table(s) in upstream source '%s'", len(tables), source_name)
-        with closing(etl.db.connection(source.dsn, autocommit=True, readonly=True)) as conn:
-            for table in tables:
-                validate_upstream_table(conn, table, keep_going=keep_going)
+    groups = [(source_lookup[source_name], list(table_group))
+              for source_name, table_group in groupby(upstream_tables, attrgetter("source_name"))]
+    # TODO With Python 3.6, we should pass in a thread_name_prefix
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(groups)) as executor:
+        futures = [executor.submit(validate_upstream_source, source, tables, keep_going, cache=cache)
+                   for source, tables in groups]
+        done, not_done = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_EXCEPTION)
+    # Note that asking for the result will raise any exception from validating a source.
+    for future in futures:
+        future.result()
 
 
 def validate_execution_order(relations: List[RelationDescription], keep_going=False):
@@ -409,11 +653,12 @@ def validate_execution_order(relations: List[RelationDescription], keep_going=Fa
 
 
 def validate_designs(config: DataWarehouseConfig, relations: List[RelationDescription], keep_going=False,
-                     skip_sources=False, skip_dependencies=False) -> None:
+                     skip_sources=False, skip_dependencies=False, full=False) -> None:
     """
     Make sure that all table design files pass the validation checks.
 
-    See module documentation for list of checks.
+    See module documentation for list of checks.  Unless a full validation is requested, checks against
+    upstream sources and the data warehouse are skipped for relations that passed them before without changes.
     """
     _error_occurred.clear()
 
@@ -422,19 +667,29 @@ def validate_designs(config: DataWarehouseConfig, relations: List[RelationDescri
 
     validate_reload(config.schemas, valid_descriptions, keep_going=keep_going)
 
-    if skip_sources:
-        logger.info("Skipping validation of designs against upstream sources")
-    else:
-        with Timer() as timer:
-            validate_upstream_sources(config.schemas, ordered_descriptions, keep_going=keep_going)
-            logger.info("Validated designs against upstream sources (%s)", timer)
+    hashes = compute_validation_hashes(ordered_descriptions, settings_hash())
+    cache = ValidationCache(etl.config.etl_tmp_dir("validation_cache.json"), hashes, ignore_cached=full)
+    if full:
+        logger.info("Ignoring validation cache and validating all selected relations")
 
-    if skip_dependencies:
-        logger.info("Skipping validation of transforms against data warehouse")
-    else:
-        with Timer() as timer:
-            validate_transforms(config.dsn_etl, ordered_descriptions, keep_going=keep_going)
-            logger.info("Validated transforms against data warehouse (%s)", timer)
+    try:
+        if skip_sources:
+            logger.info("Skipping validation of designs against upstream sources")
+        else:
+            with Timer() as timer:
+                validate_upstream_sources(config.schemas, ordered_descriptions, keep_going=keep_going, cache=cache)
+                logger.info("Validated designs against upstream sources (%s)", timer)
+
+        if skip_dependencies:
+            logger.info("Skipping validation of transforms against data warehouse")
+        else:
+            with Timer() as timer:
+                validate_transforms(config.dsn_etl, ordered_descriptions, keep_going=keep_going, cache=cache)
+                logger.info("Validated transforms against data warehouse (%s)", timer)
+    finally:
+        # Remember the relations that passed even if validation of another relation failed.
+        cache.log_summary()
+        cache.save()
 
     if _error_occurred.is_set():
         raise ETLDelayedExit("At least one error occurred while validating with 'keep going' option")
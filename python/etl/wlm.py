@@ -0,0 +1,258 @@
+"""
+Work with the workload management (WLM) of Redshift to size our share of the cluster.
+
+When other workloads share the cluster, loading with a fixed number of workers either leaves capacity unused
+or lets our queries wait in the WLM queues.  So the number of active workers may be adjusted while loading:
+if queries are queued, we back off by one worker, and if nothing is queued, we add one worker back
+(always staying between the configured minimum and maximum).
+
+Transformations also differ in how much memory they need.  Each transformation is run in its own query group
+so that the next run can look up whether its INSERT query spilled to disk (and how much memory its steps needed)
+and pick the number of WLM query slots for it.
+
+See http://docs.aws.amazon.com/redshift/latest/dg/r_STV_WLM_QUERY_STATE.html
+and http://docs.aws.amazon.com/redshift/latest/dg/r_SVL_QUERY_SUMMARY.html
+"""
+
+import logging
+import math
+import threading
+from contextlib import closing, contextmanager
+from typing import Dict, List, Optional
+
+import psycopg2
+
+import etl.db
+import etl.monitor
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# Number of seconds between samples of the WLM query state
+WLM_SAMPLE_INTERVAL = 30
+
+
+def adjust_concurrency(current: int, min_workers: int, max_workers: int, queued: int) -> int:
+    """
+    Return the new number of active workers given the number of queued queries.
+
+    >>> adjust_concurrency(4, 1, 8, queued=3)
+    3
+    >>> adjust_concurrency(1, 1, 8, queued=3)
+    1
+    >>> adjust_concurrency(4, 1, 8, queued=0)
+    5
+    >>> adjust_concurrency(8, 1, 8, queued=0)
+    8
+    """
+    if queued > 0:
+        return max(current - 1, min_workers)
+    return min(current + 1, max_workers)
+
+
+def fetch_wlm_query_state(conn) -> Dict[str, int]:
+    """
+    Return the number of queued and running queries in user-defined service classes.
+    """
+    rows = etl.db.query(conn, """
+        SELECT COALESCE(SUM(CASE WHEN state LIKE 'Queued%' THEN 1 ELSE 0 END), 0) AS queued
+             , COALESCE(SUM(CASE WHEN state = 'Running' THEN 1 ELSE 0 END), 0) AS running
+          FROM stv_wlm_query_state
+         WHERE service_class > 5""")
+    return {"queued": int(rows[0]["queued"]), "running": int(rows[0]["running"])}
+
+
+class AdaptiveConcurrency:
+    """
+    Limit the number of workers that may be active at the same time.
+
+    When the minimum is less than the maximum, the limit is adjusted (starting at the maximum) based
+    on samples of the WLM query state.  Workers need to wrap their work with the "slot" context.
+    """
+
+    def __init__(self, dsn: dict, min_workers: int, max_workers: int, sample_interval=WLM_SAMPLE_INTERVAL,
+                 dry_run=False) -> None:
+        self.dsn = dsn
+        self.min_workers = min(min_workers, max_workers)
+        self.max_workers = max_workers
+        self.sample_interval = sample_interval
+        self.dry_run = dry_run
+        self.limit = max_workers
+        self._active = 0
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._sampler = None  # type: Optional[threading.Thread]
+
+    @property
+    def is_adaptive(self) -> bool:
+        return self.min_workers < self.max_workers
+
+    def start(self) -> None:
+        if self.is_adaptive:
+            logger.info("Adapting number of active workers between %d and %d (sampling every %ds)",
+                        self.min_workers, self.max_workers, self.sample_interval)
+            self._sampler = threading.Thread(target=self._run, name="wlm-sampler", daemon=True)
+            self._sampler.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+
+    @contextmanager
+    def slot(self):
+        """
+        Wait until the number of active workers is below the limit, then do the work.
+        """
+        with self._condition:
+            while self._active >= self.limit:
+                self._condition.wait()
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._active -= 1
+                self._condition.notify_all()
+
+    def _set_limit(self, new_limit: int, state: Dict[str, int]) -> None:
+        logger.info("Changing number of active workers from %d to %d (WLM queries: %d queued, %d running)",
+                    self.limit, new_limit, state["queued"], state["running"])
+        extra = {"concurrency": dict(state, previous=self.limit, current=new_limit,
+                                     min=self.min_workers, max=self.max_workers)}
+        etl.monitor.Monitor.marker_payload("adjust_concurrency", extra).emit(dry_run=self.dry_run)
+        with self._condition:
+            self.limit = new_limit
+            self._condition.notify_all()
+
+    def _run(self) -> None:
+        """
+        Sample the WLM query state until stopped.  Problems with sampling stop the adaptation (but not the work).
+        """
+        try:
+            with closing(etl.db.connection(self.dsn, autocommit=True, readonly=True)) as conn:
+                while not self._stopped.wait(self.sample_interval):
+                    state = fetch_wlm_query_state(conn)
+                    new_limit = adjust_concurrency(self.limit, self.min_workers, self.max_workers, state["queued"])
+                    if new_limit != self.limit:
+                        self._set_limit(new_limit, state)
+        except psycopg2.Error:
+            logger.warning("Failed to sample WLM query state, keeping %d active worker(s):", self.limit,
+                           exc_info=True)
+
+
+def query_group_for(identifier: str) -> str:
+    """
+    Return the query group (which shows up as the label of queries) used while building a relation.
+
+    >>> query_group_for("www.orders")
+    'arthur:www.orders'
+    """
+    return "arthur:{}".format(identifier)
+
+
+def fetch_query_memory_history(conn, identifiers: List[str]) -> Dict[str, dict]:
+    """
+    Return information about the latest INSERT query (still in the system logs) for the given relations.
+
+    For every relation found, this has the number of slots used, whether any step was disk-based, the peak working
+    memory of any step, and the working memory per slot and number of slots of the service class.
+    """
+    labels = tuple(query_group_for(identifier) for identifier in identifiers)
+    if not labels:
+        return {}
+    rows = etl.db.query(conn, """
+        WITH latest_insert AS (
+            SELECT TRIM(label) AS label
+                 , MAX(query) AS query
+              FROM stl_query
+             WHERE TRIM(label) IN %s
+               AND LTRIM(querytxt) ILIKE 'INSERT%%'
+             GROUP BY 1
+        )
+        SELECT li.label
+             , wq.slot_count
+             , BOOL_OR(qs.is_diskbased = 't') AS is_diskbased
+             , MAX(qs.workmem) AS peak_workmem
+             , sc.query_working_mem
+             , sc.num_query_tasks
+          FROM latest_insert li
+          JOIN stl_wlm_query wq ON li.query = wq.query
+          JOIN svl_query_summary qs ON li.query = qs.query
+          JOIN stv_wlm_service_class_config sc ON wq.service_class = sc.service_class
+         GROUP BY li.label, wq.slot_count, sc.query_working_mem, sc.num_query_tasks""", (labels,))
+    history = {row["label"]: dict(row) for row in rows}
+    return {identifier: history[query_group_for(identifier)]
+            for identifier in identifiers if query_group_for(identifier) in history}
+
+
+def suggest_wlm_slots(history: Optional[dict], default_slots: int) -> int:
+    """
+    Return the number of WLM query slots for a query given what happened in a previous run.
+
+    Queries that spilled to disk get at least one slot more than last time, all others get just enough slots
+    to fit the working memory of their largest step.  Never exceed the number of slots in the queue.
+
+    >>> suggest_wlm_slots(None, 2)
+    2
+    >>> past = dict(slot_count=2, is_diskbased=True, peak_workmem=300 * 1024 ** 2,
+    ...             query_working_mem=100, num_query_tasks=5)
+    >>> suggest_wlm_slots(past, 1)
+    3
+    >>> suggest_wlm_slots(dict(past, slot_count=5), 1)
+    5
+    >>> suggest_wlm_slots(dict(past, is_diskbased=False, peak_workmem=150 * 1024 ** 2), 1)
+    2
+    >>> suggest_wlm_slots(dict(past, is_diskbased=False, peak_workmem=0), 1)
+    1
+    """
+    if history is None:
+        return default_slots
+    memory_per_slot = history["query_working_mem"] * 1024 ** 2
+    needed = max(1, math.ceil(history["peak_workmem"] / memory_per_slot)) if memory_per_slot else default_slots
+    if history["is_diskbased"]:
+        needed = max(needed, history["slot_count"] + 1)
+    else:
+        needed = min(needed, history["slot_count"])
+    return min(needed, history["num_query_tasks"])
+
+
+def plan_wlm_query_slots(dsn: dict, relations: List, default_slots: int) -> Dict[str, int]:
+    """
+    Return the number of WLM query slots to use for each CTAS relation.
+
+    A setting in the table design takes precedence over what is suggested based on previous runs.
+    If the system tables cannot be read, the default number of slots is used.
+    """
+    ctas_relations = [relation for relation in relations if relation.is_ctas_relation]
+    if not ctas_relations:
+        return {}
+    try:
+        with closing(etl.db.connection(dsn, autocommit=True, readonly=True)) as conn:
+            history = fetch_query_memory_history(conn, [relation.identifier for relation in ctas_relations])
+    except psycopg2.Error:
+        logger.warning("Failed to look up memory usage of previous runs, using default WLM query slots:",
+                       exc_info=True)
+        history = {}
+
+    plan = {}
+    for relation in ctas_relations:
+        if relation.wlm_query_slots is not None:
+            plan[relation.identifier] = relation.wlm_query_slots
+            logger.debug("Using %d WLM query slot(s) for '%s' from table design",
+                         relation.wlm_query_slots, relation.identifier)
+            continue
+        past = history.get(relation.identifier)
+        plan[relation.identifier] = suggest_wlm_slots(past, default_slots)
+        if past is not None:
+            logger.debug("Using %d WLM query slot(s) for '%s' (previously %d slot(s), disk-based: %s)",
+                         plan[relation.identifier], relation.identifier, past["slot_count"], past["is_diskbased"])
+    return plan
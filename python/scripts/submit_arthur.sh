@@ -46,9 +46,11 @@ shift
 
 set -x
 
-export PYSPARK_PYTHON PYSPARK_DRIVER_PYTHON
+export PYSPARK_PYTHON PYSPARK_DRIVER_PYTHON PYSPARK_PIN_THREAD
 PYSPARK_PYTHON="$PYTHON3"
 PYSPARK_DRIVER_PYTHON="$PYTHON3"
+# Scheduler pools are set per Python thread, which requires pinning Python threads to JVM threads.
+PYSPARK_PIN_THREAD="true"
 
 exec spark-submit \
     --jars "$JAR_LIST" \